@@ -1,9 +1,21 @@
 from django.contrib import admin
-from .models import Produit, Sandwich, Commande, Temperature, Addstock  # N'oublie pas d'ajouter ConditionsMeteo
+from .models import Produit, Sandwich, Commande, Temperature, TemperatureAgregat, Addstock, MouvementStock, Tache  # N'oublie pas d'ajouter ConditionsMeteo
+
+@admin.register(Produit)
+class ProduitAdmin(admin.ModelAdmin):
+    # 🔹 Instantané du stock : une correction se saisit comme un mouvement « correction »
+    readonly_fields = ("quantite_stock", "mouvements_jusqua")
 
 # Enregistre les modèles dans l'admin
-admin.site.register(Produit)
 admin.site.register(Sandwich)
 admin.site.register(Commande)
 admin.site.register(Temperature)  
+admin.site.register(TemperatureAgregat)
 admin.site.register(Addstock)  
+admin.site.register(MouvementStock)
+
+@admin.register(Tache)
+class TacheAdmin(admin.ModelAdmin):
+    # 🔹 Tâches durables encore présentes : en attente, en cours ou échouées
+    list_display = ("id", "nom", "etat", "tentatives", "prochain_essai", "erreur")
+    list_filter = ("etat",)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CommandesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'commandes'
+
+    def ready(self):
+        from . import versions
+        versions.verifier_configuration()
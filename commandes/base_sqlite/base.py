@@ -0,0 +1,108 @@
+import queue
+import threading
+from django.db.backends.sqlite3 import base, creation
+
+# Connexions libres par fichier de base, partagées par tous les threads du processus
+_reserves = {}
+_reserves_verrou = threading.Lock()
+
+# Verrou d'écriture par fichier de base : un seul thread du processus en transaction à la fois
+_ecrivains = {}
+
+def _ecrivain(nom):
+    with _reserves_verrou:
+        return _ecrivains.setdefault(nom, threading.Lock())
+
+def _reserve(nom, taille):
+    with _reserves_verrou:
+        if nom not in _reserves:
+            _reserves[nom] = queue.LifoQueue(taille)  # LIFO : la connexion la plus récente a le cache le plus chaud
+        return _reserves[nom]
+
+def vider():
+    """ Ferme les connexions en réserve (fin des tests, base supprimée) """
+    with _reserves_verrou:
+        reserves = list(_reserves.values())
+        _reserves.clear()
+    for reserve in reserves:
+        while True:
+            try:
+                reserve.get_nowait().close()
+            except queue.Empty:
+                break
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        vider()  # Connexions en réserve vers la base supprimée
+        super()._destroy_test_db(test_database_name, verbosity)
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ 🔹 SQLite avec une réserve de connexions partagée entre threads
+
+    Sous ASGI, chaque requête s'exécute dans un nouveau thread : CONN_MAX_AGE ne
+    réutilise jamais la connexion. Ici, la fermeture rend la connexion à la réserve
+    et la requête suivante la reprend, pragmas déjà appliqués et cache SQLite chaud.
+    Taille de la réserve : OPTIONS["reserve"] (8 par défaut). Pas de réserve pour
+    une base en mémoire.
+    """
+    creation_class = DatabaseCreation
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.taille_reserve = params.pop("reserve", 8)
+        self.attente_ecriture = params.get("timeout", 5)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        """ 🔹 Les threads du processus se passent le verrou d'écriture sans attendre le busy timeout
+
+        Un BEGIN IMMEDIATE refusé est réessayé par SQLite après 1, 2, 5, 10, 15... ms :
+        une requête arrivée pendant une tâche de fond attendait bien plus que la
+        tâche elle-même. Entre threads du même processus, l'attente se fait ici et
+        reprend dès le commit ; entre processus, le busy timeout s'applique comme avant.
+        """
+        if not self.is_in_memory_db() and getattr(self, "_verrou_ecriture", None) is None:
+            verrou = _ecrivain(self.settings_dict["NAME"])
+            if verrou.acquire(timeout=getattr(self, "attente_ecriture", 5)):  # Sinon : busy timeout de SQLite
+                self._verrou_ecriture = verrou
+        try:
+            super()._start_transaction_under_autocommit()
+        except Exception:
+            self._liberer_ecriture()
+            raise
+
+    def _liberer_ecriture(self):
+        verrou, self._verrou_ecriture = getattr(self, "_verrou_ecriture", None), None
+        if verrou is not None:
+            verrou.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._liberer_ecriture()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._liberer_ecriture()
+
+    def get_new_connection(self, conn_params):
+        if not self.is_in_memory_db():
+            try:
+                return _reserve(conn_params["database"], self.taille_reserve).get_nowait()
+            except queue.Empty:
+                pass
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        self._liberer_ecriture()
+        if self.connection is None or self.is_in_memory_db():
+            return super()._close()
+        if self.in_atomic_block or self.connection.in_transaction:
+            return super()._close()  # État de la transaction incertain : pas de réutilisation
+        try:
+            _reserve(self.settings_dict["NAME"], self.taille_reserve).put_nowait(self.connection)
+        except queue.Full:
+            super()._close()
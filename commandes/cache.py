@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.http import HttpResponse
+from . import versions
+
+# Stockages partagés par nom : Django crée une instance du backend par thread
+_stockages = {}
+_stockages_verrou = threading.Lock()
+
+class LRUCache(BaseCache):
+    """ 🔹 Cache LRU en mémoire du processus, sans pickle
+
+    Contrairement à LocMemCache, les valeurs ne sont pas copiées : une lecture
+    coûte quelques microsecondes, mais les valeurs doivent être immuables
+    (bytes, tuples). Au-delà de MAX_ENTRIES, l'entrée la moins récemment lue
+    est évincée. Compteurs : `compteurs` (hits, misses, evictions).
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        with _stockages_verrou:
+            if name not in _stockages:
+                _stockages[name] = (OrderedDict(), threading.Lock(), {"hits": 0, "misses": 0, "evictions": 0})
+        self._donnees, self._verrou, self.compteurs = _stockages[name]
+
+    def make_and_validate_key(self, key, version=None):
+        return self.make_key(key, version=version)  # Pas d'avertissements memcached : clés internes
+
+    def _lire(self, cle):
+        """ (valeur, True) si la clé est présente et valide ; à appeler sous le verrou """
+        entree = self._donnees.get(cle)
+        if entree is None:
+            return None, False
+        valeur, expiration = entree
+        if expiration is not None and expiration <= time.time():
+            del self._donnees[cle]
+            return None, False
+        self._donnees.move_to_end(cle)
+        return valeur, True
+
+    def _ecrire(self, cle, valeur, timeout):
+        self._donnees[cle] = (valeur, self.get_backend_timeout(timeout))
+        self._donnees.move_to_end(cle)
+        while len(self._donnees) > self._max_entries:
+            self._donnees.popitem(last=False)
+            self.compteurs["evictions"] += 1
+
+    def get(self, key, default=None, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            valeur, trouvee = self._lire(cle)
+            self.compteurs["hits" if trouvee else "misses"] += 1
+        return valeur if trouvee else default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            self._ecrire(cle, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            if self._lire(cle)[1]:
+                return False
+            self._ecrire(cle, value, timeout)
+            return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            valeur, trouvee = self._lire(cle)
+            if trouvee:
+                self._ecrire(cle, valeur, timeout)
+            return trouvee
+
+    def has_key(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            return self._lire(cle)[1]
+
+    def delete(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        with self._verrou:
+            return self._donnees.pop(cle, None) is not None
+
+    def clear(self):
+        with self._verrou:
+            self._donnees.clear()
+
+    def __len__(self):
+        return len(self._donnees)
+
+# Compteurs de la couche de cache des réponses (quel que soit le backend)
+compteurs = {"hits": 0, "misses": 0, "stockees": 0}
+_compteurs_verrou = threading.Lock()
+
+def _cache():
+    return caches[getattr(settings, "REPONSES_CACHE", "reponses")]
+
+def _compter(nom):
+    with _compteurs_verrou:
+        compteurs[nom] += 1
+
+def servir(request, ressource, vue, *args, **kwargs):
+    """ 🔹 Réponse rendue lue dans le cache, ou produite par `vue` puis stockée
+
+    La clé contient l'ETag (versions des ressources, chemin, format) : une
+    modification change la version, les anciennes entrées ne sont plus jamais
+    lues et finissent évincées. Aucune suppression explicite n'est nécessaire.
+    """
+    if request.method != "GET":
+        return vue(request, *args, **kwargs)
+
+    cle = f"reponse:{versions.etag(request, ressource)}"
+    cache = _cache()
+    entree = cache.get(cle)
+    if entree is not None:
+        _compter("hits")
+        contenu, entetes = entree
+        reponse = HttpResponse(contenu)
+        for nom, valeur in entetes:
+            reponse[nom] = valeur
+        return reponse
+
+    _compter("misses")
+    reponse = vue(request, *args, **kwargs)
+    if reponse.status_code == 200 and not reponse.streaming:
+        if hasattr(reponse, "render"):
+            reponse.render()  # Response DRF : rendu différé, forcé ici pour stocker les octets
+        entetes = tuple((nom, valeur) for nom, valeur in reponse.items() if nom.lower() in ("content-type", "vary", "allow"))
+        cache.set(cle, (reponse.content, entetes))
+        _compter("stockees")
+    return reponse
+
+def cache_reponse(ressource):
+    """ Décorateur de vue : réponses GET servies depuis le cache des réponses """
+    def decorateur(vue):
+        @wraps(vue)
+        def vue_en_cache(request, *args, **kwargs):
+            return servir(request, ressource, vue, *args, **kwargs)
+        return vue_en_cache
+    return decorateur
+
+def statistiques():
+    """ Compteurs pour dimensionner le cache (GET /api/cache/) """
+    cache = _cache()
+    with _compteurs_verrou:
+        resultat = dict(compteurs)
+    lectures = resultat["hits"] + resultat["misses"]
+    resultat["taux_hits"] = round(resultat["hits"] / lectures, 3) if lectures else None
+    resultat["backend"] = f"{type(cache).__module__}.{type(cache).__name__}"
+    if isinstance(cache, LRUCache):
+        resultat["entrees"] = len(cache)
+        resultat["max_entrees"] = cache._max_entries
+        resultat["evictions"] = cache.compteurs["evictions"]
+    return resultat
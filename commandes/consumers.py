@@ -1,62 +1,445 @@
+import bisect
 import os
 import django
 import json
+import logging
+from collections import deque
+from urllib.parse import parse_qs
+from datetime import datetime, timezone as dt_timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
 
 # 🔹 Initialisation correcte de Django avant d'importer les modèles
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fablab_api.settings")
 django.setup()
 
-from .models import Produit
+from . import versions
+from .diffusion import enregistrer_boucle
+from .disponibilite import index_disponibilite
+from .journal import evenement
+from .metriques import registre
+from .models import Commande, Produit, Temperature
+
+logger = logging.getLogger(__name__)
+
+def encoder(message):
+    """ JSON compact : moins d'octets envoyés à chaque écran """
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class JournalStock:
+    """ Derniers deltas de stock reçus par ce processus, pour le rattrapage des clients
+
+    Chaque delta n'est encodé qu'une seule fois, quel que soit le nombre de clients.
+    Les seq viennent d'une séquence partagée par tous les processus (versions.suivant) :
+    un delta publié ailleurs peut arriver après un seq plus grand, il est rangé à sa place.
+    """
+
+    def __init__(self, taille=500):
+        self.taille = taille
+        self.deltas = []  # (seq, texte JSON), par seq croissant
+        self.seq = 0  # plus grand seq reçu
+
+    def enregistrer(self, event):
+        """ 🔹 Enregistre le delta (une seule fois par seq) et retourne son texte JSON """
+        seq = event["seq"]
+        position = bisect.bisect_left(self.deltas, seq, key=lambda delta: delta[0])
+        if position < len(self.deltas) and self.deltas[position][0] == seq:
+            return self.deltas[position][1]
+
+        texte = encoder({
+            "type": "delta",
+            "seq": seq,
+            "stock_total": event["stock_total"],
+            "produits": event["produits"],
+            "sandwiches": event.get("sandwiches", []),
+        })
+        self.deltas.insert(position, (seq, texte))
+        del self.deltas[:-self.taille]
+        self.seq = max(self.seq, seq)
+        return texte
+
+    def depuis(self, seq):
+        """ Deltas postérieurs à `seq`, ou None s'ils ne sont plus tous dans le journal """
+        if seq == self.seq:
+            return []
+        if seq > self.seq or not self.deltas or self.deltas[0][0] > seq + 1:
+            return None
+        return [texte for seq_connu, texte in self.deltas if seq_connu > seq]
+
+journal_stock = JournalStock()
 
 class StockConsumer(AsyncWebsocketConsumer):
+    """ Protocole du stock sur ws/stock/ :
+
+    - à la connexion : {"type": "snapshot", "seq", "stock_total", "produits": [{id, nom, quantite}],
+      "sandwiches": [{id, nom, portions}]}
+    - ensuite : {"type": "delta", "seq", "stock_total", "produits": [produits modifiés seulement],
+      "sandwiches": [{id, portions} des sandwiches qui les utilisent]}
+    - le client envoie {"action": "resync", "depuis": seq} s'il détecte un trou dans les seq
+    - message invalide : {"type": "erreur", "message"}, la connexion reste ouverte
+    """
+
     async def connect(self):
         """ Connexion WebSocket acceptée et ajout au groupe stock_updates """
+        registre.jauge("fablab_ws_connexions", 1, consumer="stock")
+        enregistrer_boucle()
         await self.channel_layer.group_add("stock_updates", self.channel_name)
         await self.accept()
-        print("✅ WebSocket connecté et ajouté au groupe stock_updates")
-        
-        # 🔹 Envoi du stock total dès la connexion du client WebSocket
-        await self.send_stock_update()
+        evenement(logger, "ws.connexion", logging.DEBUG, groupe="stock_updates", canal=self.channel_name)
+
+        # 🔹 Envoi de l'état complet dès la connexion du client WebSocket
+        await self.send_snapshot()
 
     async def disconnect(self, close_code):
         """ Déconnexion WebSocket et suppression du groupe """
+        registre.jauge("fablab_ws_connexions", -1, consumer="stock")
         await self.channel_layer.group_discard("stock_updates", self.channel_name)
-        print("❌ WebSocket déconnecté")
+        evenement(logger, "ws.deconnexion", logging.DEBUG, groupe="stock_updates", code=close_code)
 
     async def receive(self, text_data):
-        """ Réception d'un message via WebSocket (utilisable si on veut envoyer des commandes au serveur) """
-        data = json.loads(text_data)
-        message = data.get("message", "")
+        """ Réception d'un message via WebSocket (demande de rattrapage) """
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("Objet JSON attendu")
+            if data.get("action") == "resync":
+                depuis = data.get("depuis")
+                if isinstance(depuis, bool) or not isinstance(depuis, int) or depuis < 0:
+                    raise ValueError("« depuis » doit être un numéro de séquence (entier positif)")
+        except ValueError as e:  # json.JSONDecodeError en hérite
+            await self.send(text_data=encoder({"type": "erreur", "message": str(e)}))
+            return
+
+        if data.get("action") == "resync":
+            await self.resync(depuis)
+            return
 
         # 🔹 Répondre au client WebSocket
         await self.send(text_data=json.dumps({
-            "message": f"Message reçu : {message}"
+            "message": f"Message reçu : {data.get('message', '')}"
         }))
 
-    async def send_stock_update(self):
-        """ 🔹 Envoie du stock total actuel aux clients WebSocket """
-        stock_total = await sync_to_async(Produit.get_stock_total)()
-        print(f"📡 Envoi du stock total via WebSocket : {stock_total} unités")
-        await self.send(text_data=json.dumps({"stock_total": stock_total}))
+    async def resync(self, depuis):
+        """ 🔹 Renvoie les deltas manqués, ou un snapshot s'ils ne sont plus disponibles """
+        deltas = journal_stock.depuis(depuis)
+        if deltas is None:
+            await self.send_snapshot()
+            return
+        for texte in deltas:
+            await self.send(text_data=texte)
+
+    async def send_snapshot(self):
+        """ 🔹 Envoie l'état complet du stock avec le numéro de séquence courant (partagé entre processus) """
+        seq = await database_sync_to_async(versions.courant)("stock")
+        produits = await database_sync_to_async(self.lire_produits)()
+        sandwiches = await database_sync_to_async(index_disponibilite.tout)()
+        await self.send(text_data=encoder({
+            "type": "snapshot",
+            "seq": seq,
+            "stock_total": sum(p["quantite"] for p in produits),
+            "produits": produits,
+            "sandwiches": sandwiches,
+        }))
+
+    @staticmethod
+    def lire_produits():
+        return [
+            {"id": p["id"], "nom": p["nom"], "quantite": p["stock"]}
+            for p in Produit.objects.avec_stock().values("id", "nom", "stock")
+        ]
 
     async def stock_update(self, event):
-        """ 🔹 Réception d'une mise à jour et envoi aux clients WebSocket """
-        stock_total = event["stock_total"]
-        print(f"📡 Mise à jour WebSocket reçue : {stock_total} unités")
-        await self.send(text_data=json.dumps({"stock_total": stock_total}))
+        """ 🔹 Réception d'un delta publié par le DiffuseurStock et envoi au client """
+        await self.send(text_data=journal_stock.enregistrer(event))
+
+
+class JournalCommandes:
+    """ Derniers lots de changements de commandes : chaque lot n'est encodé qu'une fois pour les clients sans filtre """
+
+    def __init__(self, lots_connus=100):
+        self.lots = deque(maxlen=lots_connus)  # (id du lot, texte JSON)
+
+    def encoder(self, event):
+        for lot, texte in reversed(self.lots):
+            if lot == event["lot"]:
+                return texte
+        texte = encoder({"type": "delta", "commandes": event["commandes"]})
+        self.lots.append((event["lot"], texte))
+        return texte
+
+journal_commandes = JournalCommandes()
+
+# Nombre de commandes terminées envoyées à la connexion (écran de retrait)
+TERMINEES_RECENTES = 50
+
+class CommandesConsumer(AsyncWebsocketConsumer):
+    """ File des commandes sur ws/commandes/ pour les écrans de la cuisine et du retrait :
+
+    - à la connexion : {"type": "snapshot", "commandes": [{id, status, sandwich, quantite}]}
+      (commandes en cours, plus les dernières terminées si "terminée" est suivi)
+    - ensuite : {"type": "delta", "commandes": [...]} ; status null = commande supprimée
+    - filtre : ws/commandes/?statuts=validée,en cuisson ou {"action": "abonner", "statuts": [...]}
+      (renvoie un snapshot). Une commande qui sort du filtre est envoyée une dernière fois.
+    - message invalide : {"type": "erreur", "message"}, la connexion reste ouverte
+    """
+
+    async def connect(self):
+        registre.jauge("fablab_ws_connexions", 1, consumer="commandes")
+        enregistrer_boucle()
+        await self.channel_layer.group_add("commandes_updates", self.channel_name)
+        await self.accept()
+
+        self.statuts = None  # None = tous les statuts
+        self.visibles = set()  # ids des commandes affichées par le client (avec filtre)
+        parametre = parse_qs(self.scope.get("query_string", b"").decode()).get("statuts")
+        try:
+            if parametre:
+                self.statuts = self.lire_filtre(parametre[0].split(","))
+        except ValueError as e:
+            await self.send(text_data=encoder({"type": "erreur", "message": str(e)}))
+        await self.send_snapshot()
+
+    async def disconnect(self, close_code):
+        registre.jauge("fablab_ws_connexions", -1, consumer="commandes")
+        await self.channel_layer.group_discard("commandes_updates", self.channel_name)
 
     @staticmethod
-    def broadcast_stock_update():
-        """ 🔹 Envoi d'une mise à jour du stock via WebSocket à tous les clients connectés """
-        channel_layer = get_channel_layer()
-        stock_total = Produit.get_stock_total()
-        async_to_sync(channel_layer.group_send)(
-            "stock_updates",
-            {
-                "type": "stock_update",
-                "stock_total": stock_total
-            }
-        )
+    def lire_filtre(statuts):
+        if not isinstance(statuts, list) or not all(isinstance(statut, str) for statut in statuts):
+            raise ValueError("Liste de statuts (textes) attendue")
+        inconnus = [statut for statut in statuts if statut not in dict(Commande.STATUS_CHOICES)]
+        if inconnus:
+            raise ValueError(f"Statuts inconnus : {', '.join(map(str, inconnus))}")
+        return set(statuts) or None
+
+    async def receive(self, text_data):
+        """ 🔹 Changement du filtre de statuts """
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("Objet JSON attendu")
+            if data.get("action") != "abonner":
+                raise ValueError("Action inconnue")
+            self.statuts = self.lire_filtre(data.get("statuts", []))
+        except ValueError as e:
+            await self.send(text_data=encoder({"type": "erreur", "message": str(e)}))
+            return
+        await self.send_snapshot()
+
+    async def send_snapshot(self):
+        commandes = await database_sync_to_async(self.lire_commandes)(self.statuts)
+        self.visibles = {commande["id"] for commande in commandes}
+        await self.send(text_data=encoder({"type": "snapshot", "commandes": commandes}))
+
+    @staticmethod
+    def lire_commandes(statuts):
+        """ Commandes en cours (filtrées), une requête avec JOIN sur le sandwich """
+        en_cours = [statut for statut, _ in Commande.STATUS_CHOICES if statut != "terminée"]
+        if statuts is not None:
+            en_cours = [statut for statut in en_cours if statut in statuts]
+        champs = ("id", "status", "sandwich__nom", "quantite")
+        lignes = list(Commande.objects.filter(status__in=en_cours).order_by("id").values_list(*champs)) if en_cours else []
+        if statuts is None or "terminée" in statuts:
+            terminees = Commande.objects.filter(status="terminée").order_by("-id").values_list(*champs)
+            lignes += reversed(terminees[:TERMINEES_RECENTES])
+        return [
+            {"id": commande_id, "status": status, "sandwich": sandwich, "quantite": quantite}
+            for commande_id, status, sandwich, quantite in lignes
+        ]
+
+    async def commandes_update(self, event):
+        """ 🔹 Changements publiés après commit : envoyés tels quels, ou filtrés pour ce client """
+        if self.statuts is None:
+            await self.send(text_data=journal_commandes.encoder(event))
+            return
+
+        commandes = []
+        for commande in event["commandes"]:
+            if commande["status"] in self.statuts:
+                self.visibles.add(commande["id"])
+                commandes.append(commande)
+            elif commande["id"] in self.visibles:
+                self.visibles.discard(commande["id"])  # Sort du filtre : dernier envoi pour la retirer
+                commandes.append(commande)
+        if commandes:
+            await self.send(text_data=encoder({"type": "delta", "commandes": commandes}))
+
+
+class FenetreTemperature:
+    """ Mesures récentes reçues par ce processus, partagées par tous les clients de ws/temperature/
+
+    Chaque lot n'est ajouté qu'une fois et chaque moyenne glissante n'est calculée
+    qu'une fois par lot et par taille de fenêtre, quel que soit le nombre de clients.
+    """
+
+    def __init__(self, duree_max=3600, lots_connus=100):
+        self.duree_max = duree_max  # en secondes : plus grande fenêtre glissante acceptée
+        self.points = deque()  # (t, temperature, humidite), triés par t
+        self.lots = deque(maxlen=lots_connus)  # (id du lot, texte JSON)
+        self._moyennes = {}  # fenêtre -> texte JSON, vidé à chaque nouveau lot
+
+    def en_retard(self, t):
+        """ La mesure `t` (la plus récente en base) manque : publiée quand aucun client n'était abonné """
+        return not self.points or self.points[-1][0] < t
+
+    def recharger(self, points):
+        """ 🔹 Fusionne les mesures lues en base avec celles déjà reçues, sans doublon """
+        self.points = deque(sorted(set(self.points).union(points)))
+        self._elaguer()
+        self._moyennes.clear()
+
+    def _elaguer(self):
+        while self.points and self.points[0][0] < self.points[-1][0] - self.duree_max:
+            self.points.popleft()
+
+    def ajouter(self, event):
+        """ 🔹 Ajoute un lot de mesures (une seule fois par lot) et retourne son texte JSON """
+        for lot, texte in reversed(self.lots):
+            if lot == event["lot"]:
+                return texte
+
+        nouveaux = sorted((p["t"], p["temperature"], p["humidite"]) for p in event["points"])
+        if self.points and nouveaux and nouveaux[0][0] < self.points[-1][0]:
+            self.points = deque(sorted([*self.points, *nouveaux]))  # Mesures bufferisées arrivées en retard
+        else:
+            self.points.extend(nouveaux)
+        self._elaguer()
+
+        texte = encoder({"type": "points", "points": event["points"]})
+        self.lots.append((event["lot"], texte))
+        self._moyennes.clear()
+        return texte
+
+    def moyenne(self, fenetre):
+        """ Moyenne glissante sur les `fenetre` dernières secondes, en texte JSON """
+        if fenetre not in self._moyennes:
+            fin = self.points[-1][0] if self.points else 0
+            dans_fenetre = [p for p in self.points if p[0] >= fin - fenetre]
+            nombre = len(dans_fenetre)
+            self._moyennes[fenetre] = encoder({
+                "type": "moyenne",
+                "fenetre": fenetre,
+                "nombre": nombre,
+                "temperature": sum(p[1] for p in dans_fenetre) / nombre if nombre else None,
+                "humidite": sum(p[2] for p in dans_fenetre) / nombre if nombre else None,
+            })
+        return self._moyennes[fenetre]
+
+    def derniere(self):
+        return self.points[-1] if self.points else None
+
+fenetre_temperature = FenetreTemperature()
+
+class TemperatureConsumer(AsyncWebsocketConsumer):
+    """ Mesures de température en direct sur ws/temperature/ :
+
+    - à la connexion : {"type": "historique", "points": [50 dernières mesures]}
+    - à chaque nouvelle mesure : {"type": "points", "points": [{date_heure, t, temperature, humidite}]}
+    - {"action": "abonner", "mode": "moyenne", "fenetre": 300} : {"type": "moyenne", ...} à chaque mesure
+    - {"action": "abonner", "mode": "seuil", "min": 5, "max": 30} : {"type": "alarme", "active": ...} à chaque changement d'état
+    - {"action": "desabonner", "mode": "brut" | "moyenne" | "seuil"}
+    - message invalide : {"type": "erreur", "message"}, la connexion reste ouverte
+    """
+
+    async def connect(self):
+        registre.jauge("fablab_ws_connexions", 1, consumer="temperature")
+        enregistrer_boucle()
+        await self.channel_layer.group_add("temperature_updates", self.channel_name)
+        await self.accept()
+
+        self.brut = True
+        self.fenetres = set()
+        self.seuil = None  # (min, max)
+        self.alarme = None
+
+        historique, recents = await database_sync_to_async(self.lire_historique)()
+        if recents:
+            fenetre_temperature.recharger(recents)
+        await self.send(text_data=encoder({"type": "historique", "points": historique}))
+
+    @staticmethod
+    def lire_historique():
+        """ 50 dernières mesures pour le client, et la dernière heure si la fenêtre glissante est en retard sur la base
+
+        Seuls les consumers alimentent la fenêtre : après une période sans client,
+        ses moyennes seraient calculées sur des mesures périmées.
+        """
+        historique = [
+            {"date_heure": p["date_heure"].isoformat(), "t": p["date_heure"].timestamp(),
+             "temperature": p["temperature"], "humidite": p["humidite"]}
+            for p in Temperature.objects.order_by("-date_heure").values("date_heure", "temperature", "humidite")[:50]
+        ]
+        recents = []
+        if historique and fenetre_temperature.en_retard(historique[0]["t"]):
+            depuis = historique[0]["t"] - fenetre_temperature.duree_max
+            recents = [
+                (date_heure.timestamp(), temperature, humidite)
+                for date_heure, temperature, humidite in Temperature.objects.filter(
+                    date_heure__gte=datetime.fromtimestamp(depuis, tz=dt_timezone.utc)
+                ).values_list("date_heure", "temperature", "humidite")
+            ]
+        return historique[::-1], recents
+
+    async def disconnect(self, close_code):
+        registre.jauge("fablab_ws_connexions", -1, consumer="temperature")
+        await self.channel_layer.group_discard("temperature_updates", self.channel_name)
+
+    async def receive(self, text_data):
+        """ 🔹 Gestion des abonnements du client """
+        try:
+            data = json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("Objet JSON attendu")
+            action, mode = data.get("action"), data.get("mode")
+            if action == "abonner" and mode == "brut":
+                self.brut = True
+            elif action == "abonner" and mode == "moyenne":
+                fenetre = int(data.get("fenetre", 300))
+                if not 0 < fenetre <= fenetre_temperature.duree_max:
+                    raise ValueError(f"La fenêtre doit être entre 1 et {fenetre_temperature.duree_max} secondes")
+                self.fenetres.add(fenetre)
+                await self.send(text_data=fenetre_temperature.moyenne(fenetre))
+            elif action == "abonner" and mode == "seuil":
+                self.seuil = (float(data.get("min", float("-inf"))), float(data.get("max", float("inf"))))
+                self.alarme = None
+                await self.verifier_seuil()
+            elif action == "desabonner" and mode == "brut":
+                self.brut = False
+            elif action == "desabonner" and mode == "moyenne":
+                if "fenetre" in data:
+                    self.fenetres.discard(int(data["fenetre"]))
+                else:
+                    self.fenetres.clear()
+            elif action == "desabonner" and mode == "seuil":
+                self.seuil = self.alarme = None
+            else:
+                raise ValueError("Action ou mode inconnu")
+        except (ValueError, TypeError) as e:
+            await self.send(text_data=encoder({"type": "erreur", "message": str(e)}))
+
+    async def temperature_update(self, event):
+        """ 🔹 Nouvelles mesures : points bruts et/ou résultats des abonnements du client """
+        texte = fenetre_temperature.ajouter(event)
+        if self.brut:
+            await self.send(text_data=texte)
+        for fenetre in sorted(self.fenetres):
+            await self.send(text_data=fenetre_temperature.moyenne(fenetre))
+        if self.seuil is not None:
+            await self.verifier_seuil()
+
+    async def verifier_seuil(self):
+        """ Envoie une alarme quand la dernière mesure sort de [min, max] ou y revient """
+        derniere = fenetre_temperature.derniere()
+        if derniere is None:
+            return
+        minimum, maximum = self.seuil
+        active = not minimum <= derniere[1] <= maximum
+        if active != self.alarme:
+            self.alarme = active
+            await self.send(text_data=encoder({
+                "type": "alarme",
+                "active": active,
+                "temperature": derniere[1],
+                "min": minimum if minimum != float("-inf") else None,
+                "max": maximum if maximum != float("inf") else None,
+            }))
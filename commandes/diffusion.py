@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from . import versions
+from .journal import Chrono, evenement
+from .metriques import BORNES_CLIENTS, registre
+from .taches import executeur
+
+logger = logging.getLogger(__name__)
+
+_boucle = None
+DELAI_ENVOI = 10  # secondes d'attente maximale d'un group_send confié à la boucle du serveur
+
+def enregistrer_boucle():
+    """ 🔹 Note la boucle asyncio du serveur ASGI (appelé par les consumers à la connexion)
+
+    InMemoryChannelLayer garde ses files sur cette boucle : un group_send lancé
+    depuis une autre boucle (thread de minuteur + async_to_sync) n'atteint pas les clients.
+    """
+    global _boucle
+    _boucle = asyncio.get_running_loop()
+
+def boucle_serveur():
+    """ Boucle des consumers de ce processus si elle tourne encore, sinon None (WSGI, commandes) """
+    boucle = _boucle
+    return boucle if boucle is not None and boucle.is_running() else None
+
+def envoyer_groupe(groupe, message, nom_evenement, **champs):
+    """ 🔹 group_send chronométré, journalisé avec le nombre de clients du groupe (si le channel layer le connaît)
+
+    Depuis un fil de l'exécuteur ou un minuteur, le group_send est exécuté dans
+    la boucle du serveur : c'est là que le channel layer en mémoire livre aux consumers.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    boucle = boucle_serveur()
+    with Chrono() as chrono:
+        if boucle is not None and asyncio._get_running_loop() is not boucle:
+            futur = asyncio.run_coroutine_threadsafe(channel_layer.group_send(groupe, message), boucle)
+            futur.result(timeout=DELAI_ENVOI)
+        else:
+            async_to_sync(channel_layer.group_send)(groupe, message)
+    groupes = getattr(channel_layer, "groups", None)  # InMemoryChannelLayer seulement
+    clients = len(groupes.get(groupe, ())) if isinstance(groupes, dict) else None
+    registre.observer("fablab_diffusion_secondes", chrono.ms / 1000, groupe=groupe)
+    if clients is not None:
+        registre.observer("fablab_diffusion_clients", clients, bornes=BORNES_CLIENTS, groupe=groupe)
+    evenement(logger, nom_evenement, logging.DEBUG, clients=clients, duree_ms=chrono.ms, **champs)
+
+class MinuteurBoucle:
+    """ Équivalent de threading.Timer exécuté dans une boucle asyncio : `fonction` (async) est attendue après `delai` secondes """
+
+    def __init__(self, boucle, delai, fonction):
+        self.boucle = boucle
+        self.futur = asyncio.run_coroutine_threadsafe(self._attendre(delai, fonction), boucle)
+
+    @staticmethod
+    async def _attendre(delai, fonction):
+        await asyncio.sleep(delai)
+        await fonction()
+
+    def cancel(self):
+        self.futur.cancel()
+
+    def is_alive(self):
+        return not self.futur.done() and not self.boucle.is_closed()
+
+class DiffuseurStock:
+    """ Regroupe les changements de stock et publie un seul diff WebSocket
+
+    Les modifications sont signalées avec `signaler()` et ne sont prises en compte
+    qu'après le commit de la transaction. Toutes celles reçues pendant une requête
+    (`regrouper()`) ou pendant la fenêtre `STOCK_DIFFUSION_FENETRE` (en secondes)
+    partent dans un seul message. Avec une fenêtre à 0, la publication part
+    immédiatement, dans une tâche de l'exécuteur (hors du thread de la requête).
+
+    Sous ASGI, le minuteur de la fenêtre tourne dans la boucle du serveur (celle
+    des consumers) ; sans consumer dans le processus, dans un thread.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._local = threading.local()
+        self._en_attente = set()  # ids des produits modifiés pas encore publiés
+        self._signalements_en_attente = 0
+        self._minuteur = None
+        self.seq = 0  # numéro de séquence du dernier diff publié par ce processus (versions.suivant)
+        self.compteurs = {
+            "signalements": 0,  # sauvegardes / mises à jour signalées
+            "diffusions": 0,  # messages réellement envoyés
+            "fusionnes_dernier": 0,  # signalements fusionnés dans le dernier message
+            "fusionnes_max": 0,
+        }
+
+    @property
+    def fenetre(self):
+        return getattr(settings, "STOCK_DIFFUSION_FENETRE", 0.1)
+
+    def signaler(self, *produit_ids):
+        """ 🔹 Note des produits modifiés ; rien n'est publié si la transaction est annulée """
+        transaction.on_commit(lambda: self._recevoir(produit_ids))
+        versions.incrementer("produits")  # ETag de /api/produits/ et /api/stock/
+
+    @contextmanager
+    def regrouper(self):
+        """ 🔹 Fusionne tous les changements du bloc (ex. une requête HTTP) en une seule publication """
+        if getattr(self._local, "lot", None) is not None:
+            yield  # Déjà dans un regroupement : le bloc extérieur publiera
+            return
+
+        lot = self._local.lot = []
+        try:
+            yield
+        finally:
+            self._local.lot = None
+            if lot:
+                self._ajouter(set().union(*lot), len(lot))
+
+    def _recevoir(self, produit_ids):
+        from .disponibilite import index_disponibilite  # Import local : disponibilite.py importe les modèles
+
+        index_disponibilite.produits_modifies(produit_ids)  # 🔹 Avant la nouvelle version : pas de réponse en cache périmée
+        lot = getattr(self._local, "lot", None)
+        if lot is not None:
+            lot.append(produit_ids)
+        else:
+            self._ajouter(produit_ids, 1)
+
+    def _ajouter(self, produit_ids, signalements):
+        with self._verrou:
+            self._en_attente.update(produit_ids)
+            self._signalements_en_attente += signalements
+            self.compteurs["signalements"] += signalements
+
+            immediat = self.fenetre <= 0
+            if not immediat and not self._minuteur_valide():
+                if self._minuteur is not None:
+                    self._minuteur.cancel()
+                self._minuteur = self._armer()
+
+        if immediat:
+            executeur.soumettre(self.publier, cle="stock")  # 🔹 Même fil pour tous les diffs : seq dans l'ordre
+
+    def _minuteur_valide(self):
+        """ Un minuteur en cours, dans la boucle du serveur si un consumer l'a enregistrée depuis """
+        if self._minuteur is None or not self._minuteur.is_alive():
+            return False
+        return isinstance(self._minuteur, MinuteurBoucle) or boucle_serveur() is None
+
+    def _armer(self):
+        """ 🔹 Minuteur de la fenêtre, dans la boucle du serveur ASGI si elle est connue """
+        boucle = boucle_serveur()
+        if boucle is not None:
+            return MinuteurBoucle(boucle, self.fenetre, self._publier_boucle)
+        minuteur = threading.Timer(self.fenetre, self._publier_differe)
+        minuteur.daemon = True
+        minuteur.start()
+        return minuteur
+
+    def _liberer_minuteur(self):
+        with self._verrou:
+            self._minuteur = None  # La publication commence : plus rien à annuler
+
+    async def _publier_boucle(self):
+        self._liberer_minuteur()
+        await database_sync_to_async(self.publier)()  # group_send renvoyé sur cette boucle par async_to_sync
+
+    def _publier_differe(self):
+        self._liberer_minuteur()
+        try:
+            self.publier()
+        finally:
+            close_old_connections()  # Le minuteur tourne dans son propre thread
+
+    def publier(self):
+        """ 🔹 Envoie immédiatement le diff des produits en attente """
+        from .disponibilite import index_disponibilite
+        from .models import Produit  # Import local : models.py importe ce module
+
+        with self._verrou:
+            produit_ids, signalements = self._en_attente, self._signalements_en_attente
+            self._en_attente, self._signalements_en_attente = set(), 0
+            if self._minuteur is not None:
+                self._minuteur.cancel()
+                self._minuteur = None
+
+        if not produit_ids:
+            return
+        # 🔹 Séquence partagée : deux processus qui publient n'attribuent jamais le même seq
+        seq = self.seq = versions.suivant("stock")
+
+        produits = [
+            {"id": p["id"], "nom": p["nom"], "quantite": p["stock"]}
+            for p in Produit.objects.avec_stock().filter(pk__in=produit_ids).values("id", "nom", "stock")
+        ]
+        self._envoyer({
+            "type": "stock_update",
+            "seq": seq,
+            "stock_total": Produit.get_stock_total(),  # 🔹 Calculé une fois pour tous les clients
+            "produits": produits,
+            "sandwiches": index_disponibilite.pour_produits(produit_ids),  # Portions des sandwiches concernés
+            "fusions": signalements,
+        })
+
+        with self._verrou:
+            self.compteurs["diffusions"] += 1
+            self.compteurs["fusionnes_dernier"] = signalements
+            self.compteurs["fusionnes_max"] = max(self.compteurs["fusionnes_max"], signalements)
+
+    def _envoyer(self, message):
+        envoyer_groupe(
+            "stock_updates", message, "stock.diffusion",
+            seq=message["seq"], produits=len(message["produits"]), fusions=message.get("fusions"),
+        )
+
+diffuseur_stock = DiffuseurStock()
+
+def publier_commandes(lignes):
+    """ 🔹 Pousse les changements de commandes aux écrans de ws/commandes/ (un message par lot, après commit)
+
+    `lignes` est une liste de (id, status, sandwich_id, quantite) ; un status None
+    signale une commande supprimée.
+    """
+    from .recettes import nomenclatures  # Import local : recettes.py importe les modèles
+
+    recettes = nomenclatures({sandwich_id for _, status, sandwich_id, _ in lignes if status is not None})
+    commandes = [
+        {
+            "id": commande_id,
+            "status": status,
+            "sandwich": recettes.get(sandwich_id, {}).get("nom"),
+            "quantite": quantite,
+        } if status is not None else {"id": commande_id, "status": None}
+        for commande_id, status, sandwich_id, quantite in lignes
+    ]
+    if not commandes:
+        return
+    versions.incrementer("commandes")
+
+    def envoyer():
+        envoyer_groupe(
+            "commandes_updates",
+            {"type": "commandes_update", "lot": uuid.uuid4().hex, "commandes": commandes},
+            "commandes.diffusion", commandes=len(commandes),
+        )
+
+    transaction.on_commit(lambda: executeur.soumettre(envoyer, cle="commandes"))
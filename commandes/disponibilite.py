@@ -0,0 +1,122 @@
+import threading
+from .models import Sandwich
+from .recettes import nomenclatures
+from .stock import soldes
+
+class IndexDisponibilite:
+    """ Portions réalisables de chaque sandwich avec le stock courant, en mémoire
+
+    Une portion utilise une unité de chaque produit de la recette : c'est le plus
+    petit solde de ses produits (None pour un sandwich sans produit). Chargé au
+    premier appel, puis tenu à jour par morceaux : un changement de stock ne marque
+    que ses produits, un changement de recette que son sandwich, et seuls les
+    sandwiches concernés sont recalculés à la lecture suivante.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._soldes = None  # produit_id -> solde ; None = pas encore chargé
+        self._recettes = {}  # sandwich_id -> (nom, [produit_ids])
+        self._utilisations = {}  # produit_id -> {sandwich_ids}
+        self._portions = {}  # sandwich_id -> portions
+        self._produits_modifies = set()
+        self._recettes_modifiees = set()
+
+    def _rattraper(self):
+        """ À appeler sous le verrou : chargement complet la première fois, ensuite les seuls changements notés """
+        if self._soldes is None:
+            self._soldes = soldes()
+            self._recettes_modifiees = set(Sandwich.objects.values_list("id", flat=True))
+            self._produits_modifies = set()
+
+        a_recalculer = set()
+        if self._produits_modifies:
+            ids, self._produits_modifies = self._produits_modifies, set()
+            nouveaux = soldes(ids)
+            for produit_id in ids:
+                utilisateurs = self._utilisations.get(produit_id, set())
+                if produit_id in nouveaux:
+                    self._soldes[produit_id] = nouveaux[produit_id]
+                    a_recalculer |= utilisateurs
+                else:
+                    # Produit supprimé : ses sandwiches ont perdu un ingrédient, leur recette est relue
+                    # (la version "sandwiches" incrémentée par la suppression change les clés du cache)
+                    self._soldes.pop(produit_id, None)
+                    self._recettes_modifiees |= utilisateurs
+
+        if self._recettes_modifiees:
+            ids, self._recettes_modifiees = self._recettes_modifiees, set()
+            recettes = nomenclatures(ids)
+            for sandwich_id in ids:
+                _, anciens = self._recettes.pop(sandwich_id, (None, []))
+                for produit_id in anciens:
+                    self._utilisations[produit_id].discard(sandwich_id)
+                self._portions.pop(sandwich_id, None)
+                if sandwich_id in recettes:
+                    recette = recettes[sandwich_id]
+                    self._recettes[sandwich_id] = (recette["nom"], recette["produits"])
+                    for produit_id in recette["produits"]:
+                        self._utilisations.setdefault(produit_id, set()).add(sandwich_id)
+                    a_recalculer.add(sandwich_id)
+
+        a_recalculer &= self._recettes.keys()  # Sandwiches supprimés entre-temps
+        if a_recalculer:
+            # Produits créés depuis le chargement : soldes lus en une requête
+            inconnus = {produit_id for sandwich_id in a_recalculer for produit_id in self._recettes[sandwich_id][1]}
+            inconnus -= self._soldes.keys()
+            if inconnus:
+                self._soldes.update(soldes(inconnus))
+
+        for sandwich_id in a_recalculer:
+            produits = self._recettes[sandwich_id][1]
+            self._portions[sandwich_id] = max(0, min(self._soldes.get(p, 0) for p in produits)) if produits else None
+
+    def produits_modifies(self, produit_ids):
+        """ 🔹 Stock changé (après commit) : seuls les sandwiches de ces produits seront recalculés """
+        with self._verrou:
+            if self._soldes is not None:
+                self._produits_modifies.update(produit_ids)
+
+    def recettes_modifiees(self, sandwich_ids):
+        with self._verrou:
+            if self._soldes is not None:
+                self._recettes_modifiees.update(sandwich_ids)
+
+    def portions(self, sandwich_id):
+        with self._verrou:
+            self._rattraper()
+            return self._portions.get(sandwich_id)
+
+    def tout(self):
+        """ [{id, nom, portions}] de tous les sandwiches, par id """
+        with self._verrou:
+            self._rattraper()
+            return [
+                {"id": sandwich_id, "nom": nom, "portions": self._portions.get(sandwich_id)}
+                for sandwich_id, (nom, _) in sorted(self._recettes.items())
+            ]
+
+    def pour_produits(self, produit_ids):
+        """ [{id, portions}] des sandwiches qui utilisent ces produits (diffs WebSocket du stock) """
+        with self._verrou:
+            self._rattraper()
+            ids = set().union(*(self._utilisations.get(produit_id, set()) for produit_id in produit_ids))
+            return [{"id": sandwich_id, "portions": self._portions.get(sandwich_id)} for sandwich_id in sorted(ids)]
+
+    def vider(self):
+        with self._verrou:
+            self.__init__()
+
+index_disponibilite = IndexDisponibilite()
+
+def portions(sandwich_id):
+    """ 🔹 Portions réalisables lues en base : exactes quel que soit le processus qui a changé le stock
+
+    L'index n'apprend que les changements de son processus ; une décision (refus
+    d'une commande) relit les soldes des seuls produits de la recette, en une requête.
+    """
+    recette = nomenclatures([sandwich_id]).get(sandwich_id)
+    if recette is None or not recette["produits"]:
+        return None
+    courants = soldes(recette["produits"])
+    return max(0, min(courants.get(produit_id, 0) for produit_id in recette["produits"]))
@@ -0,0 +1,99 @@
+import logging
+from django.db import connection, transaction
+from .diffusion import publier_commandes
+from .journal import Chrono, evenement
+from .models import Commande
+from .stock import consommer_stocks
+from .taches import executeur
+
+logger = logging.getLogger(__name__)
+
+STATUTS = [statut for statut, _ in Commande.STATUS_CHOICES]
+
+# 🔹 File de la cuisine : on avance d'une ou plusieurs étapes, ou on repasse
+# "en attente" (erreur de poids à la balance). "terminée" est définitif.
+TRANSITIONS = {
+    "en attente": {"ticket imprimé", "validée", "en cuisson", "terminée"},
+    "ticket imprimé": {"en attente", "validée", "en cuisson", "terminée"},
+    "validée": {"en attente", "en cuisson", "terminée"},
+    "en cuisson": {"en attente", "terminée"},
+    "terminée": set(),
+}
+
+def origines(cible):
+    """ Statuts depuis lesquels `cible` est atteignable """
+    return [statut for statut in STATUTS if cible in TRANSITIONS[statut]]
+
+def transition(commande_ids, cible, depuis=None):
+    """ 🔹 Fait passer plusieurs commandes au statut `cible` en un seul UPDATE conditionnel
+
+    `UPDATE ... WHERE id IN (...) AND status IN (origines autorisées)` valide la
+    transition et sert de verrou optimiste : une commande modifiée entre-temps
+    n'est pas touchée. Avec `depuis`, seules les commandes encore dans ce statut
+    sont modifiées. Les effets de bord (stock, index de la balance, écrans) sont
+    déclenchés une fois pour tout le lot, après le commit ; la consommation du
+    stock est une tâche durable écrite dans la même transaction.
+
+    Retourne (ids modifiés, refus) ; chaque refus donne l'id, le statut actuel et l'erreur.
+    """
+    if cible not in TRANSITIONS:
+        raise ValueError(f"Statut inconnu : {cible}")
+    if depuis is not None and depuis not in TRANSITIONS:
+        raise ValueError(f"Statut inconnu : {depuis}")
+
+    commande_ids = list(dict.fromkeys(commande_ids))
+    sources = [depuis] if depuis is not None else origines(cible)
+    sources = [statut for statut in sources if cible in TRANSITIONS[statut]]
+    if not commande_ids:
+        return [], []
+
+    with Chrono() as chrono:
+        with transaction.atomic():
+            lignes = _mettre_a_jour(commande_ids, sources, cible) if sources else []
+            modifiees = [commande_id for commande_id, _, _ in lignes]
+            publier_commandes([(commande_id, cible, sandwich_id, quantite) for commande_id, sandwich_id, quantite in lignes])
+
+            if cible == "terminée" and lignes:
+                executeur.apres_commit(
+                    consommer_stocks,
+                    [(sandwich_id, quantite, commande_id) for commande_id, sandwich_id, quantite in lignes],
+                    durable=True,
+                )
+
+        refus = _refus(set(commande_ids) - set(modifiees), cible, depuis) if len(modifiees) < len(commande_ids) else []
+    evenement(
+        logger, "commandes.transition",
+        vers=cible, depuis=depuis, modifiees=len(modifiees), refus=len(refus),
+        ids=modifiees[:10], duree_ms=chrono.ms,
+    )
+    return modifiees, refus
+
+def _mettre_a_jour(commande_ids, sources, cible):
+    """ UPDATE ... RETURNING : les lignes modifiées sans relecture (SQLite ≥ 3.35, PostgreSQL) """
+    table = connection.ops.quote_name(Commande._meta.db_table)
+    ids = ", ".join(["%s"] * len(commande_ids))
+    statuts = ", ".join(["%s"] * len(sources))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = %s WHERE id IN ({ids}) AND status IN ({statuts}) "
+            f"RETURNING id, sandwich_id, quantite",
+            [cible, *commande_ids, *sources],
+        )
+        return cursor.fetchall()
+
+def _refus(commande_ids, cible, depuis):
+    """ Explique pourquoi des commandes n'ont pas changé de statut (une requête, seulement en cas d'échec) """
+    actuels = dict(Commande.objects.filter(pk__in=commande_ids).values_list("id", "status"))
+    refus = []
+    for commande_id in sorted(commande_ids):
+        statut = actuels.get(commande_id)
+        if statut is None:
+            erreur = "Commande non trouvée"
+        elif statut == cible:
+            erreur = f"Déjà « {cible} »"
+        elif depuis is not None and statut != depuis:
+            erreur = f"Statut actuel « {statut} », « {depuis} » attendu"
+        else:
+            erreur = f"Transition « {statut} » → « {cible} » interdite"
+        refus.append({"id": commande_id, "status": statut, "erreur": erreur})
+    return refus
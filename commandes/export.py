@@ -0,0 +1,114 @@
+import csv
+import json
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from .models import Commande, MouvementStock, Temperature
+
+# Ressources exportables : modèle, champ de date filtré par from / to, ordre et
+# colonnes (en-tête -> champ lu avec values_list, sans sérialiseur)
+EXPORTS = {
+    "commandes": {
+        "modele": Commande,
+        "date": "date_commande",
+        "ordre": "id",
+        "colonnes": {
+            "id": "id",
+            "date_commande": "date_commande",
+            "sandwich_id": "sandwich_id",
+            "sandwich": "sandwich__nom",
+            "quantite": "quantite",
+            "poids_total": "poids_total",
+            "status": "status",
+        },
+    },
+    "mouvements": {
+        "modele": MouvementStock,
+        "date": "date_heure",
+        "ordre": "id",
+        "colonnes": {
+            "id": "id",
+            "date_heure": "date_heure",
+            "produit_id": "produit_id",
+            "produit": "produit__nom",
+            "quantite": "quantite",
+            "motif": "motif",
+            "commande_id": "commande_id",
+        },
+    },
+    "temperature": {
+        "modele": Temperature,
+        "date": "date_heure",
+        "ordre": "date_heure",  # 🔹 Index de date_heure : pas de tri en mémoire
+        "colonnes": {
+            "date_heure": "date_heure",
+            "temperature": "temperature",
+            "humidite": "humidite",
+        },
+    },
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+class _Tampon:
+    """ Faux fichier : csv.writer retourne directement la ligne écrite """
+
+    def write(self, valeur):
+        return valeur
+
+def _valeur(valeur):
+    return valeur.isoformat() if isinstance(valeur, datetime) else valeur
+
+def lignes(ressource, debut=None, fin=None):
+    """ 🔹 Tuples de la ressource lus par paquets de EXPORT_PAQUET lignes (curseur serveur si la base le permet) """
+    export = EXPORTS[ressource]
+    requete = export["modele"].objects.order_by(export["ordre"])
+    if debut is not None:
+        requete = requete.filter(**{f"{export['date']}__gte": debut})
+    if fin is not None:
+        requete = requete.filter(**{f"{export['date']}__lt": fin})
+    return requete.values_list(*export["colonnes"].values()).iterator(chunk_size=settings.EXPORT_PAQUET)
+
+def morceaux(ressource, format, tuples):
+    """ 🔹 Texte CSV ou NDJSON, un morceau par paquet : la mémoire ne dépend pas du nombre de lignes """
+    colonnes = list(EXPORTS[ressource]["colonnes"])
+    if format == "csv":
+        ecrivain = csv.writer(_Tampon())
+        yield ecrivain.writerow(colonnes)
+        encoder = lambda ligne: ecrivain.writerow([_valeur(valeur) for valeur in ligne])
+    else:
+        encoder = lambda ligne: json.dumps(
+            dict(zip(colonnes, map(_valeur, ligne))), separators=(",", ":"), ensure_ascii=False
+        ) + "\n"
+
+    paquet = []
+    for ligne in tuples:
+        paquet.append(encoder(ligne))
+        if len(paquet) >= settings.EXPORT_PAQUET:
+            yield "".join(paquet)
+            paquet = []
+    if paquet:
+        yield "".join(paquet)
+
+async def _asynchrone(iterateur):
+    """ Sous ASGI, Django lirait un itérateur synchrone en entier avant d'envoyer quoi que ce soit
+
+    Chaque morceau est produit dans le thread de la requête : même connexion,
+    même curseur ouvert d'un paquet à l'autre.
+    """
+    suivant = sync_to_async(next)
+    while (morceau := await suivant(iterateur, None)) is not None:
+        yield morceau
+
+def reponse(request, ressource, format, debut=None, fin=None):
+    contenu = morceaux(ressource, format, lignes(ressource, debut, fin))
+    if isinstance(request, ASGIRequest):
+        contenu = _asynchrone(contenu)
+    flux = StreamingHttpResponse(contenu, content_type=FORMATS[format])
+    flux["Content-Disposition"] = f'attachment; filename="{ressource}.{format}"'
+    return flux
@@ -0,0 +1,109 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from datetime import datetime, timezone as dt_timezone
+
+def evenement(logger, nom, niveau=logging.INFO, **champs):
+    """ 🔹 Journalise un événement structuré : `evenement(logger, "commande.statut", id=3, vers="terminée")`
+
+    Les champs sont gardés à part du message (attribut `champs`) : la console les
+    affiche en clé=valeur, le fichier en JSON. Rien n'est construit si le niveau est filtré.
+    """
+    if logger.isEnabledFor(niveau):
+        logger.log(niveau, nom, extra={"champs": champs})
+
+class Chrono:
+    """ Durée d'un bloc en millisecondes : `with Chrono() as chrono: ...` puis `chrono.ms` """
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = round((time.perf_counter() - self.debut) * 1000, 3)
+
+class FormatCleValeur(logging.Formatter):
+    """ [NIVEAU] logger message cle=valeur ... (console) """
+
+    def format(self, record):
+        ligne = f"[{record.levelname}] {record.name} {record.getMessage()}"
+        champs = getattr(record, "champs", None)
+        if champs:
+            ligne += " " + " ".join(f"{cle}={valeur}" for cle, valeur in champs.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            ligne += "\n" + record.exc_text
+        return ligne
+
+class FormatJSON(logging.Formatter):
+    """ Une ligne JSON par enregistrement (fichier), facile à filtrer avec jq """
+
+    def format(self, record):
+        donnees = {
+            "t": datetime.fromtimestamp(record.created, tz=dt_timezone.utc).isoformat(timespec="milliseconds"),
+            "niveau": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **(getattr(record, "champs", None) or {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            donnees["exception"] = record.exc_text
+        return json.dumps(donnees, ensure_ascii=False, default=str)
+
+class JournalNonBloquant(logging.handlers.QueueHandler):
+    """ 🔹 Handler non bloquant : l'appel ne fait qu'empiler l'enregistrement
+
+    Un thread (QueueListener) écrit ensuite sur la console et dans le fichier :
+    les boucles asyncio et les threads de requête n'attendent jamais la console
+    ni la carte SD. Si la file est pleine, l'enregistrement est abandonné et
+    compté dans `perdus` plutôt que de bloquer.
+    """
+
+    def __init__(self, fichier=None, console=True, taille_file=10000, max_octets=5 * 1024 * 1024, sauvegardes=3):
+        super().__init__(queue.Queue(taille_file))
+        self.perdus = 0
+        cibles = []
+        if console:
+            sortie = logging.StreamHandler()
+            sortie.setFormatter(FormatCleValeur())
+            cibles.append(sortie)
+        if fichier:
+            fichier_tournant = logging.handlers.RotatingFileHandler(
+                fichier, maxBytes=max_octets, backupCount=sauvegardes, encoding="utf-8", delay=True
+            )
+            fichier_tournant.setFormatter(FormatJSON())
+            cibles.append(fichier_tournant)
+        self.listener = logging.handlers.QueueListener(self.queue, *cibles, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.arreter)  # Vide la file à l'arrêt du processus
+
+    def prepare(self, record):
+        """ Résout le message et la trace (objets non sérialisables) ; la mise en forme se fait dans le thread d'écriture """
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.perdus += 1
+
+    def arreter(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self.arreter()
+        super().close()
@@ -0,0 +1,313 @@
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale d'une ligne du protocole (le StreamReader d'asyncio s'arrête à 64 Kio par défaut)
+LIMITE_LIGNE = 16 * 1024 * 1024
+
+def encoder_ligne(donnees):
+    return json.dumps(donnees, separators=(",", ":")).encode() + b"\n"
+
+class Courtier:
+    """ Courtier local sur socket Unix, remplaçant de Redis pour plusieurs processus Daphne
+
+    Protocole : une commande JSON par ligne. Chaque processus s'enregistre avec un
+    préfixe de canal ; un group_send n'est transmis qu'une seule fois à chaque
+    processus ayant au moins un membre du groupe, qui redistribue localement.
+    """
+
+    def __init__(self):
+        self.processus = {}  # préfixe -> writer de la connexion de réception
+        self.groupes = defaultdict(set)  # groupe -> préfixes ayant des membres
+        self.connexions = set()
+
+    async def servir(self, chemin):
+        if os.path.exists(chemin):
+            os.unlink(chemin)
+        serveur = await asyncio.start_unix_server(self.client, path=chemin, limit=LIMITE_LIGNE)
+        try:
+            async with serveur:
+                await serveur.serve_forever()
+        finally:
+            for writer in list(self.connexions):
+                writer.close()  # Arrêt : les processus voient la fin de connexion et se reconnectent
+
+    async def client(self, reader, writer):
+        prefixes = set()
+        self.connexions.add(writer)
+        try:
+            while ligne := await reader.readline():
+                commande = json.loads(ligne)
+                op = commande["op"]
+
+                if op == "enregistrer":
+                    self.processus[commande["prefixe"]] = writer
+                    prefixes.add(commande["prefixe"])
+                elif op == "group_add":
+                    self.groupes[commande["groupe"]].add(commande["prefixe"])
+                elif op == "group_discard":
+                    membres = self.groupes.get(commande["groupe"])
+                    if membres is not None:
+                        membres.discard(commande["prefixe"])
+                        if not membres:
+                            del self.groupes[commande["groupe"]]
+                elif op == "group_send":
+                    # 🔹 Encodé une seule fois, écrit une fois par processus destinataire
+                    donnees = encoder_ligne({"groupe": commande["groupe"], "message": commande["message"]})
+                    for prefixe in self.groupes.get(commande["groupe"], ()):
+                        destination = self.processus.get(prefixe)
+                        if destination is not None:
+                            destination.write(donnees)
+                elif op == "send":
+                    destination = self.processus.get(commande["canal"].split("!", 1)[0])
+                    if destination is not None:
+                        destination.write(encoder_ligne({"canal": commande["canal"], "message": commande["message"]}))
+                elif op == "flush":
+                    self.groupes.clear()
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # Processus arrêté ou courtier en cours d'arrêt
+        except (ValueError, KeyError):
+            # Ligne trop longue ou illisible : le flux n'est plus fiable, le processus se reconnectera
+            logger.warning("Commande invalide reçue du processus %s, connexion fermée", ", ".join(prefixes) or "?")
+        finally:
+            for prefixe in prefixes:
+                if self.processus.get(prefixe) is writer:
+                    del self.processus[prefixe]
+                for groupe in list(self.groupes):
+                    self.groupes[groupe].discard(prefixe)
+                    if not self.groupes[groupe]:
+                        del self.groupes[groupe]
+            self.connexions.discard(writer)
+            writer.close()
+
+class SocketChannelLayer(BaseChannelLayer):
+    """ Channel layer multi-processus branché sur le Courtier (voir `manage.py courtier_channels`)
+
+    Les messages doivent être sérialisables en JSON. Les groupes sont suivis
+    localement : le courtier ne connaît que les processus abonnés à chaque groupe.
+
+    Une seule connexion au courtier par processus, tenue par un thread dédié avec
+    sa propre boucle asyncio : les consumers comme les async_to_sync lancés depuis
+    des threads la réutilisent. Si le courtier redémarre, la connexion est rouverte
+    et les groupes locaux sont réenregistrés.
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, chemin="channels.sock", expiry=60, capacity=100, channel_capacity=None, attente=2.0):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.chemin = str(chemin)
+        self.attente = attente  # Secondes d'attente du courtier avant l'échec d'un envoi
+        self.prefixe = uuid.uuid4().hex
+        self._verrou = threading.Lock()
+        self._files = {}  # canal local -> [asyncio.Queue, boucle du consumer (None avant receive)]
+        self._groupes = defaultdict(set)  # groupe -> canaux locaux
+        self._boucle_io = None  # boucle du thread de connexion
+        self._maintien = None  # tâche de connexion / lecture, dans la boucle du thread
+        self._writer = None  # None tant que la connexion n'est pas (r)établie
+        self._connecte = asyncio.Event()
+
+    # --- Connexion au courtier (thread dédié) ---
+
+    def _demarrer(self):
+        with self._verrou:
+            if self._boucle_io is None:
+                boucle = asyncio.new_event_loop()
+                self._maintien = boucle.create_task(self._maintenir())  # Avant le démarrage du thread
+                threading.Thread(target=self._executer_boucle, args=(boucle,), name="channels-courtier", daemon=True).start()
+                self._boucle_io = boucle
+                atexit.register(self.fermer)
+            return self._boucle_io
+
+    @staticmethod
+    def _executer_boucle(boucle):
+        try:
+            boucle.run_forever()
+        finally:
+            boucle.close()
+
+    async def _io(self, coroutine):
+        """ Exécute `coroutine` dans la boucle de la connexion, attendue depuis la boucle appelante """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._demarrer()))
+
+    async def _maintenir(self):
+        """ 🔹 Connexion au courtier, rouverte après une coupure ; les groupes locaux sont réenregistrés """
+        pause = 0.1
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.chemin, limit=LIMITE_LIGNE)
+            except OSError:
+                await asyncio.sleep(pause)
+                pause = min(pause * 2, 2.0)
+                continue
+            pause = 0.1
+            try:
+                with self._verrou:
+                    groupes = [groupe for groupe, canaux in self._groupes.items() if canaux]
+                writer.write(encoder_ligne({"op": "enregistrer", "prefixe": self.prefixe}))
+                for groupe in groupes:
+                    writer.write(encoder_ligne({"op": "group_add", "groupe": groupe, "prefixe": self.prefixe}))
+                await writer.drain()
+                self._writer = writer
+                self._connecte.set()
+                await self._lire(reader)
+            except ConnectionError:
+                pass
+            except (ValueError, KeyError):
+                # 🔹 Ligne trop longue ou illisible : on repart sur une connexion neuve plutôt que de s'arrêter
+                logger.exception("Message illisible du courtier %s", self.chemin)
+            finally:
+                self._connecte.clear()
+                self._writer = None
+                writer.close()
+            logger.warning("Connexion au courtier %s perdue, reconnexion", self.chemin)
+
+    async def _attendre_connexion(self):
+        try:
+            await asyncio.wait_for(self._connecte.wait(), self.attente)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Courtier channels injoignable ({self.chemin})") from None
+
+    async def _ecrire_io(self, commande, obligatoire):
+        donnees = encoder_ligne(commande)
+        if len(donnees) > LIMITE_LIGNE:
+            raise ValueError(f"Message de {len(donnees)} octets, au-delà de LIMITE_LIGNE ({LIMITE_LIGNE})")
+        if self._writer is None:
+            if not obligatoire:
+                return  # Groupes : réenregistrés à la reconnexion
+            await self._attendre_connexion()
+        self._writer.write(donnees)
+        await self._writer.drain()
+
+    async def _ecrire(self, obligatoire=True, **commande):
+        try:
+            await self._io(self._ecrire_io(commande, obligatoire))
+        except ConnectionError:
+            if obligatoire:
+                raise
+
+    async def _lire(self, reader):
+        while ligne := await reader.readline():
+            donnees = json.loads(ligne)
+            if "groupe" in donnees:
+                with self._verrou:
+                    canaux = list(self._groupes.get(donnees["groupe"], ()))
+            else:
+                canaux = [donnees["canal"]]
+            for canal in canaux:
+                self._deposer(canal, donnees["message"])
+
+    def fermer(self):
+        """ Ferme la connexion et arrête son thread (tests, arrêt du processus) """
+        with self._verrou:
+            boucle, self._boucle_io = self._boucle_io, None
+        if boucle is None:
+            return
+
+        async def arreter():
+            self._maintien.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._maintien  # La tâche ferme sa connexion
+
+        try:
+            asyncio.run_coroutine_threadsafe(arreter(), boucle).result(timeout=1)
+        finally:
+            boucle.call_soon_threadsafe(boucle.stop)
+
+    # --- Files locales (une par canal, dans la boucle du consumer) ---
+
+    def _entree(self, canal):
+        if canal not in self._files:
+            self._files[canal] = [asyncio.Queue(maxsize=self.get_capacity(canal)), None]
+        return self._files[canal]
+
+    def _deposer(self, canal, message):
+        """ Dépose un message depuis n'importe quel thread : une asyncio.Queue ne se remplit que dans sa boucle """
+        with self._verrou:
+            file, boucle = self._entree(canal)
+            if boucle is None:
+                self._mettre(file, message)  # Personne n'attend encore sur cette file
+                return
+        try:
+            if boucle is asyncio.get_running_loop():
+                self._mettre(file, message)
+                return
+        except RuntimeError:
+            pass  # Pas de boucle dans ce thread
+        if not boucle.is_closed():
+            boucle.call_soon_threadsafe(self._mettre, file, message)
+
+    @staticmethod
+    def _mettre(file, message):
+        try:
+            file.put_nowait(message)
+        except asyncio.QueueFull:
+            pass  # Même comportement que les autres layers : un client saturé perd le message
+
+    # --- API channels ---
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        if channel.startswith(self.prefixe + "!"):
+            if self._entree(channel)[0].full():
+                raise ChannelFull(channel)
+            self._deposer(channel, message)  # 🔹 Canal de ce processus : pas de passage par le courtier
+            return
+        await self._ecrire(op="send", canal=channel, message=message)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        with self._verrou:
+            entree = self._entree(channel)
+            entree[1] = asyncio.get_running_loop()
+        return await entree[0].get()
+
+    async def new_channel(self, prefix="specific"):
+        await self._io(self._attendre_connexion())  # Enregistré auprès du courtier avant de recevoir
+        return f"{self.prefixe}!{prefix}.{uuid.uuid4().hex}"
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        with self._verrou:
+            premier = not self._groupes[group]
+            self._groupes[group].add(channel)
+        if premier:
+            await self._ecrire(op="group_add", groupe=group, prefixe=self.prefixe, obligatoire=False)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        with self._verrou:
+            membres = self._groupes.get(group)
+            if not membres:
+                return
+            membres.discard(channel)
+            self._files.pop(channel, None)
+            dernier = not membres
+            if dernier:
+                del self._groupes[group]
+        if dernier:
+            await self._ecrire(op="group_discard", groupe=group, prefixe=self.prefixe, obligatoire=False)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_group_name(group), "Group name not valid"
+        await self._ecrire(op="group_send", groupe=group, message=message)
+
+    async def flush(self):
+        with self._verrou:
+            self._files.clear()
+            self._groupes.clear()
+        await self._ecrire(op="flush")
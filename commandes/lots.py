@@ -0,0 +1,55 @@
+from django.db import transaction
+from .diffusion import publier_commandes
+from .models import Commande
+from .recettes import nomenclatures
+
+def valider_lignes(lignes):
+    """ 🔹 Valide un lot de lignes {sandwich_id, quantite} sans passer par DRF
+
+    Les sandwiches sont résolus en une fois (cache des nomenclatures). Retourne
+    (commandes à créer, rejets) ; chaque rejet indique l'index de la ligne et ses erreurs.
+    """
+    ids = {
+        ligne.get("sandwich_id") for ligne in lignes
+        if isinstance(ligne, dict) and isinstance(ligne.get("sandwich_id"), int)
+    }
+    recettes = nomenclatures(ids) if ids else {}
+    commandes, rejets = [], []
+
+    for index, ligne in enumerate(lignes):
+        if not isinstance(ligne, dict):
+            rejets.append({"index": index, "erreurs": {"ligne": "Objet JSON attendu"}})
+            continue
+
+        erreurs = {}
+        sandwich_id = ligne.get("sandwich_id")
+        quantite = ligne.get("quantite", 1)
+        if isinstance(sandwich_id, bool) or not isinstance(sandwich_id, int):
+            erreurs["sandwich_id"] = "Identifiant entier attendu"
+        elif sandwich_id not in recettes:
+            erreurs["sandwich_id"] = "Sandwich inexistant"
+        if isinstance(quantite, bool) or not isinstance(quantite, int) or quantite < 1:
+            erreurs["quantite"] = "Entier positif attendu"
+
+        if erreurs:
+            rejets.append({"index": index, "erreurs": erreurs})
+        else:
+            commandes.append(Commande(
+                sandwich_id=sandwich_id,
+                quantite=quantite,
+                poids_total=recettes[sandwich_id]["poids_total"] * quantite,
+            ))
+
+    return commandes, rejets
+
+def creer_commandes(commandes):
+    """ 🔹 Insère toutes les commandes en un seul bulk_create, dans une transaction
+
+    bulk_create ne déclenche pas les signaux : le poids est calculé par
+    valider_lignes et les écrans sont mis à jour au commit. Les commandes sont
+    créées "en attente", le stock n'est donc pas concerné.
+    """
+    with transaction.atomic():
+        Commande.objects.bulk_create(commandes)
+        publier_commandes([(c.pk, c.status, c.sandwich_id, c.quantite) for c in commandes])
+    return commandes
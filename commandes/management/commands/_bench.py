@@ -0,0 +1,36 @@
+""" Outils partagés par les commandes de benchmark (ignoré par Django : le nom commence par _) """
+import os
+import statistics
+import tempfile
+from contextlib import contextmanager
+from django.db import connection
+
+def percentile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * p / 100))]
+
+def resume(latences, duree, erreurs=0):
+    """ Débit et percentiles (ms) d'une série de latences en millisecondes """
+    if not latences:
+        return {"requetes": 0, "erreurs": erreurs}
+    return {
+        "requetes": len(latences),
+        "erreurs": erreurs,
+        "debit_req_s": round(len(latences) / duree, 1) if duree else None,
+        "p50_ms": round(statistics.median(latences), 3),
+        "p95_ms": round(percentile(latences, 95), 3),
+        "p99_ms": round(percentile(latences, 99), 3),
+        "max_ms": round(max(latences), 3),
+    }
+
+@contextmanager
+def base_jetable():
+    """ 🔹 Base temporaire migrée (base de test du serveur hors SQLite) : la base de production n'est jamais modifiée """
+    nom_original = connection.settings_dict["NAME"]
+    if connection.vendor == "sqlite":
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nom_original, verbosity=0)
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+from datetime import timedelta
+import django
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+from ._bench import base_jetable, resume
+
+HOTE = [(b"host", b"localhost")]
+
+class Command(BaseCommand):
+    help = (
+        "Charge synthétique reproductible : base jetable remplie à l'échelle voulue, "
+        "routes HTTP et ws/stock/ appelées via l'application ASGI dans le processus (sans réseau)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--produits", type=int, default=20)
+        parser.add_argument("--sandwiches", type=int, default=50)
+        parser.add_argument("--commandes", type=int, default=100000, help="Historique de commandes (10^5 à 10^6)")
+        parser.add_argument("--temperatures", type=int, default=100000, help="Mesures de température (une toutes les 30 s)")
+        parser.add_argument("--requetes", type=int, default=300, help="Requêtes par scénario HTTP")
+        parser.add_argument("--clients-ws", type=int, default=50, help="Clients connectés à ws/stock/")
+        parser.add_argument("--tours-ws", type=int, default=30, help="Changements de stock diffusés")
+        parser.add_argument("--scenarios", help="Scénarios à exécuter (séparés par des virgules), tous par défaut")
+        parser.add_argument("--graine", type=int, default=1, help="Graine des données et des requêtes")
+        parser.add_argument("--sortie", help="Fichier JSON où écrire le résultat")
+        parser.add_argument("--comparer", help="Résultat JSON précédent : affiche l'écart par scénario")
+        parser.add_argument("--json", action="store_true", help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        from commandes.taches import executeur
+        from fablab_api import asgi  # noqa: F401 (django.setup() y reconfigure la journalisation)
+
+        if options["verbosity"] < 2:
+            logging.getLogger("commandes").setLevel(logging.WARNING)  # Une ligne par pesée fausserait les mesures
+
+        # 🔹 Diffusion immédiate : la latence WebSocket mesurée ne contient pas la fenêtre de regroupement
+        with base_jetable(), override_settings(DEBUG=False, STOCK_DIFFUSION_FENETRE=0):
+            debut = time.perf_counter()
+            donnees = remplir(options)
+            duree_remplissage = time.perf_counter() - debut
+            scenarios = async_to_sync(executer)(donnees, options)
+            executeur.attendre()
+
+        resultat = {"meta": meta(options, duree_remplissage), "scenarios": scenarios}
+        texte = json.dumps(resultat, indent=2, sort_keys=True, ensure_ascii=False)
+        if options["sortie"]:
+            with open(options["sortie"], "w", encoding="utf-8") as fichier:
+                fichier.write(texte + "\n")
+
+        if options["json"]:
+            self.stdout.write(texte)
+        else:
+            self.afficher(scenarios)
+        if options["comparer"]:
+            with open(options["comparer"], encoding="utf-8") as fichier:
+                self.comparer(json.load(fichier)["scenarios"], scenarios)
+
+    def afficher(self, scenarios):
+        self.stdout.write(f"{'scénario':<22} {'req':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'err':>4}")
+        for nom, r in scenarios.items():
+            if not r.get("requetes"):
+                self.stdout.write(f"{nom:<22} {'-':>6}")
+                continue
+            self.stdout.write(
+                f"{nom:<22} {r['requetes']:>6} {r['debit_req_s'] or 0:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}"
+                f" {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f} {r['erreurs']:>4}"
+            )
+
+    def comparer(self, anciens, nouveaux):
+        """ Écart relatif (%) du p50, du p99 et du débit avec un résultat précédent """
+        self.stdout.write(f"\n{'scénario':<22} {'p50':>9} {'p99':>9} {'débit':>9}")
+        ecart = lambda ancien, nouveau: f"{(nouveau - ancien) / ancien * 100:+.1f}%" if ancien else "-"
+        for nom, r in nouveaux.items():
+            a = anciens.get(nom)
+            if not a or not a.get("requetes") or not r.get("requetes"):
+                continue
+            self.stdout.write(
+                f"{nom:<22} {ecart(a['p50_ms'], r['p50_ms']):>9} {ecart(a['p99_ms'], r['p99_ms']):>9}"
+                f" {ecart(a['debit_req_s'], r['debit_req_s']):>9}"
+            )
+
+def meta(options, duree_remplissage):
+    """ Contexte du résultat : deux fichiers ne se comparent qu'à échelle et graine égales """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": timezone.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "echelle": {cle: options[cle] for cle in ("produits", "sandwiches", "commandes", "temperatures", "requetes", "clients_ws", "tours_ws", "graine")},
+        "remplissage_s": round(duree_remplissage, 1),
+    }
+
+def remplir(options, lot=10000):
+    """ 🔹 Données synthétiques par bulk_create (aucun signal) : produits, sandwiches, commandes, mesures et agrégats """
+    from commandes import series
+    from commandes.models import Commande, Produit, Sandwich, Temperature, TemperatureAgregat
+
+    aleatoire = random.Random(options["graine"])
+    couleurs = [choix for choix, _ in Produit.COULEUR_CHOICES]
+    produits = Produit.objects.bulk_create([
+        Produit(
+            nom=f"Produit {i}", taille=aleatoire.choice("SML"), couleur=aleatoire.choice(couleurs),
+            poids=round(aleatoire.uniform(5, 80), 1), quantite_stock=10 ** 9,
+        )
+        for i in range(options["produits"])
+    ])
+
+    sandwiches, liens = [], []
+    for i in range(options["sandwiches"]):
+        composition = aleatoire.sample(produits, min(len(produits), aleatoire.randint(3, 6)))
+        sandwiches.append(Sandwich(nom=f"Sandwich {i}", taille=aleatoire.choice("SML"), poids_total=sum(p.poids for p in composition)))
+        liens.append(composition)
+    Sandwich.objects.bulk_create(sandwiches)
+    Sandwich.produits.through.objects.bulk_create([
+        Sandwich.produits.through(sandwich_id=sandwich.pk, produit_id=produit.pk)
+        for sandwich, composition in zip(sandwiches, liens) for produit in composition
+    ])
+
+    # Historique : surtout des commandes terminées, quelques-unes en cours
+    statuts = ["terminée", "en attente", "ticket imprimé", "validée", "en cuisson"]
+    poids_statuts = [90, 4, 2, 2, 2]
+    for debut in range(0, options["commandes"], lot):
+        commandes = []
+        for _ in range(min(lot, options["commandes"] - debut)):
+            sandwich, quantite = aleatoire.choice(sandwiches), aleatoire.randint(1, 3)
+            commandes.append(Commande(
+                sandwich_id=sandwich.pk, quantite=quantite, poids_total=sandwich.poids_total * quantite,
+                status=aleatoire.choices(statuts, poids_statuts)[0],
+            ))
+        Commande.objects.bulk_create(commandes)
+
+    # Mesures toutes les 30 s jusqu'à maintenant, agrégats calculés en mémoire puis insérés en une fois
+    fin = timezone.now()
+    points = [
+        (fin - timedelta(seconds=30 * i), round(aleatoire.gauss(21, 2), 2), round(aleatoire.uniform(30, 60), 1))
+        for i in range(options["temperatures"])
+    ]
+    for debut in range(0, len(points), lot):
+        Temperature.objects.bulk_create([
+            Temperature(date_heure=date_heure, temperature=temperature, humidite=humidite, created_at=date_heure)
+            for date_heure, temperature, humidite in points[debut:debut + lot]
+        ])
+    TemperatureAgregat.objects.bulk_create([
+        TemperatureAgregat(
+            resolution=resolution, debut=debut, nombre=nombre,
+            temperature_min=t_min, temperature_max=t_max, temperature_somme=t_somme,
+            humidite_min=h_min, humidite_max=h_max, humidite_somme=h_somme,
+        )
+        for (resolution, debut), (nombre, t_min, t_max, t_somme, h_min, h_max, h_somme) in series.regrouper(points).items()
+    ], batch_size=lot)
+
+    return {"aleatoire": aleatoire, "produits": produits, "sandwiches": sandwiches, "fin": fin}
+
+async def requete(application, methode, chemin, corps=None):
+    """ (statut, corps, durée en ms) d'une requête passée directement à l'application ASGI """
+    from channels.testing import HttpCommunicator
+
+    body, entetes = b"", HOTE
+    if corps is not None:
+        # Content-Length obligatoire : sans lui, DRF considère le corps comme vide
+        body = json.dumps(corps).encode()
+        entetes = HOTE + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    debut = time.perf_counter()
+    communicator = HttpCommunicator(application, methode, chemin, body=body, headers=entetes)
+    reponse = await communicator.get_response(timeout=60)
+    duree = (time.perf_counter() - debut) * 1000
+    await communicator.wait()
+    return reponse["status"], reponse["body"], duree
+
+async def mesurer(application, appels, attendus=(200,)):
+    """ Exécute les appels (méthode, chemin, corps) l'un après l'autre ; le premier est compté à part (caches froids) """
+    latences, erreurs, premiere = [], 0, None
+    debut = time.perf_counter()
+    for methode, chemin, corps in appels:
+        statut, _, duree = await requete(application, methode, chemin, corps)
+        if premiere is None:
+            premiere = duree
+            debut = time.perf_counter()
+            continue
+        latences.append(duree)
+        erreurs += statut not in attendus
+    resultat = resume(latences, time.perf_counter() - debut, erreurs)
+    resultat["premiere_ms"] = round(premiere, 3) if premiere is not None else None
+    return resultat
+
+async def executer(donnees, options):
+    from channels.db import database_sync_to_async
+    from commandes.models import Commande
+    from commandes.taches import executeur
+    from fablab_api.asgi import application
+
+    aleatoire, n, fin = donnees["aleatoire"], options["requetes"], donnees["fin"]
+    depuis = lambda jours: (fin - timedelta(days=jours)).isoformat().replace("+00:00", "Z")
+
+    @database_sync_to_async
+    def en_attente():
+        return list(Commande.objects.filter(status="en attente").values_list("id", "poids_total")[:n + 1])
+
+    async def curseur():
+        """ Parcours des pages successives (liens next) de l'historique des commandes """
+        chemin, appels = "/api/commandes/?page_size=50", []
+        for _ in range(n + 1):
+            statut, corps, duree = await requete(application, "GET", chemin)
+            appels.append((statut, duree))
+            suivant = json.loads(corps).get("next") if statut == 200 else None
+            if not suivant:
+                break
+            chemin = suivant.split("localhost", 1)[-1]
+        latences = [duree for _, duree in appels[1:]]
+        resultat = resume(latences, sum(latences) / 1000, sum(statut != 200 for statut, _ in appels[1:]))
+        resultat["premiere_ms"] = round(appels[0][1], 3)
+        return resultat
+
+    async def verification():
+        """ Une pesée sur cinq refusée, les autres terminent la commande (stock et diffusions en arrière-plan) """
+        appels = [
+            ("POST", "/api/verification-poids/", {"code_commande": pk, "poids_mesure": poids + (50.0 if i % 5 == 0 else 2.0)})
+            for i, (pk, poids) in enumerate(await en_attente())
+        ]
+        resultat = await mesurer(application, appels)
+        await asyncio.get_running_loop().run_in_executor(None, executeur.attendre)
+        return resultat
+
+    def lots():
+        for _ in range(n + 1):
+            yield "POST", "/api/commandes/batch/", [
+                {"sandwich_id": aleatoire.choice(donnees["sandwiches"]).pk, "quantite": aleatoire.randint(1, 3)} for _ in range(30)
+            ]
+
+    scenarios = {
+        "stock": lambda: mesurer(application, [("GET", "/api/stock/", None)] * (n + 1)),
+        "produits": lambda: mesurer(application, [("GET", "/api/produits/", None)] * (n + 1)),
+        "sandwiches": lambda: mesurer(application, [("GET", "/api/sandwiches/", None)] * (n + 1)),
+        "commandes_page": lambda: mesurer(application, [("GET", "/api/commandes/?page_size=50", None)] * (n + 1)),
+        "commandes_curseur": curseur,
+        "commandes_champs": lambda: mesurer(application, [("GET", "/api/commandes/?page_size=200&fields=id,status", None)] * (n + 1)),
+        "temperature_jour": lambda: mesurer(application, [("GET", f"/api/temperature/range/?from={depuis(1)}", None)] * (n + 1)),
+        "temperature_mois": lambda: mesurer(application, [("GET", f"/api/temperature/range/?from={depuis(30)}", None)] * (n + 1)),
+        "verification_poids": verification,
+        "commandes_lot": lambda: mesurer(application, lots(), attendus=(201,)),
+        "ws_stock": lambda: diffusion_stock(application, donnees, options),
+    }
+    choisis = options["scenarios"].split(",") if options["scenarios"] else list(scenarios)
+    inconnus = set(choisis) - set(scenarios)
+    if inconnus:
+        raise ValueError(f"Scénarios inconnus : {', '.join(sorted(inconnus))}")
+    return {nom: await scenarios[nom]() for nom in choisis}
+
+async def diffusion_stock(application, donnees, options):
+    """ 🔹 Latence d'un changement de stock (PATCH /api/produits/<id>/) jusqu'à chaque client de ws/stock/ """
+    from channels.testing import WebsocketCommunicator
+
+    clients = [WebsocketCommunicator(application, "/ws/stock/", headers=HOTE) for _ in range(options["clients_ws"])]
+    for client in clients:
+        connecte, _ = await client.connect(timeout=10)
+        assert connecte
+        await client.receive_from(timeout=10)  # snapshot
+
+    async def recevoir(client):
+        await client.receive_from(timeout=30)
+        return time.perf_counter()
+
+    latences, erreurs, quantite = [], 0, 10 ** 9
+    debut_total = time.perf_counter()
+    try:
+        for _ in range(options["tours_ws"]):
+            produit = donnees["aleatoire"].choice(donnees["produits"])
+            quantite -= 1
+            attentes = [asyncio.ensure_future(recevoir(client)) for client in clients]
+            debut = time.perf_counter()
+            statut, _, _ = await requete(application, "PATCH", f"/api/produits/{produit.pk}/", {"quantite_stock": quantite})
+            erreurs += statut != 200
+            latences.extend((arrivee - debut) * 1000 for arrivee in await asyncio.gather(*attentes))
+    finally:
+        for client in clients:
+            await client.disconnect()
+
+    resultat = resume(latences, time.perf_counter() - debut_total, erreurs)
+    resultat["clients"] = len(clients)
+    return resultat
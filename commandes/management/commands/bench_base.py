@@ -0,0 +1,153 @@
+import json
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from django.core.management.base import BaseCommand
+from ._bench import resume
+
+OPERATIONS = ("commande", "verification", "temperature", "lecture")
+
+def lancer_profil(profil, options, resultats):
+    """ Processus de travail : les réglages (et donc DATABASES) sont lus avec BASE_DONNEES=profil """
+    os.environ["BASE_DONNEES"] = profil
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fablab_api.settings")
+    try:
+        import django
+        django.setup()
+        logging.getLogger("commandes").setLevel(logging.WARNING)
+        resultats.put((profil, mesurer(options)))
+    except BaseException as erreur:  # Pilote absent, serveur injoignable : le profil est signalé, pas ignoré
+        resultats.put((profil, {"erreur": f"{type(erreur).__name__}: {erreur}"}))
+
+def mesurer(options):
+    from django.db import OperationalError, close_old_connections
+    from commandes.models import Commande, Produit, Sandwich, Temperature
+    from commandes.taches import executeur
+    from commandes.verification import verifier
+    from ._bench import base_jetable
+
+    with base_jetable():
+        produits = Produit.objects.bulk_create(
+            [Produit(nom=f"Produit {i}", taille="M", poids=20.0 + i, quantite_stock=10 ** 9) for i in range(10)]
+        )
+        sandwiches = Sandwich.objects.bulk_create(
+            [Sandwich(nom=f"Sandwich {i}", taille="M", poids_total=sum(p.poids for p in produits[i:i + 3])) for i in range(8)]
+        )
+        for i, sandwich in enumerate(sandwiches):
+            sandwich.produits.set(produits[i:i + 3])
+        # Commandes en attente que les fils « verification » passent sur la balance
+        a_peser = Commande.objects.bulk_create([
+            Commande(sandwich=sandwiches[i % len(sandwiches)], quantite=1, poids_total=sandwiches[i % len(sandwiches)].poids_total)
+            for i in range(options["commandes"])
+        ])
+        file_pesees = iter([(commande.pk, commande.poids_total) for commande in a_peser])
+        verrou_pesees = threading.Lock()
+        close_old_connections()
+
+        def commande(aleatoire):
+            Commande.objects.create(sandwich=aleatoire.choice(sandwiches), quantite=aleatoire.randint(1, 3))
+
+        def verification(aleatoire):
+            with verrou_pesees:
+                pk, poids = next(file_pesees)
+            verifier(pk, poids + aleatoire.choice((1.0, 1.0, 1.0, 50.0)))
+
+        def temperature(aleatoire):
+            Temperature.objects.create(temperature=aleatoire.gauss(21, 2), humidite=aleatoire.uniform(30, 60))
+
+        def lecture(aleatoire):
+            list(Commande.objects.select_related("sandwich").order_by("-id")[:50])
+
+        fonctions = {"commande": commande, "verification": verification, "temperature": temperature, "lecture": lecture}
+        mesures = {nom: [] for nom in OPERATIONS}
+        erreurs = {nom: {"verrouillee": 0, "autres": 0} for nom in OPERATIONS}
+        fin = time.perf_counter() + options["duree"]
+
+        def travailler(nom, graine):
+            aleatoire = random.Random(graine)
+            while time.perf_counter() < fin:
+                debut = time.perf_counter()
+                try:
+                    fonctions[nom](aleatoire)
+                except StopIteration:
+                    break  # Plus de commandes à peser
+                except OperationalError as erreur:
+                    erreurs[nom]["verrouillee" if "locked" in str(erreur) else "autres"] += 1
+                except Exception:
+                    erreurs[nom]["autres"] += 1
+                else:
+                    mesures[nom].append((time.perf_counter() - debut) * 1000)
+                finally:
+                    close_old_connections()  # Comme en fin de requête HTTP
+
+        fils = [
+            threading.Thread(target=travailler, args=(nom, 100 * i + j))
+            for i, nom in enumerate(OPERATIONS)
+            for j in range(options["lecteurs"] if nom == "lecture" else options["ecrivains"])
+        ]
+        debut = time.perf_counter()
+        for fil in fils:
+            fil.start()
+        for fil in fils:
+            fil.join()
+        duree = time.perf_counter() - debut
+        executeur.attendre()
+
+        from django.db import connection
+        resultat = {
+            "moteur": connection.settings_dict["ENGINE"],
+            "operations": {
+                nom: {**resume(mesures[nom], duree, sum(erreurs[nom].values())), "verrouillees": erreurs[nom]["verrouillee"]}
+                for nom in OPERATIONS
+            },
+        }
+        ecritures = sum(len(mesures[nom]) for nom in ("commande", "verification", "temperature"))
+        resultat["ecritures_s"] = round(ecritures / duree, 1)
+        return resultat
+
+class Command(BaseCommand):
+    help = (
+        "Débit d'écriture sous charge mixte (commandes, pesées, mesures de température, lectures) "
+        "pour chaque profil de base de données (BASE_DONNEES)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profils", default="sqlite,sqlite-wal", help="Profils à comparer (postgres : serveur POSTGRES_* requis)")
+        parser.add_argument("--duree", type=float, default=10.0, help="Durée de la charge par profil, en secondes")
+        parser.add_argument("--ecrivains", type=int, default=2, help="Fils par type d'écriture")
+        parser.add_argument("--lecteurs", type=int, default=2, help="Fils de lecture")
+        parser.add_argument("--commandes", type=int, default=20000, help="Commandes en attente disponibles pour les pesées")
+        parser.add_argument("--json", action="store_true", help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        # 🔹 Un processus par profil : DATABASES est figé au chargement des réglages
+        contexte = multiprocessing.get_context("spawn")
+        resultats = {}
+        for profil in options["profils"].split(","):
+            file_resultats = contexte.Queue()
+            processus = contexte.Process(target=lancer_profil, args=(profil, options, file_resultats))
+            processus.start()
+            nom, resultat = file_resultats.get()
+            processus.join()
+            resultats[nom] = resultat
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultats, indent=2, sort_keys=True))
+            return
+        for profil, resultat in resultats.items():
+            if "erreur" in resultat:
+                self.stdout.write(f"{profil} : {resultat['erreur']}")
+                continue
+            self.stdout.write(f"\n{profil} ({resultat['moteur']}) : {resultat['ecritures_s']} écritures/s")
+            self.stdout.write(f"  {'opération':<13} {'ops':>7} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'verrous':>8} {'err':>5}")
+            for nom, r in resultat["operations"].items():
+                if not r.get("requetes"):
+                    self.stdout.write(f"  {nom:<13} {'-':>7} {'':>8} {'':>8} {'':>8} {'':>8} {r['verrouillees']:>8} {r['erreurs']:>5}")
+                    continue
+                self.stdout.write(
+                    f"  {nom:<13} {r['requetes']:>7} {r['debit_req_s']:>8.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+                    f" {r['max_ms']:>8.2f} {r['verrouillees']:>8} {r['erreurs']:>5}"
+                )
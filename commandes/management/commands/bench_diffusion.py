@@ -0,0 +1,123 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from ._bench import percentile
+
+def lancer_courtier(chemin):
+    from commandes.layers import Courtier
+    asyncio.run(Courtier().servir(chemin))
+
+def lancer_clients(chemin, nombre, tours, pret, arrivees):
+    """ Processus de travail : `nombre` StockConsumer connectés via le courtier """
+    os.environ["CHANNEL_LAYER"] = "socket"
+    os.environ["CHANNEL_SOCKET"] = chemin
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fablab_api.settings")
+    import django
+    django.setup()
+    asyncio.run(clients(nombre, tours, pret, arrivees))
+
+async def clients(nombre, tours, pret, arrivees):
+    from channels.testing import WebsocketCommunicator
+    from commandes.consumers import StockConsumer
+
+    application = StockConsumer.as_asgi()
+    communicators = [WebsocketCommunicator(application, "/ws/stock/") for _ in range(nombre)]
+    for communicator in communicators:
+        await communicator.connect()
+        await communicator.receive_from()  # snapshot
+    pret.put(nombre)
+
+    async def recevoir(communicator):
+        await communicator.receive_from(timeout=30)
+        return time.time()
+
+    for tour in range(tours):
+        heures = await asyncio.gather(*(recevoir(c) for c in communicators))
+        arrivees.put((tour, heures))
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+class Command(BaseCommand):
+    help = "Mesure la latence de diffusion du groupe stock_updates vers N StockConsumer répartis sur plusieurs processus"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,100,1000", help="Nombres de clients à tester (séparés par des virgules)")
+        parser.add_argument("--processus", type=int, default=4, help="Nombre de processus de travail")
+        parser.add_argument("--tours", type=int, default=50, help="Nombre de diffusions par configuration")
+        parser.add_argument("--json", action="store_true", help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        contexte = multiprocessing.get_context("spawn")
+        chemin = os.path.join(tempfile.mkdtemp(), "bench.sock")
+        courtier = contexte.Process(target=lancer_courtier, args=(chemin,), daemon=True)
+        courtier.start()
+        while not os.path.exists(chemin):
+            time.sleep(0.05)
+
+        resultats = []
+        try:
+            for nombre in [int(n) for n in options["clients"].split(",")]:
+                resultats.append(self.mesurer(contexte, chemin, nombre, options["processus"], options["tours"]))
+        finally:
+            courtier.terminate()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultats, indent=2))
+            return
+        self.stdout.write(f"{'clients':>8} {'processus':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for r in resultats:
+            self.stdout.write(
+                f"{r['clients']:>8} {r['processus']:>9} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}"
+            )
+
+    def mesurer(self, contexte, chemin, nombre, processus, tours):
+        from asgiref.sync import async_to_sync
+        from commandes.layers import SocketChannelLayer
+
+        processus = max(1, min(processus, nombre))
+        repartition = [nombre // processus + (1 if i < nombre % processus else 0) for i in range(processus)]
+        pret, arrivees = contexte.Queue(), contexte.Queue()
+        travailleurs = [
+            contexte.Process(target=lancer_clients, args=(chemin, n, tours, pret, arrivees), daemon=True)
+            for n in repartition
+        ]
+        for travailleur in travailleurs:
+            travailleur.start()
+        for _ in travailleurs:
+            pret.get(timeout=120)
+        time.sleep(0.5)  # Laisse le courtier traiter les derniers group_add
+
+        layer = SocketChannelLayer(chemin=chemin)
+        latences = []
+
+        async def diffuser(tour):
+            await layer.group_send("stock_updates", {
+                "type": "stock_update", "seq": tour + 1, "stock_total": 0, "produits": [],
+            })
+
+        for tour in range(tours):
+            depart = time.time()
+            async_to_sync(diffuser)(tour)
+            for _ in travailleurs:
+                _, heures = arrivees.get(timeout=60)
+                latences.extend((h - depart) * 1000 for h in heures)
+        layer.fermer()
+
+        for travailleur in travailleurs:
+            travailleur.join(timeout=30)
+
+        return {
+            "clients": nombre,
+            "processus": processus,
+            "tours": tours,
+            "p50_ms": statistics.median(latences),
+            "p95_ms": percentile(latences, 95),
+            "p99_ms": percentile(latences, 99),
+            "max_ms": max(latences),
+        }
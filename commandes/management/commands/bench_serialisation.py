@@ -0,0 +1,100 @@
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.text import compress_string
+from ._bench import base_jetable
+
+class Command(BaseCommand):
+    help = (
+        "Compare la lecture de /api/commandes/ par les serializers DRF et par le chemin rapide "
+        "(values() + plan, orjson, gzip) sur une base jetable"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--commandes", type=int, default=10000, help="Nombre de commandes à sérialiser")
+        parser.add_argument("--repetitions", type=int, default=5, help="Mesures par étape (médiane et minimum)")
+        parser.add_argument("--json", action="store_true", help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        with base_jetable(), override_settings(DEBUG=False):
+            resultat = self.mesurer(options["commandes"], options["repetitions"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultat, indent=2))
+            return
+        self.stdout.write(f"{options['commandes']} commandes, orjson : {'oui' if resultat['orjson'] else 'non'}")
+        self.stdout.write(f"  {'chemin':<8} {'lecture ms':>11} {'rendu ms':>9} {'gzip ms':>8} {'total ms':>9} {'octets':>10} {'gzip':>9}")
+        for nom in ("drf", "rapide"):
+            r = resultat[nom]
+            self.stdout.write(
+                f"  {nom:<8} {r['lecture_ms']:>11.1f} {r['rendu_ms']:>9.1f} {r['gzip_ms']:>8.1f}"
+                f" {r['total_ms']:>9.1f} {r['octets']:>10} {r['octets_gzip']:>9}"
+            )
+        self.stdout.write(f"  accélération (lecture + rendu) : x{resultat['acceleration']}")
+
+    def mesurer(self, nombre, repetitions):
+        from rest_framework.renderers import JSONRenderer
+        from commandes.models import Produit, Sandwich, Commande
+        from commandes.rapide import LECTURE_COMMANDES
+        from commandes.renderers import JSONRapideRenderer, orjson
+        from commandes.serializers import CommandeSerializer
+        from commandes.views import CommandeViewSet
+
+        produits = Produit.objects.bulk_create(
+            [Produit(nom=f"Produit {i}", taille="M", poids=20.0 + i, quantite_stock=10 ** 6) for i in range(12)]
+        )
+        sandwiches = Sandwich.objects.bulk_create(
+            [Sandwich(nom=f"Sandwich {i}", taille="M", poids_total=sum(p.poids for p in produits[i:i + 4])) for i in range(8)]
+        )
+        for i, sandwich in enumerate(sandwiches):
+            sandwich.produits.set(produits[i:i + 4])
+        Commande.objects.bulk_create([
+            Commande(sandwich=sandwiches[i % len(sandwiches)], quantite=1 + i % 3, poids_total=sandwiches[i % len(sandwiches)].poids_total)
+            for i in range(nombre)
+        ])
+
+        # 🔹 Les deux chemins tels que les appellent les vues (mêmes requêtes SQL, même ordre)
+        chemins = {
+            "drf": (
+                lambda: CommandeSerializer(CommandeViewSet.queryset.all(), many=True).data,
+                JSONRenderer(),
+            ),
+            "rapide": (
+                lambda: LECTURE_COMMANDES.construire(Commande.objects.values(*LECTURE_COMMANDES.colonnes())),
+                JSONRapideRenderer(),
+            ),
+        }
+
+        def chronometrer(fonction, *args):
+            debut = time.perf_counter()
+            valeur = fonction(*args)
+            return valeur, (time.perf_counter() - debut) * 1000
+
+        resultat = {"commandes": nombre, "orjson": orjson is not None}
+        contenus = {}
+        for nom, (lire, rendu) in chemins.items():
+            mesures = {"lecture_ms": [], "rendu_ms": [], "gzip_ms": []}
+            for _ in range(repetitions):
+                donnees, duree = chronometrer(lire)
+                mesures["lecture_ms"].append(duree)
+                contenu, duree = chronometrer(rendu.render, donnees)
+                mesures["rendu_ms"].append(duree)
+                compresse, duree = chronometrer(compress_string, contenu)
+                mesures["gzip_ms"].append(duree)
+            contenus[nom] = contenu
+            resultat[nom] = {
+                **{cle: round(statistics.median(valeurs), 2) for cle, valeurs in mesures.items()},
+                "min_lecture_ms": round(min(mesures["lecture_ms"]), 2),
+                "octets": len(contenu),
+                "octets_gzip": len(compresse),
+            }
+            resultat[nom]["total_ms"] = round(sum(resultat[nom][cle] for cle in mesures), 2)
+
+        # Les deux chemins doivent produire le même JSON
+        assert json.loads(contenus["drf"]) == json.loads(contenus["rapide"]), "JSON différent entre les deux chemins"
+        avant = resultat["drf"]["lecture_ms"] + resultat["drf"]["rendu_ms"]
+        apres = resultat["rapide"]["lecture_ms"] + resultat["rapide"]["rendu_ms"]
+        resultat["acceleration"] = round(avant / apres, 1)
+        return resultat
@@ -0,0 +1,82 @@
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from ._bench import base_jetable, percentile
+
+OBJECTIF_P99_MS = 5.0
+
+class Command(BaseCommand):
+    help = "Mesure la latence de /api/verification-poids/ sur une base jetable (objectif : p99 < 5 ms)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--commandes", type=int, default=2000, help="Nombre de commandes en cours")
+        parser.add_argument(
+            "--processus-separe", action="store_true",
+            help="Tâches durables laissées à un processus dédié (TACHES_PROCESSUS_SEPARE) : seule la requête est mesurée",
+        )
+        parser.add_argument("--json", action="store_true", help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        from commandes.taches import executeur
+
+        with base_jetable(), override_settings(DEBUG=False, TACHES_PROCESSUS_SEPARE=options["processus_separe"]):
+            resultat = self.mesurer(options["commandes"])
+            executeur.attendre()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultat, indent=2))
+            return
+        for cle, valeur in resultat.items():
+            self.stdout.write(f"{cle:>22} : {valeur}")
+
+    def mesurer(self, nombre):
+        from commandes.models import Produit, Sandwich, Commande
+
+        produits = Produit.objects.bulk_create(
+            [Produit(nom=f"Produit {i}", taille="M", poids=20.0 + i, quantite_stock=10 ** 6) for i in range(6)]
+        )
+        sandwich = Sandwich.objects.create(nom="Bench", taille="M", poids_total=sum(p.poids for p in produits))
+        sandwich.produits.set(produits)
+        commandes = Commande.objects.bulk_create(
+            [Commande(sandwich=sandwich, quantite=1, poids_total=sandwich.poids_total, status="en cuisson") for _ in range(nombre)]
+        )
+
+        client = Client(HTTP_HOST="localhost")
+
+        def peser(commande, poids):
+            debut = time.perf_counter()
+            reponse = client.post(
+                "/api/verification-poids/",
+                {"code_commande": commande.pk, "poids_mesure": poids},
+                content_type="application/json",
+            )
+            duree = (time.perf_counter() - debut) * 1000
+            assert reponse.status_code == 200, reponse.content
+            return duree
+
+        # 🔹 Une pesée sur cinq est refusée (la commande reste en cours), les autres terminent la commande
+        refus, validations = [], []
+        debut = time.perf_counter()
+        for i, commande in enumerate(commandes):
+            if i % 5 == 0:
+                refus.append(peser(commande, commande.poids_total + 50.0))
+            else:
+                validations.append(peser(commande, commande.poids_total + 2.0))
+        duree = time.perf_counter() - debut
+        latences = refus + validations
+
+        p99 = percentile(latences, 99)
+        return {
+            "requetes": len(latences),
+            "debit_req_s": round(len(latences) / duree, 1),
+            "p50_ms": round(statistics.median(latences), 3),
+            "p95_ms": round(percentile(latences, 95), 3),
+            "p99_ms": round(p99, 3),
+            "max_ms": round(max(latences), 3),
+            "p99_refus_ms": round(percentile(refus, 99), 3),
+            "p99_validation_ms": round(percentile(validations, 99), 3),
+            "objectif_p99_ms": OBJECTIF_P99_MS,
+            "objectif_atteint": p99 < OBJECTIF_P99_MS,
+        }
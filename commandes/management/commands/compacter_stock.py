@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from commandes import stock
+
+class Command(BaseCommand):
+    help = "Intègre les mouvements du journal de stock dans le solde instantané des produits"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delai", type=float, help="Âge minimal des mouvements intégrés, en secondes (STOCK_COMPACTAGE_DELAI)")
+
+    def handle(self, *args, **options):
+        nombre = stock.compacter(options["delai"])
+        self.stdout.write(f"📦 {nombre} mouvement(s) intégré(s) au stock")
@@ -0,0 +1,17 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from commandes.layers import Courtier
+
+class Command(BaseCommand):
+    help = "Lance le courtier local (socket Unix) utilisé par CHANNEL_LAYER=socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chemin", default=settings.CHANNEL_SOCKET, help="Chemin du socket Unix")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"📡 Courtier channels à l'écoute sur {options['chemin']}")
+        try:
+            asyncio.run(Courtier().servir(options["chemin"]))
+        except KeyboardInterrupt:
+            pass
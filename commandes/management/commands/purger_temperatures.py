@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from commandes import series
+
+class Command(BaseCommand):
+    help = "Supprime les mesures de température et agrégats plus anciens que TEMPERATURE_RETENTION_JOURS"
+
+    def handle(self, *args, **options):
+        for resolution, nombre in series.purger().items():
+            self.stdout.write(f"🧹 {resolution} : {nombre} ligne(s) supprimée(s)")
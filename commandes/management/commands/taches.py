@@ -0,0 +1,34 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from commandes.taches import executeur
+
+logger = logging.getLogger("commandes.taches")
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les tâches durables (consommation du stock...) dans ce processus. "
+        "Plusieurs processus peuvent tourner en même temps ; avec TACHES_PROCESSUS_SEPARE=1, "
+        "les processus web ne les exécutent plus eux-mêmes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--une-fois", action="store_true", help="Exécute les tâches dues puis s'arrête")
+        parser.add_argument("--intervalle", type=float, default=0.5, help="Attente entre deux lectures de la file, en secondes")
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                executees = executeur.traiter_durables()
+                total += executees
+                close_old_connections()
+                if not executees:
+                    if options["une_fois"]:
+                        break
+                    time.sleep(options["intervalle"])
+        except KeyboardInterrupt:
+            pass
+        executeur.attendre()  # Diffusions lancées par les tâches
+        self.stdout.write(f"{total} tâche(s) exécutée(s)")
@@ -0,0 +1,172 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# Bornes des histogrammes de durée, en secondes
+BORNES_SECONDES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BORNES_SQL = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BORNES_CLIENTS = (0, 1, 10, 100, 1000, 10000)
+
+DESCRIPTIONS = {
+    "fablab_http_requete_secondes": "Latence des requêtes HTTP par route",
+    "fablab_http_reponses_total": "Réponses HTTP par route et classe de code",
+    "fablab_sql_requetes": "Requêtes SQL exécutées par requête HTTP",
+    "fablab_sql_secondes_total": "Temps passé dans la base par route",
+    "fablab_ws_connexions": "Connexions WebSocket ouvertes par consumer",
+    "fablab_diffusion_secondes": "Durée des group_send par groupe",
+    "fablab_diffusion_clients": "Clients atteints par diffusion (channel layer en mémoire)",
+    "fablab_signal_secondes": "Durée des receveurs de signaux de commandes/models.py",
+}
+
+def actives():
+    """ METRIQUES_ACTIVES = False coupe tout : middleware retiré, aucune mesure enregistrée """
+    return getattr(settings, "METRIQUES_ACTIVES", True)
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+class Histogramme:
+    def __init__(self, bornes):
+        self.bornes = bornes
+        self.comptes = [0] * (len(bornes) + 1)  # dernier = au-delà de la plus grande borne
+        self.somme = 0.0
+        self.nombre = 0
+
+    def observer(self, valeur):
+        self.comptes[bisect_left(self.bornes, valeur)] += 1
+        self.somme += valeur
+        self.nombre += 1
+
+class Registre:
+    """ 🔹 Compteurs, jauges et histogrammes en mémoire du processus, exposés au format texte Prometheus
+
+    Chaque mesure coûte un verrou et quelques additions : assez peu pour rester active en production.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self.compteurs = {}  # (nom, labels) -> valeur
+        self.jauges = {}
+        self.histogrammes = {}
+
+    def incrementer(self, nom, valeur=1, **labels):
+        if not actives():
+            return
+        cle = (nom, _labels(labels))
+        with self._verrou:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+
+    def jauge(self, nom, delta, **labels):
+        if not actives():
+            return
+        cle = (nom, _labels(labels))
+        with self._verrou:
+            self.jauges[cle] = self.jauges.get(cle, 0) + delta
+
+    def observer(self, nom, valeur, bornes=BORNES_SECONDES, **labels):
+        if not actives():
+            return
+        cle = (nom, _labels(labels))
+        with self._verrou:
+            histogramme = self.histogrammes.get(cle)
+            if histogramme is None:
+                histogramme = self.histogrammes[cle] = Histogramme(bornes)
+            histogramme.observer(valeur)
+
+    def vider(self):
+        with self._verrou:
+            self.compteurs.clear()
+            self.jauges.clear()
+            self.histogrammes.clear()
+
+    def texte(self, supplementaires=()):
+        """ Format d'exposition texte de Prometheus (version 0.0.4) """
+        lignes = []
+        with self._verrou:
+            series = [
+                ("counter", self.compteurs),
+                ("gauge", self.jauges),
+                ("histogram", {cle: (h.bornes, list(h.comptes), h.somme, h.nombre) for cle, h in self.histogrammes.items()}),
+            ]
+        for type_, valeurs in series:
+            noms_vus = set()
+            for (nom, labels), valeur in sorted(valeurs.items(), key=lambda element: element[0]):
+                if nom not in noms_vus:
+                    noms_vus.add(nom)
+                    if nom in DESCRIPTIONS:
+                        lignes.append(f"# HELP {nom} {DESCRIPTIONS[nom]}")
+                    lignes.append(f"# TYPE {nom} {type_}")
+                if type_ != "histogram":
+                    lignes.append(f"{nom}{_format_labels(labels)} {valeur}")
+                    continue
+                bornes, comptes, somme, nombre = valeur
+                cumul = 0
+                for borne, compte in zip([*bornes, "+Inf"], comptes):
+                    cumul += compte
+                    lignes.append(f"{nom}_bucket{_format_labels(labels + (('le', borne),))} {cumul}")
+                lignes.append(f"{nom}_sum{_format_labels(labels)} {somme}")
+                lignes.append(f"{nom}_count{_format_labels(labels)} {nombre}")
+        for nom, type_, valeur in supplementaires:
+            lignes.append(f"# TYPE {nom} {type_}")
+            lignes.append(f"{nom} {valeur}")
+        return "\n".join(lignes) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    echappe = lambda valeur: str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{cle}="{echappe(valeur)}"' for cle, valeur in labels) + "}"
+
+registre = Registre()
+
+class MetriquesMiddleware:
+    """ 🔹 Latence par route, nombre de requêtes SQL et temps passé dans la base pour chaque requête HTTP """
+
+    def __init__(self, get_response):
+        if not actives():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = [0, 0.0]
+
+        def compter_sql(execute, requete, params, many, contexte):
+            debut = time.perf_counter()
+            try:
+                return execute(requete, params, many, contexte)
+            finally:
+                sql[0] += 1
+                sql[1] += time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        with connection.execute_wrapper(compter_sql):
+            reponse = self.get_response(request)
+        duree = time.perf_counter() - debut
+
+        # Route du resolver (et non le chemin) : une série par endpoint, pas par id
+        route = request.resolver_match.route if request.resolver_match else "<non résolue>"
+        registre.observer("fablab_http_requete_secondes", duree, route=route, methode=request.method)
+        registre.incrementer(
+            "fablab_http_reponses_total", route=route, methode=request.method, code=f"{reponse.status_code // 100}xx"
+        )
+        registre.observer("fablab_sql_requetes", sql[0], bornes=BORNES_SQL, route=route)
+        registre.incrementer("fablab_sql_secondes_total", sql[1], route=route)
+        return reponse
+
+def instrumenter(receveur):
+    """ Décorateur de receveur de signal : durée de chaque appel dans fablab_signal_secondes """
+    nom = receveur.__name__
+
+    @wraps(receveur)
+    def receveur_mesure(*args, **kwargs):
+        debut = time.perf_counter()
+        try:
+            return receveur(*args, **kwargs)
+        finally:
+            registre.observer("fablab_signal_secondes", time.perf_counter() - debut, receveur=nom)
+
+    return receveur_mesure
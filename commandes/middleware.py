@@ -0,0 +1,11 @@
+from .diffusion import diffuseur_stock
+
+class RegroupementStockMiddleware:
+    """ Regroupe toutes les modifications de stock d'une requête en une seule diffusion WebSocket """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with diffuseur_stock.regrouper():
+            return self.get_response(request)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='temperature',
+            name='date_heure',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='TemperatureAgregat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 heure'), ('1j', '1 jour')], max_length=2)),
+                ('debut', models.DateTimeField(help_text="Début de l'intervalle")),
+                ('nombre', models.PositiveIntegerField(default=0, help_text='Nombre de mesures agrégées')),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_somme', models.FloatField(default=0)),
+                ('humidite_min', models.FloatField()),
+                ('humidite_max', models.FloatField()),
+                ('humidite_somme', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'debut'), name='agregat_unique_par_intervalle')],
+            },
+        ),
+    ]
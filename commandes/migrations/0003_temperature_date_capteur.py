@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0002_temperature_series'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='temperature',
+            name='date_heure',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
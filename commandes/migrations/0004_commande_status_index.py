@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0003_temperature_date_capteur'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commande',
+            name='status',
+            field=models.CharField(choices=[('en attente', 'En attente'), ('ticket imprimé', 'Ticket imprimé'), ('validée', 'Validée'), ('en cuisson', 'En cuisson'), ('terminée', 'Terminée')], db_index=True, default='en attente', max_length=20),
+        ),
+    ]
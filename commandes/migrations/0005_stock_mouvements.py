@@ -0,0 +1,39 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0004_commande_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='mouvements_jusqua',
+            field=models.BigIntegerField(default=0, help_text='Dernier mouvement intégré à quantite_stock'),
+        ),
+        migrations.AlterField(
+            model_name='produit',
+            name='quantite_stock',
+            field=models.IntegerField(default=0, help_text='Stock à la dernière compaction'),
+        ),
+        migrations.CreateModel(
+            name='MouvementStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.IntegerField(help_text='Variation du stock (négative pour une consommation)')),
+                ('motif', models.CharField(choices=[('ajout', 'Ajout'), ('consommation', 'Consommation'), ('correction', 'Correction')], max_length=20)),
+                ('date_heure', models.DateTimeField(default=django.utils.timezone.now)),
+                ('commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements', to='commandes.commande')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements', to='commandes.produit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['produit', 'id'], name='mouvement_produit_id')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0005_stock_mouvements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(help_text='Fonction à appeler (chemin importable)', max_length=200)),
+                ('arguments', models.JSONField(default=list)),
+                ('etat', models.CharField(choices=[('en attente', 'En attente'), ('en cours', 'En cours'), ('échouée', 'Échouée')], default='en attente', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['etat', 'prochain_essai'], name='tache_etat_essai')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0006_taches_durables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionRessource',
+            fields=[
+                ('nom', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, help_text='Dernière modification de la ressource')),
+            ],
+        ),
+    ]
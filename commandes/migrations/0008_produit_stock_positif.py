@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commandes', '0007_versions_ressources'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='produit',
+            constraint=models.CheckConstraint(condition=models.Q(('quantite_stock__gte', 0)), name='produit_stock_positif'),
+        ),
+    ]
@@ -1,9 +1,25 @@
-from django.db import models
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from django.db.models.signals import m2m_changed, pre_save
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
+from . import versions
+from .metriques import instrumenter
+from .diffusion import diffuseur_stock, publier_commandes
+from .taches import executeur
+
+class ProduitQuerySet(models.QuerySet):
+    def avec_stock(self):
+        """ 🔹 Annote `stock` : instantané + mouvements postérieurs à la dernière compaction (une sous-requête indexée) """
+        queue = (
+            MouvementStock.objects.filter(produit=OuterRef("pk"), pk__gt=OuterRef("mouvements_jusqua"))
+            .order_by()
+            .values("produit")
+            .annotate(total=models.Sum("quantite"))
+            .values("total")
+        )
+        return self.annotate(stock=F("quantite_stock") + Coalesce(Subquery(queue), Value(0)))
 
 class Produit(models.Model):
     """ Modèle représentant un produit individuel """
@@ -24,27 +40,43 @@ class Produit(models.Model):
     nom = models.CharField(max_length=100, unique=True)  # ✅ Nom unique
     taille = models.CharField(max_length=10, choices=TAILLE_CHOICES)  
     poids = models.FloatField(help_text="Poids en grammes")  
-    quantite_stock = models.PositiveIntegerField(default=0)  
+    # 🔹 Instantané du stock : le solde réel ajoute les mouvements pas encore compactés (voir stock.py)
+    quantite_stock = models.IntegerField(default=0, help_text="Stock à la dernière compaction")
+    mouvements_jusqua = models.BigIntegerField(default=0, help_text="Dernier mouvement intégré à quantite_stock")
     couleur = models.CharField(max_length=10, choices=COULEUR_CHOICES, default="Jaune")  
 
+    objects = ProduitQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # 🔹 Garde-fou : la consommation est plafonnée au solde (stock.consommer_stocks)
+            models.CheckConstraint(condition=models.Q(quantite_stock__gte=0), name="produit_stock_positif"),
+        ]
+
     def __str__(self):
-        return f"{self.nom} ({self.taille}, {self.couleur}) - {self.poids}g - Stock: {self.quantite_stock}"
+        return f"{self.nom} ({self.taille}, {self.couleur}) - {self.poids}g - Stock: {getattr(self, 'stock', self.quantite_stock)}"
 
     @classmethod
     def get_stock_total(cls):
         """ Retourne la somme de tous les produits en stock """
-        return cls.objects.aggregate(total_stock=models.Sum("quantite_stock"))["total_stock"] or 0
+        return cls.objects.avec_stock().aggregate(total_stock=models.Sum("stock"))["total_stock"] or 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        produit = super().from_db(db, field_names, values)
+        produit._poids_initial = produit.__dict__.get("poids")  # Pour détecter un changement de poids
+        return produit
 
     def save(self, *args, **kwargs):
-        """ 🔹 Sauvegarde et envoie une mise à jour du stock via WebSocket """
+        """ 🔹 Sauvegarde et signale le changement de stock (diffusion WebSocket regroupée) """
         super().save(*args, **kwargs)
+        diffuseur_stock.signaler(self.pk)
 
-        # 🔹 Envoi de la mise à jour WebSocket pour le stock
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "stock_updates",
-            {"type": "send_stock_update"}
-        )
+        if getattr(self, "_poids_initial", self.poids) != self.poids:
+            # 🔹 Le nouveau poids est répercuté sur tous les sandwiches qui utilisent ce produit
+            from . import recettes
+            recettes.planifier_recalcul(recettes.sandwiches_du_produit(self.pk))
+        self._poids_initial = self.poids
 
 class Sandwich(models.Model):
     """ Modèle représentant un sandwich composé de plusieurs produits """
@@ -64,10 +96,41 @@ class Sandwich(models.Model):
         return f"{self.nom} ({self.taille}) - {self.poids_total}g"
 
 @receiver(m2m_changed, sender=Sandwich.produits.through)
-def update_sandwich_poids(sender, instance, **kwargs):
-    """ 🔹 Met à jour le poids total du sandwich quand les produits changent """
-    instance.poids_total = sum(produit.poids for produit in instance.produits.all())
-    instance.save()
+@instrumenter
+def update_sandwich_poids(sender, instance, action, reverse, pk_set, **kwargs):
+    """ 🔹 Met à jour le poids total du sandwich quand les produits changent (une fois, après commit) """
+    from . import recettes  # Import local : recettes.py importe les modèles
+
+    if reverse and action == "pre_clear":
+        # produit.sandwich_set.clear() : on retient les sandwiches avant qu'ils ne soient détachés
+        instance._sandwiches_detaches = recettes.sandwiches_du_produit(instance.pk)
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        recettes.planifier_recalcul([instance.pk])
+    elif action == "post_clear":
+        recettes.planifier_recalcul(getattr(instance, "_sandwiches_detaches", []))
+    else:
+        recettes.planifier_recalcul(pk_set)
+
+@receiver(post_save, sender=Sandwich)
+@receiver(post_delete, sender=Sandwich)
+@instrumenter
+def invalider_recette(sender, instance, **kwargs):
+    """ 🔹 La nomenclature en cache n'est plus valable après une modification du sandwich """
+    from . import recettes
+    recettes.invalider([instance.pk])
+    versions.incrementer("sandwiches")
+
+@receiver(post_delete, sender=Produit)
+@instrumenter
+def versionner_suppression_produit(sender, instance, **kwargs):
+    from .disponibilite import index_disponibilite  # Import local : disponibilite.py importe les modèles
+
+    produit_id = instance.pk
+    transaction.on_commit(lambda: index_disponibilite.produits_modifies([produit_id]))
+    versions.incrementer("produits", "sandwiches")
 
 class Commande(models.Model):
     """ Modèle représentant une commande d'un ou plusieurs sandwiches """
@@ -83,27 +146,78 @@ class Commande(models.Model):
     sandwich = models.ForeignKey(Sandwich, on_delete=models.CASCADE)  
     quantite = models.PositiveIntegerField(default=1)  
     poids_total = models.FloatField(default=0, help_text="Poids total de la commande en grammes")  
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="en attente")  
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="en attente", db_index=True)  
     date_commande = models.DateTimeField(auto_now_add=True)  
 
     def __str__(self):
         return f"Commande {self.id} - {self.sandwich.nom} x {self.quantite} - {self.poids_total}g - {self.status}"
 
 @receiver(pre_save, sender=Commande)
+@instrumenter
 def update_commande_poids(sender, instance, **kwargs):
     """ 🔹 Met à jour automatiquement le poids total de la commande avant de sauvegarder """
-    if instance.sandwich:
-        instance.poids_total = instance.sandwich.poids_total * instance.quantite
+    if instance.sandwich_id:
+        from .recettes import nomenclature  # Poids du sandwich lu dans le cache, sans requête
+        recette = nomenclature(instance.sandwich_id)
+        if recette is not None:
+            instance.poids_total = recette["poids_total"] * instance.quantite
 
 @receiver(pre_save, sender=Commande)
+@instrumenter
 def update_stock_on_terminer(sender, instance, **kwargs):
-    """ 🔹 Diminue le stock des produits lorsque la commande passe en statut 'terminée' """
-    if instance.pk:
-        ancienne_commande = Commande.objects.filter(pk=instance.pk).first()
-        if ancienne_commande and ancienne_commande.status != "terminée" and instance.status == "terminée":
-            for produit in instance.sandwich.produits.all():
-                produit.quantite_stock -= instance.quantite
-                produit.save()
+    """ 🔹 Repère le passage en statut 'terminée' : le stock sera diminué une fois la commande enregistrée """
+    instance._vient_de_terminer = False
+    if instance.pk and instance.status == "terminée":
+        ancien_statut = Commande.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+        instance._vient_de_terminer = ancien_statut is not None and ancien_statut != "terminée"
+
+@receiver(post_save, sender=Commande)
+@instrumenter
+def consommer_stock_commande(sender, instance, **kwargs):
+    """ 🔹 Consommation des ingrédients en tâche durable, exécutée après le commit hors de la requête """
+    if getattr(instance, "_vient_de_terminer", False):
+        instance._vient_de_terminer = False
+        from .stock import consommer_stock  # Import local : stock.py importe les modèles
+        executeur.apres_commit(consommer_stock, instance.sandwich_id, instance.quantite, instance.pk, durable=True)
+
+@receiver(post_save, sender=Commande)
+@instrumenter
+def diffuser_commande(sender, instance, **kwargs):
+    """ 🔹 Pousse la commande créée ou modifiée aux écrans de la cuisine et du retrait """
+    publier_commandes([(instance.pk, instance.status, instance.sandwich_id, instance.quantite)])
+
+@receiver(post_delete, sender=Commande)
+@instrumenter
+def diffuser_suppression_commande(sender, instance, **kwargs):
+    publier_commandes([(instance.pk, None, None, None)])
+
+class MouvementStock(models.Model):
+    """ Mouvement du journal de stock : insertion seule, jamais modifié ni supprimé """
+
+    MOTIF_CHOICES = [
+        ("ajout", "Ajout"),
+        ("consommation", "Consommation"),
+        ("correction", "Correction"),
+    ]
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name="mouvements")
+    quantite = models.IntegerField(help_text="Variation du stock (négative pour une consommation)")
+    motif = models.CharField(max_length=20, choices=MOTIF_CHOICES)
+    commande = models.ForeignKey("Commande", null=True, blank=True, on_delete=models.SET_NULL, related_name="mouvements")
+    date_heure = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["produit", "id"], name="mouvement_produit_id")]  # 🔹 Queue non compactée d'un produit
+
+    def __str__(self):
+        return f"{self.produit_id} {self.quantite:+d} ({self.motif})"
+
+@receiver(post_save, sender=MouvementStock)
+@instrumenter
+def signaler_mouvement(sender, instance, created, **kwargs):
+    """ Mouvement saisi un par un (admin) : diffusion du nouveau solde ; les lots passent par stock.py """
+    if created:
+        diffuseur_stock.signaler(instance.produit_id)
 
 class Addstock(models.Model):
     nom = models.CharField(max_length=100)
@@ -118,10 +232,117 @@ class Addstock(models.Model):
 class Temperature(models.Model):
     """ Modèle représentant la température enregistrée """
     
-    date_heure = models.DateTimeField(auto_now_add=True)
+    date_heure = models.DateTimeField(default=timezone.now, db_index=True)  # 🔹 Index pour les requêtes par période
     temperature = models.FloatField(help_text="Température en degrés Celsius")
     humidite = models.FloatField(help_text="Humidité en pourcentage")
     created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"Conditions du {self.date_heure.strftime('%Y-%m-%d %H:%M:%S')} - Temp: {self.temperature}°C, Humidité: {self.humidite}%"
+
+@receiver(pre_save, sender=Temperature)
+def memoriser_temperature(sender, instance, **kwargs):
+    """ Valeurs enregistrées avant une modification, pour corriger les agrégats """
+    if instance.pk is not None:
+        instance._mesure_precedente = (
+            Temperature.objects.filter(pk=instance.pk).values_list("date_heure", "temperature", "humidite").first()
+        )
+
+@receiver(post_save, sender=Temperature)
+@instrumenter
+def agreger_temperature(sender, instance, created, **kwargs):
+    """ 🔹 Met à jour les agrégats 1m / 1h / 1j et pousse la mesure aux clients WebSocket """
+    from .series import agreger, corriger, publier  # Import local : series.py importe les modèles
+
+    mesure = (instance.date_heure, instance.temperature, instance.humidite)
+    precedente = getattr(instance, "_mesure_precedente", None)
+    if created or precedente is None:
+        agreger([mesure])
+        publier([instance])
+    elif precedente != mesure:
+        corriger([precedente], [mesure])
+
+@receiver(post_delete, sender=Temperature)
+def desagreger_temperature(sender, instance, **kwargs):
+    """ Mesure supprimée (API, admin) : retirée des agrégats ; la purge ne passe pas par ce signal """
+    from .series import corriger
+
+    corriger([(instance.date_heure, instance.temperature, instance.humidite)], [])
+
+
+class TemperatureAgregat(models.Model):
+    """ Agrégat des mesures de température sur un intervalle (1 minute, 1 heure ou 1 jour) """
+
+    RESOLUTION_CHOICES = [
+        ("1m", "1 minute"),
+        ("1h", "1 heure"),
+        ("1j", "1 jour"),
+    ]
+
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    debut = models.DateTimeField(help_text="Début de l'intervalle")
+    nombre = models.PositiveIntegerField(default=0, help_text="Nombre de mesures agrégées")
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_somme = models.FloatField(default=0)
+    humidite_min = models.FloatField()
+    humidite_max = models.FloatField()
+    humidite_somme = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # 🔹 Sert aussi d'index pour les requêtes par période
+            models.UniqueConstraint(fields=["resolution", "debut"], name="agregat_unique_par_intervalle"),
+        ]
+
+    @property
+    def temperature_moyenne(self):
+        return self.temperature_somme / self.nombre if self.nombre else None
+
+    @property
+    def humidite_moyenne(self):
+        return self.humidite_somme / self.nombre if self.nombre else None
+
+    def __str__(self):
+        return f"Agrégat {self.resolution} du {self.debut.strftime('%Y-%m-%d %H:%M')} - {self.nombre} mesures"
+
+class Tache(models.Model):
+    """ Tâche durable de l'exécuteur (taches.py) : écrite dans la transaction de la modification
+
+    Supprimée dans la transaction qui applique ses effets ; une tâche encore
+    présente est en attente, en cours (réservée jusqu'à `prochain_essai`) ou
+    échouée après toutes ses tentatives.
+    """
+
+    ETAT_CHOICES = [
+        ("en attente", "En attente"),
+        ("en cours", "En cours"),
+        ("échouée", "Échouée"),
+    ]
+
+    nom = models.CharField(max_length=200, help_text="Fonction à appeler (chemin importable)")
+    arguments = models.JSONField(default=list)
+    etat = models.CharField(max_length=20, choices=ETAT_CHOICES, default="en attente")
+    tentatives = models.PositiveIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["etat", "prochain_essai"], name="tache_etat_essai")]  # 🔹 Tâches dues
+
+    def __str__(self):
+        return f"{self.nom}{tuple(self.arguments)} - {self.etat} ({self.tentatives} échec(s))"
+
+class VersionRessource(models.Model):
+    """ Compteur de version d'une ressource en base (versions.py avec VERSIONS_CACHE = None)
+
+    Partagé par tous les processus : incrémenté par un UPDATE atomique après chaque commit.
+    """
+
+    nom = models.CharField(max_length=30, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    date = models.DateTimeField(default=timezone.now, help_text="Dernière modification de la ressource")
+
+    def __str__(self):
+        return f"{self.nom} v{self.version}"
@@ -0,0 +1,29 @@
+from rest_framework.pagination import CursorPagination
+
+class CurseurPagination(CursorPagination):
+    """ 🔹 Pagination par curseur (keyset) : `WHERE colonne < position ORDER BY colonne LIMIT n`
+
+    Le coût d'une page ne dépend pas de sa position dans la table, contrairement
+    à OFFSET. La colonne de tri (indexée) est donnée par `ordre_curseur` sur la vue.
+
+    Sur une vue `pagination_toujours` (tables qui grandissent sans fin : commandes,
+    températures), chaque liste est paginée, `page_size` par défaut ; l'historique
+    complet se lit en flux par /api/export/. Ailleurs, la pagination n'est activée
+    que si la requête contient `cursor` ou `page_size` : sans ces paramètres, les
+    petites listes (produits, sandwiches) restent des tableaux complets.
+    Réponse paginée : {"next", "previous", "results"}.
+    """
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = "-id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        explicite = self.cursor_query_param in params or self.page_size_query_param in params
+        if not explicite and not getattr(view, "pagination_toujours", False):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        return (getattr(view, "ordre_curseur", self.ordering),)
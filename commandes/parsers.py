@@ -0,0 +1,23 @@
+import json
+from rest_framework.parsers import BaseParser
+
+class NDJSONParser(BaseParser):
+    """ Parse un corps NDJSON (un objet JSON par ligne) en liste
+
+    Une ligne invalide donne None au lieu de faire échouer toute la requête :
+    l'appelant peut ainsi la rejeter individuellement.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        points = []
+        for ligne in stream:
+            ligne = ligne.strip()
+            if not ligne:
+                continue
+            try:
+                points.append(json.loads(ligne))
+            except ValueError:
+                points.append(None)
+        return points
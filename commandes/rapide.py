@@ -0,0 +1,129 @@
+from functools import cached_property
+from django.views.decorators.gzip import gzip_page
+from rest_framework import serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from .models import Produit
+from .serializers import ProduitSerializer, SandwichSerializer, CommandeSerializer, champs_demandes
+
+# Champs dont la valeur lue par values() n'est pas déjà celle du JSON
+CONVERSIONS = (serializers.DateTimeField, serializers.DateField, serializers.TimeField, serializers.DecimalField)
+
+class Lecture:
+    """ 🔹 Lecture sans ModelSerializer : dicts construits depuis values() avec un plan calculé une fois
+
+    Le plan est déduit du serializer DRF de la ressource (mêmes clés dans le même
+    ordre, même format des dates) : [(clé, colonne, conversion ou None)]. Les
+    serializers imbriqués (colonne None) sont remplis par `completer()`, en une
+    requête pour toute la liste.
+    """
+
+    def __init__(self, serializer_class, sources=None):
+        self.serializer_class = serializer_class
+        self.sources = sources or {}  # clé -> colonne quand elle diffère de la source du champ
+
+    @cached_property
+    def plan(self):
+        plan = []
+        for cle, champ in self.serializer_class().fields.items():
+            if champ.write_only:
+                continue
+            if isinstance(champ, serializers.BaseSerializer):
+                plan.append((cle, None, None))
+                continue
+            conversion = champ.to_representation if isinstance(champ, CONVERSIONS) else None
+            plan.append((cle, self.sources.get(cle, champ.source), conversion))
+        return plan
+
+    def colonnes(self, champs=None, prefixe=""):
+        """ Colonnes à passer à values() (avec `prefixe` pour une lecture par JOIN) """
+        return [prefixe + colonne for colonne in dict.fromkeys(["id", *(colonne for _, colonne, _ in self.plan if colonne)])]
+
+    def construire(self, valeurs, champs=None, prefixe=""):
+        """ Liste de dicts prêts à rendre ; `champs` (?fields=) ne filtre que la ressource racine """
+        valeurs = list(valeurs)
+        plan = [
+            (cle, colonne and prefixe + colonne, conversion)
+            for cle, colonne, conversion in self.plan if champs is None or cle in champs
+        ]
+        lignes = [
+            {
+                cle: None if colonne is None  # Place de l'imbriqué, dans l'ordre du serializer
+                else conversion(ligne[colonne]) if conversion is not None and ligne[colonne] is not None
+                else ligne[colonne]
+                for cle, colonne, conversion in plan
+            }
+            for ligne in valeurs
+        ]
+        self.completer(valeurs, lignes, champs, prefixe)
+        return lignes
+
+    def completer(self, valeurs, lignes, champs, prefixe):
+        pass
+
+class LectureSandwiches(Lecture):
+    def completer(self, valeurs, lignes, champs, prefixe):
+        """ Produits de tous les sandwiches en une requête (comme le Prefetch de SandwichViewSet) """
+        if champs is not None and "produits" not in champs:
+            return
+        ids = {ligne[prefixe + "id"] for ligne in valeurs}
+        par_sandwich = {sandwich_id: [] for sandwich_id in ids}
+        produits = list(Produit.objects.avec_stock().filter(sandwich__in=ids).values("sandwich", *LECTURE_PRODUITS.colonnes()))
+        for produit, valeur in zip(LECTURE_PRODUITS.construire(produits), produits):
+            par_sandwich[valeur["sandwich"]].append(produit)
+        for ligne, valeur in zip(lignes, valeurs):
+            ligne["produits"] = par_sandwich[valeur[prefixe + "id"]]
+
+class LectureCommandes(Lecture):
+    """ Le sandwich est lu par JOIN avec la commande, ses produits en une seconde requête """
+
+    def colonnes(self, champs=None, prefixe=""):
+        if champs is not None and "sandwich" not in champs:
+            return super().colonnes(champs, prefixe)  # 🔹 Sandwich non demandé : pas de JOIN
+        return super().colonnes(champs, prefixe) + LECTURE_SANDWICHES.colonnes(prefixe=prefixe + "sandwich__")
+
+    def completer(self, valeurs, lignes, champs, prefixe):
+        if champs is not None and "sandwich" not in champs:
+            return
+        for ligne, sandwich in zip(lignes, LECTURE_SANDWICHES.construire(valeurs, prefixe=prefixe + "sandwich__")):
+            ligne["sandwich"] = sandwich
+
+LECTURE_PRODUITS = Lecture(ProduitSerializer, sources={"quantite_stock": "stock"})
+LECTURE_SANDWICHES = LectureSandwiches(SandwichSerializer)
+LECTURE_COMMANDES = LectureCommandes(CommandeSerializer)
+
+class LectureRapideMixin:
+    """ list / retrieve d'un ViewSet par le chemin rapide, réglable vue par vue :
+
+    - `lecture` : la Lecture de la ressource (None = serializer DRF) ;
+    - `compression_gzip` : réponses compressées si le client accepte gzip.
+
+    Mêmes filtres, pagination par curseur et `?fields=` que le chemin DRF.
+    """
+    lecture = None
+    compression_gzip = False
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.compression_gzip:
+            # 🔹 Autour du cache des réponses : les octets gardés en cache restent non compressés
+            return gzip_page(super().dispatch)(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def valeurs(self):
+        colonnes = self.lecture.colonnes(champs_demandes(self.request))
+        return self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*colonnes)
+
+    def list(self, request, *args, **kwargs):
+        if self.lecture is None:
+            return super().list(request, *args, **kwargs)
+        valeurs = self.valeurs()
+        page = self.paginate_queryset(valeurs)
+        donnees = self.lecture.construire(valeurs if page is None else page, champs_demandes(request))
+        return Response(donnees) if page is None else self.get_paginated_response(donnees)
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.lecture is None:
+            return super().retrieve(request, *args, **kwargs)
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        valeur = get_object_or_404(self.valeurs(), **{self.lookup_field: self.kwargs[lookup]})
+        return Response(self.lecture.construire([valeur], champs_demandes(request))[0])
@@ -0,0 +1,90 @@
+import threading
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Sandwich
+from . import versions
+
+_en_attente = threading.local()
+
+def cle(sandwich_id, version):
+    return f"recette:{version}:{sandwich_id}"
+
+def _version():
+    """ 🔹 Version "sandwiches" (partagée entre processus, voir versions.py) : elle fait partie des clés
+
+    Le cache des nomenclatures est propre au processus : un changement de recette
+    fait dans un autre processus change la version, donc les clés lues ici.
+    """
+    return versions.lire(["sandwiches"])["sandwiches"][0]
+
+def planifier_recalcul(sandwich_ids):
+    """ 🔹 Recalcule le poids des sandwiches une seule fois, après le commit
+
+    Un `produits.set()` déclenche post_remove puis post_add : les ids sont
+    regroupés et le premier callback de commit traite tout le lot. Un recalcul
+    en trop (transaction annulée) est sans conséquence : il est idempotent.
+    """
+    ids = getattr(_en_attente, "ids", None)
+    if ids is None:
+        ids = _en_attente.ids = set()
+    ids.update(sandwich_ids)
+    invalider(sandwich_ids)
+    transaction.on_commit(_vider)
+
+def _vider():
+    ids, _en_attente.ids = getattr(_en_attente, "ids", None), set()
+    if ids:
+        recalculer_poids(ids)
+
+def recalculer_poids(sandwich_ids):
+    """ 🔹 Recalcule le poids total de plusieurs sandwiches en un seul UPDATE (somme côté base) """
+    somme = (
+        Sandwich.produits.through.objects.filter(sandwich_id=OuterRef("pk"))
+        .values("sandwich_id")
+        .annotate(total=Sum("produit__poids"))
+        .values("total")
+    )
+    Sandwich.objects.filter(pk__in=sandwich_ids).update(poids_total=Coalesce(Subquery(somme), Value(0.0)))
+    invalider(sandwich_ids)
+    versions.incrementer("sandwiches")
+
+def sandwiches_du_produit(produit_id):
+    return list(Sandwich.produits.through.objects.filter(produit_id=produit_id).values_list("sandwich_id", flat=True))
+
+def invalider(sandwich_ids):
+    from .disponibilite import index_disponibilite  # Import local : disponibilite.py importe ce module
+
+    version = _version()
+    cache.delete_many([cle(sandwich_id, version) for sandwich_id in sandwich_ids])  # Avant le commit, dans ce processus
+    ids = list(sandwich_ids)
+    transaction.on_commit(lambda: index_disponibilite.recettes_modifiees(ids))
+
+def nomenclatures(sandwich_ids):
+    """ 🔹 Nomenclature de plusieurs sandwiches : {id: {"nom", "poids_total", "produits": [ids]}}
+
+    Lue dans le cache ; seuls les sandwiches absents du cache sont chargés, en deux requêtes.
+    """
+    version = _version()
+    cles = {cle(sandwich_id, version): sandwich_id for sandwich_id in sandwich_ids}
+    trouvees = cache.get_many(cles)
+    resultat = {cles[c]: recette for c, recette in trouvees.items()}
+
+    manquants = [sandwich_id for c, sandwich_id in cles.items() if c not in trouvees]
+    if manquants:
+        recettes = {
+            sandwich_id: {"nom": nom, "poids_total": poids_total, "produits": []}
+            for sandwich_id, nom, poids_total in Sandwich.objects.filter(pk__in=manquants).values_list("id", "nom", "poids_total")
+        }
+        liens = Sandwich.produits.through.objects.filter(sandwich_id__in=recettes).values_list("sandwich_id", "produit_id")
+        for sandwich_id, produit_id in liens:
+            recettes[sandwich_id]["produits"].append(produit_id)
+        cache.set_many({cle(sandwich_id, version): recette for sandwich_id, recette in recettes.items()}, timeout=None)
+        resultat.update(recettes)
+
+    return resultat
+
+def nomenclature(sandwich_id):
+    """ Nomenclature d'un sandwich, ou None s'il n'existe pas """
+    return nomenclatures([sandwich_id]).get(sandwich_id)
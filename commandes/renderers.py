@@ -0,0 +1,23 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson  # requirements.txt ; le rendu DRF reste le repli s'il manque
+except ImportError:
+    orjson = None
+
+class JSONRapideRenderer(JSONRenderer):
+    """ 🔹 Même JSON compact que JSONRenderer, encodé par orjson s'il est installé
+
+    Sans orjson, ou quand une indentation est demandée (API navigable,
+    `Accept: application/json; indent=4`), le rendu DRF habituel est utilisé.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        contenu = orjson.dumps(data, default=encoders.JSONEncoder().default)
+        # Comme JSONRenderer : U+2028 / U+2029 échappés pour rester un sous-ensemble de JavaScript
+        if b"\xe2\x80\xa8" in contenu or b"\xe2\x80\xa9" in contenu:
+            contenu = contenu.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return contenu
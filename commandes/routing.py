@@ -1,6 +1,8 @@
 from django.urls import path
-from .consumers import StockConsumer
+from .consumers import CommandesConsumer, StockConsumer, TemperatureConsumer
 
 websocket_urlpatterns = [
     path('ws/stock/', StockConsumer.as_asgi()),  # Route WebSocket pour le stock
+    path('ws/temperature/', TemperatureConsumer.as_asgi()),  # Mesures de température en direct
+    path('ws/commandes/', CommandesConsumer.as_asgi()),  # File des commandes (cuisine, retrait)
 ]
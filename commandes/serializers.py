@@ -1,12 +1,78 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from .models import Produit, Sandwich, Commande, Addstock, Temperature
+from . import stock
+from . import disponibilite
+
+def champs_demandes(request):
+    """ Champs demandés avec `?fields=id,nom` (lecture seulement), ou None pour tous """
+    if request is None or request.method != "GET" or not request.query_params.get("fields"):
+        return None
+    return {champ.strip() for champ in request.query_params["fields"].split(",") if champ.strip()}
+
+class ChampsDynamiquesMixin:
+    """ 🔹 Sparse fieldset : seuls les champs de `?fields=` sont construits et sérialisés
+
+    Un serializer imbriqué absent de la liste n'est jamais instancié. Ne s'applique
+    qu'au serializer racine (les imbriqués n'ont pas de contexte de requête).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        champs = champs_demandes(self.context.get("request"))
+        if champs is not None:
+            for champ in set(self.fields) - champs:
+                self.fields.pop(champ)
+
+class SoldeField(serializers.IntegerField):
+    """ Solde courant en lecture (annotation `stock` de Produit.objects.avec_stock()), solde voulu en écriture """
+
+    def get_attribute(self, instance):
+        solde = getattr(instance, "stock", None)
+        return solde if solde is not None else stock.solde(instance.pk)
+
+class ProduitListSerializer(serializers.ListSerializer):
+    """ 🔹 Produits sans annotation `stock` (réponses de création, relations non préchargées) : soldes lus en une requête """
+
+    def to_representation(self, data):
+        produits = list(data.all() if hasattr(data, "all") else data)
+        sans_solde = [produit.pk for produit in produits if getattr(produit, "stock", None) is None]
+        if sans_solde:
+            soldes = stock.soldes(sans_solde)
+            for produit in produits:
+                if produit.pk in soldes:
+                    produit.stock = soldes[produit.pk]
+        return super().to_representation(produits)
+
+class ProduitSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    quantite_stock = SoldeField(min_value=0, required=False)
 
-class ProduitSerializer(serializers.ModelSerializer):
     class Meta:
         model = Produit
-        fields = '__all__'  # Inclut tous les champs du modèle
+        exclude = ['mouvements_jusqua']  # Tous les champs sauf le repère interne de compaction
+        list_serializer_class = ProduitListSerializer
 
-class SandwichSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        """ 🔹 Le stock initial est un mouvement « ajout » du journal """
+        quantite = validated_data.pop('quantite_stock', 0)
+        with transaction.atomic():
+            produit = super().create(validated_data)
+            if quantite:
+                stock.ajouter(produit.pk, quantite)
+        return produit
+
+    def update(self, instance, validated_data):
+        """ 🔹 Un nouveau stock est un mouvement « correction » (écart avec le solde courant) """
+        quantite = validated_data.pop('quantite_stock', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if quantite is not None:
+                stock.corriger(instance.pk, quantite)
+                instance.stock = quantite
+        return instance
+
+class SandwichSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     produits = ProduitSerializer(many=True, read_only=True)  # 🔥 Retourne les produits sous forme d’objets
     produits_ids = serializers.PrimaryKeyRelatedField(
         queryset=Produit.objects.all(),
@@ -21,8 +87,10 @@ class SandwichSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """ 🔹 Permet d'ajouter un sandwich avec ses produits """
         produits_data = validated_data.pop('produits_ids', [])  # Récupérer les produits sélectionnés (IDs)
-        sandwich = Sandwich.objects.create(**validated_data)  # Créer le sandwich
-        sandwich.produits.set(produits_data)  # Associer les produits
+        with transaction.atomic():  # 🔹 Poids recalculé une seule fois, au commit
+            sandwich = Sandwich.objects.create(**validated_data)  # Créer le sandwich
+            sandwich.produits.set(produits_data)  # Associer les produits
+        sandwich.refresh_from_db(fields=["poids_total"])
         return sandwich
 
     def update(self, instance, validated_data):
@@ -31,13 +99,14 @@ class SandwichSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)  # Mettre à jour les autres champs
 
-        if produits_data is not None:
-            instance.produits.set(produits_data)  # Mettre à jour les produits liés
-
-        instance.save()
+        with transaction.atomic():  # 🔹 Poids recalculé une seule fois, au commit
+            instance.save()
+            if produits_data is not None:
+                instance.produits.set(produits_data)  # Mettre à jour les produits liés
+        instance.refresh_from_db(fields=["poids_total"])
         return instance
 
-class CommandeSerializer(serializers.ModelSerializer):
+class CommandeSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     sandwich = SandwichSerializer(read_only=True)  # 🔥 Affiche l'objet sandwich en GET
     sandwich_id = serializers.PrimaryKeyRelatedField(
         queryset=Sandwich.objects.all(),
@@ -48,32 +117,44 @@ class CommandeSerializer(serializers.ModelSerializer):
         model = Commande
         fields = '__all__'
 
+    def validate(self, attrs):
+        """ 🔹 Refuse une nouvelle commande en rupture : soldes de la recette relus en base (l'index en mémoire ne voit pas les autres processus) """
+        if self.instance is None and getattr(settings, "COMMANDE_REFUS_RUPTURE", True):
+            sandwich = attrs["sandwich_id"]
+            quantite = attrs.get("quantite", 1)
+            portions = disponibilite.portions(sandwich.pk)
+            if portions is not None and portions < quantite:
+                raise serializers.ValidationError(
+                    {"quantite": f"Stock insuffisant : {portions} portion(s) de {sandwich.nom} disponible(s)"}
+                )
+        return attrs
+
     def create(self, validated_data):
         """ 🔹 Permet de créer une commande avec un ID de sandwich """
         sandwich = validated_data.pop('sandwich_id')  # Récupérer l'ID du sandwich
         commande = Commande.objects.create(sandwich=sandwich, **validated_data)  # Associer le sandwich
         return commande
 
-class TemperatureSerializer(serializers.ModelSerializer):
+class TemperatureSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Temperature
         fields = ['date_heure', 'temperature', 'humidite']  # Utilise 'date_heure' au lieu de 'created_at'
 
-class AddstockSerializer(serializers.ModelSerializer):
+class AddstockSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Addstock
         fields = ['id', 'nom', 'taille', 'quantite_stock']
 
     def create(self, validated_data):
-        """ 🔹 Ajoute du stock à un produit existant ou crée un nouveau produit """
-        produit, created = Produit.objects.get_or_create(
-            nom=validated_data["nom"],
-            taille=validated_data.get("taille", "M"),  # Par défaut, taille moyenne
-            defaults={"quantite_stock": 0}  # Initialise la quantité à 0
-        )
-
-        # 🔹 Met à jour le stock
-        produit.quantite_stock += validated_data["quantite_stock"]
-        produit.save()
-        
+        """ 🔹 Ajoute du stock à un produit existant ou crée un nouveau produit (tout ou rien) """
+        with transaction.atomic():
+            produit, created = Produit.objects.get_or_create(
+                nom=validated_data["nom"],
+                taille=validated_data.get("taille", "M"),  # Par défaut, taille moyenne
+                defaults={"quantite_stock": 0}  # Initialise la quantité à 0
+            )
+
+            # 🔹 Mouvement « ajout » dans le journal du stock
+            stock.ajouter(produit.pk, validated_data["quantite_stock"])
+
         return produit
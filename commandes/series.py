@@ -0,0 +1,287 @@
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .diffusion import envoyer_groupe
+from .models import Temperature, TemperatureAgregat
+
+# 🔹 Durée de chaque intervalle d'agrégation
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1j": timedelta(days=1),
+}
+
+# Valeurs acceptées à l'ingestion
+BORNES = {
+    "temperature": (-50.0, 100.0),
+    "humidite": (0.0, 100.0),
+}
+
+# Nombre maximal de points retournés par /api/temperature/range/ en mode automatique
+POINTS_MAX = 500
+
+# Nombre maximal de mesures brutes par réponse : au-delà, la suite se lit à partir de "suivant"
+BRUT_MAX = 5000
+
+def tronquer(date_heure, resolution):
+    """ Début de l'intervalle contenant `date_heure` (en UTC) """
+    date_heure = date_heure.astimezone(dt_timezone.utc)
+    if resolution == "1m":
+        return date_heure.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return date_heure.replace(minute=0, second=0, microsecond=0)
+    return date_heure.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def agreger(points):
+    """ 🔹 Met à jour les agrégats 1m / 1h / 1j avec de nouvelles mesures
+
+    Les mesures sont d'abord regroupées en mémoire par intervalle : un lot de 500
+    mesures sur 2 minutes ne touche que 4 lignes d'agrégats (2 + 1 + 1).
+    `points` est une liste de (date_heure, temperature, humidite).
+    """
+    with transaction.atomic():
+        for (resolution, debut), valeurs in regrouper(points).items():
+            _fusionner(resolution, debut, *valeurs)
+
+def regrouper(points):
+    """ {(resolution, debut): [nombre, t_min, t_max, t_somme, h_min, h_max, h_somme]} des mesures `points` """
+    intervalles = {}
+    for date_heure, temperature, humidite in points:
+        for resolution in RESOLUTIONS:
+            cle = (resolution, tronquer(date_heure, resolution))
+            if cle not in intervalles:
+                intervalles[cle] = [0, temperature, temperature, 0.0, humidite, humidite, 0.0]
+            agregat = intervalles[cle]
+            agregat[0] += 1
+            agregat[1] = min(agregat[1], temperature)
+            agregat[2] = max(agregat[2], temperature)
+            agregat[3] += temperature
+            agregat[4] = min(agregat[4], humidite)
+            agregat[5] = max(agregat[5], humidite)
+            agregat[6] += humidite
+    return intervalles
+
+def _fusionner(resolution, debut, nombre, t_min, t_max, t_somme, h_min, h_max, h_somme):
+    """ Fusionne un agrégat partiel dans la ligne existante (un seul UPDATE), ou la crée """
+    mise_a_jour = dict(
+        nombre=F("nombre") + nombre,
+        temperature_min=Least("temperature_min", t_min),
+        temperature_max=Greatest("temperature_max", t_max),
+        temperature_somme=F("temperature_somme") + t_somme,
+        humidite_min=Least("humidite_min", h_min),
+        humidite_max=Greatest("humidite_max", h_max),
+        humidite_somme=F("humidite_somme") + h_somme,
+    )
+    intervalle = TemperatureAgregat.objects.filter(resolution=resolution, debut=debut)
+    if intervalle.update(**mise_a_jour):
+        return
+
+    try:
+        with transaction.atomic():
+            TemperatureAgregat.objects.create(
+                resolution=resolution, debut=debut, nombre=nombre,
+                temperature_min=t_min, temperature_max=t_max, temperature_somme=t_somme,
+                humidite_min=h_min, humidite_max=h_max, humidite_somme=h_somme,
+            )
+    except IntegrityError:
+        intervalle.update(**mise_a_jour)  # Créé entre-temps par une autre requête
+
+def corriger(retirees, ajoutees):
+    """ 🔹 Répercute la modification ou la suppression de mesures sur les agrégats
+
+    `retirees` / `ajoutees` : listes de (date_heure, temperature, humidite), valeurs
+    avant et après le changement. Un intervalle dont les mesures brutes sont encore
+    toutes conservées est recalculé depuis Temperature (min / max exacts) ; pour un
+    intervalle plus ancien que la rétention "brut", seuls le nombre et les sommes
+    sont corrigés (min / max restent des bornes).
+    """
+    duree = retention().get("brut")
+    limite = timezone.now() - duree if duree is not None else None
+    retraits, ajouts = regrouper(retirees), regrouper(ajoutees)
+
+    with transaction.atomic():
+        for resolution, debut in {*retraits, *ajouts}:
+            if limite is None or debut >= limite:
+                _recalculer(resolution, debut)
+                continue
+            if (resolution, debut) in retraits:
+                _soustraire(resolution, debut, *retraits[resolution, debut])
+            if (resolution, debut) in ajouts:
+                _fusionner(resolution, debut, *ajouts[resolution, debut])
+
+def _recalculer(resolution, debut):
+    """ Agrégat d'un intervalle relu depuis les mesures brutes (une requête), supprimé s'il est vide """
+    valeurs = Temperature.objects.filter(
+        date_heure__gte=debut, date_heure__lt=debut + RESOLUTIONS[resolution]
+    ).aggregate(
+        nombre=Count("id"),
+        temperature_min=Min("temperature"), temperature_max=Max("temperature"), temperature_somme=Sum("temperature"),
+        humidite_min=Min("humidite"), humidite_max=Max("humidite"), humidite_somme=Sum("humidite"),
+    )
+    intervalle = TemperatureAgregat.objects.filter(resolution=resolution, debut=debut)
+    if not valeurs["nombre"]:
+        intervalle.delete()
+    elif not intervalle.update(**valeurs):
+        TemperatureAgregat.objects.create(resolution=resolution, debut=debut, **valeurs)
+
+def _soustraire(resolution, debut, nombre, t_min, t_max, t_somme, h_min, h_max, h_somme):
+    intervalle = TemperatureAgregat.objects.filter(resolution=resolution, debut=debut)
+    intervalle.update(
+        nombre=F("nombre") - nombre,
+        temperature_somme=F("temperature_somme") - t_somme,
+        humidite_somme=F("humidite_somme") - h_somme,
+    )
+    intervalle.filter(nombre=0).delete()
+
+def valider_points(points):
+    """ 🔹 Valide un lot de mesures {date_heure, temperature, humidite} sans passer par DRF
+
+    Retourne (mesures valides, rejets) ; chaque rejet indique l'index du point et ses erreurs.
+    """
+    maintenant = timezone.now()
+    valides, rejets = [], []
+
+    for index, point in enumerate(points):
+        if not isinstance(point, dict):
+            rejets.append({"index": index, "erreurs": {"point": "Objet JSON attendu"}})
+            continue
+
+        erreurs = {}
+        valeurs = {}
+        for champ, (minimum, maximum) in BORNES.items():
+            valeur = point.get(champ)
+            if isinstance(valeur, bool) or not isinstance(valeur, (int, float)):
+                erreurs[champ] = "Nombre attendu"
+            elif not minimum <= valeur <= maximum:  # Exclut aussi NaN
+                erreurs[champ] = f"Doit être entre {minimum} et {maximum}"
+            else:
+                valeurs[champ] = float(valeur)
+
+        date_heure = point.get("date_heure")
+        if date_heure is None:
+            date_heure = maintenant
+        else:
+            date_heure = parse_datetime(date_heure) if isinstance(date_heure, str) else None
+            if date_heure is None:
+                erreurs["date_heure"] = "Date ISO 8601 attendue"
+            elif timezone.is_naive(date_heure):
+                date_heure = timezone.make_aware(date_heure)
+
+        if erreurs:
+            rejets.append({"index": index, "erreurs": erreurs})
+        else:
+            valides.append(Temperature(date_heure=date_heure, created_at=maintenant, **valeurs))
+
+    return valides, rejets
+
+def enregistrer(mesures):
+    """ 🔹 Insère les mesures par paquets (bulk_create), une transaction par paquet avec ses agrégats """
+    taille = getattr(settings, "TEMPERATURE_PAQUET", 500)
+    for i in range(0, len(mesures), taille):
+        paquet = mesures[i:i + taille]
+        with transaction.atomic():
+            Temperature.objects.bulk_create(paquet)
+            agreger([(m.date_heure, m.temperature, m.humidite) for m in paquet])
+            publier(paquet)
+
+def publier(mesures):
+    """ 🔹 Pousse les nouvelles mesures aux clients de ws/temperature/ (un message par lot, après commit) """
+    points = [
+        {
+            "date_heure": m.date_heure.isoformat(),
+            "t": m.date_heure.timestamp(),
+            "temperature": m.temperature,
+            "humidite": m.humidite,
+        }
+        for m in mesures
+    ]
+
+    def envoyer():
+        envoyer_groupe(
+            "temperature_updates",
+            {"type": "temperature_update", "lot": uuid.uuid4().hex, "points": points},
+            "temperature.diffusion", points=len(points),
+        )
+
+    transaction.on_commit(envoyer)
+
+def retention():
+    """ Durée de conservation par résolution ("brut" = mesures individuelles), None = illimitée """
+    jours = getattr(settings, "TEMPERATURE_RETENTION_JOURS", {})
+    return {resolution: timedelta(days=j) if j is not None else None for resolution, j in jours.items()}
+
+def purger(maintenant=None):
+    """ 🔹 Supprime les mesures et agrégats plus anciens que leur durée de conservation """
+    maintenant = maintenant or timezone.now()
+    supprimes = {}
+    for resolution, duree in retention().items():
+        if duree is None:
+            continue
+        limite = maintenant - duree
+        if resolution == "brut":
+            supprimes[resolution] = _supprimer_brut(limite)
+        else:
+            supprimes[resolution], _ = TemperatureAgregat.objects.filter(resolution=resolution, debut__lt=limite).delete()
+    return supprimes
+
+def _supprimer_brut(limite):
+    """ DELETE direct, sans les signaux de Temperature : la purge ne touche pas aux agrégats """
+    table = connection.ops.quote_name(Temperature._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE date_heure < %s", [limite])
+        return cursor.rowcount
+
+def choisir_resolution(debut, fin, maintenant=None):
+    """ 🔹 Résolution la moins coûteuse pour la période : la plus fine qui reste sous POINTS_MAX """
+    maintenant = maintenant or timezone.now()
+    durees = retention()
+    fenetre = fin - debut
+
+    def disponible(resolution):
+        duree = durees.get(resolution)
+        return duree is None or debut >= maintenant - duree
+
+    brut_max = getattr(settings, "TEMPERATURE_FENETRE_BRUTE", timedelta(hours=1))
+    if fenetre <= brut_max and disponible("brut"):
+        return "brut"
+    for resolution, pas in RESOLUTIONS.items():
+        if fenetre / pas <= POINTS_MAX and disponible(resolution):
+            return resolution
+    return "1j"
+
+def lire(debut, fin, resolution):
+    """ Points de la période à la résolution demandée, et la date de reprise (None si tout est lu)
+
+    Les mesures brutes sont limitées à BRUT_MAX par appel : la suite se lit avec
+    `debut` = date de reprise.
+    """
+    if resolution == "brut":
+        points = [
+            {"date_heure": p["date_heure"], "temperature": p["temperature"], "humidite": p["humidite"]}
+            for p in Temperature.objects.filter(date_heure__gte=debut, date_heure__lt=fin)
+            .order_by("date_heure", "id").values("date_heure", "temperature", "humidite")[:BRUT_MAX + 1]
+        ]
+        if len(points) > BRUT_MAX:
+            return points[:BRUT_MAX], points[BRUT_MAX]["date_heure"]
+        return points, None
+
+    return [
+        {
+            "date_heure": a.debut,
+            "temperature": a.temperature_moyenne,
+            "temperature_min": a.temperature_min,
+            "temperature_max": a.temperature_max,
+            "humidite": a.humidite_moyenne,
+            "humidite_min": a.humidite_min,
+            "humidite_max": a.humidite_max,
+            "nombre": a.nombre,
+        }
+        for a in TemperatureAgregat.objects.filter(
+            resolution=resolution, debut__gte=tronquer(debut, resolution), debut__lt=fin
+        ).order_by("debut")
+    ], None
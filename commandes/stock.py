@@ -0,0 +1,170 @@
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+from django.utils import timezone
+from .diffusion import diffuseur_stock
+from .journal import evenement
+from .models import MouvementStock, Produit
+from .recettes import nomenclatures
+from .taches import executeur
+
+logger = logging.getLogger(__name__)
+
+# Mouvements enregistrés par ce processus depuis la dernière compaction déclenchée
+_depuis_compaction = 0
+_verrou = threading.Lock()
+
+def consommer_stock(sandwich_id, quantite, commande_id=None):
+    """ 🔹 Enregistre la consommation de tous les ingrédients d'un sandwich
+
+    Un mouvement par ingrédient est inséré dans le journal : aucune ligne de
+    Produit n'est modifiée et deux commandes terminées en même temps ne peuvent
+    pas perdre de décrémentation. Une seule diffusion WebSocket est envoyée,
+    après le commit de la transaction.
+    """
+    consommer_stocks([(sandwich_id, quantite, commande_id)])
+
+def consommer_stocks(lignes):
+    """ 🔹 Consommation pour plusieurs (sandwich_id, quantite, commande_id) : un INSERT et une diffusion pour tout le lot
+
+    La consommation est plafonnée au solde : le stock ne descend jamais sous 0 ;
+    un manque est journalisé (« stock.rupture »). Le plafond est calculé par
+    l'INSERT lui-même (un INSERT ... SELECT sur le solde courant pour tout le lot),
+    sans verrouiller les lignes de Produit : une consommation ne bloque ni les
+    lectures ni les consommations d'autres produits. Sous PostgreSQL, la garantie
+    suppose le niveau SERIALIZABLE (SQLite n'a qu'un écrivain à la fois).
+    """
+    recettes = nomenclatures({sandwich_id for sandwich_id, _, _ in lignes})
+    besoins = [
+        (produit_id, quantite, commande_id)
+        for sandwich_id, quantite, commande_id in lignes
+        for produit_id in recettes.get(sandwich_id, {}).get("produits", [])
+    ]
+    if not besoins:
+        return
+
+    with transaction.atomic():
+        prises = _consommer(besoins, timezone.now())
+        demandes, consommees = {}, {}
+        for produit_id, quantite, commande_id in besoins:
+            demandes[produit_id, commande_id] = demandes.get((produit_id, commande_id), 0) + quantite
+        for produit_id, commande_id, prise in prises:
+            consommees[produit_id, commande_id] = consommees.get((produit_id, commande_id), 0) + prise
+        for (produit_id, commande_id), quantite in demandes.items():
+            prise = consommees.get((produit_id, commande_id), 0)
+            if prise < quantite:
+                evenement(
+                    logger, "stock.rupture", logging.WARNING,
+                    produit=produit_id, commande=commande_id, demande=quantite, consomme=prise,
+                )
+        if prises:
+            diffuseur_stock.signaler(*{produit_id for produit_id, _, _ in prises})
+    _compter(len(prises))
+
+def _consommer(besoins, maintenant):
+    """ 🔹 Un INSERT ... SELECT ... RETURNING pour tout le lot : chaque mouvement est plafonné au solde lu dans l'instruction
+
+    Le reste d'un produit pour une ligne est son solde moins les quantités demandées
+    par les lignes précédentes (somme cumulée) : deux lignes du lot sur le même
+    produit se partagent le solde. Retourne [(produit_id, commande_id, quantité prise)].
+    """
+    mouvements = connection.ops.quote_name(MouvementStock._meta.db_table)
+    produits = connection.ops.quote_name(Produit._meta.db_table)
+    valeurs = ", ".join(["(%s, %s, %s, %s)"] * len(besoins))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH besoins (rang, produit_id, quantite, commande_id) AS (VALUES {valeurs}), "
+            f"soldes AS ("
+            f" SELECT p.id, p.quantite_stock + COALESCE(("
+            f"  SELECT SUM(m.quantite) FROM {mouvements} m WHERE m.produit_id = p.id AND m.id > p.mouvements_jusqua"
+            f" ), 0) AS solde FROM {produits} p WHERE p.id IN (SELECT produit_id FROM besoins)"
+            f"), "
+            f"restes AS ("
+            f" SELECT b.rang, b.produit_id, b.quantite, b.commande_id, s.solde - COALESCE(SUM(b.quantite) OVER ("
+            f"  PARTITION BY b.produit_id ORDER BY b.rang ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING"
+            f" ), 0) AS reste FROM besoins b JOIN soldes s ON s.id = b.produit_id"
+            f") "
+            f"INSERT INTO {mouvements} (produit_id, quantite, motif, commande_id, date_heure) "
+            f"SELECT produit_id, -(CASE WHEN reste < quantite THEN reste ELSE quantite END), 'consommation', "
+            f"CAST(commande_id AS BIGINT), %s FROM restes WHERE reste > 0 ORDER BY rang "
+            f"RETURNING produit_id, commande_id, quantite",
+            [valeur for rang, (produit_id, quantite, commande_id) in enumerate(besoins)
+             for valeur in (rang, produit_id, quantite, commande_id)] + [maintenant],
+        )
+        return [(produit_id, commande_id, -quantite) for produit_id, commande_id, quantite in cursor.fetchall()]
+
+def ajouter(produit_id, quantite, motif="ajout"):
+    enregistrer([MouvementStock(produit_id=produit_id, quantite=quantite, motif=motif)])
+
+def corriger(produit_id, solde_voulu):
+    """ Inventaire : mouvement de correction qui amène le solde à `solde_voulu` """
+    with transaction.atomic():
+        ecart = solde_voulu - solde(produit_id)
+        if ecart:
+            ajouter(produit_id, ecart, motif="correction")
+
+def enregistrer(mouvements):
+    """ 🔹 Insère des mouvements en un seul INSERT et signale les produits touchés """
+    if not mouvements:
+        return
+    with transaction.atomic():
+        MouvementStock.objects.bulk_create(mouvements)
+        diffuseur_stock.signaler(*{mouvement.produit_id for mouvement in mouvements})
+    _compter(len(mouvements))
+
+def _compter(nombre):
+    """ Compaction en arrière-plan tous les STOCK_COMPACTAGE_SEUIL mouvements (0 = jamais, cron seulement) """
+    global _depuis_compaction
+    seuil = getattr(settings, "STOCK_COMPACTAGE_SEUIL", 1000)
+    with _verrou:
+        _depuis_compaction += nombre
+        if not seuil or _depuis_compaction < seuil:
+            return
+        _depuis_compaction = 0
+    transaction.on_commit(lambda: executeur.soumettre(compacter))
+
+def soldes(produit_ids=None):
+    """ {id: solde} : instantané + mouvements pas encore compactés (tous les produits si produit_ids est None) """
+    produits = Produit.objects.avec_stock()
+    if produit_ids is not None:
+        produits = produits.filter(pk__in=produit_ids)
+    return dict(produits.values_list("pk", "stock"))
+
+def solde(produit_id):
+    return soldes([produit_id]).get(produit_id)
+
+def compacter(delai=None):
+    """ 🔹 Intègre les mouvements dans l'instantané Produit.quantite_stock
+
+    Un UPDATE pour tous les produits touchés, dans une transaction : le solde lu
+    (instantané + queue) est le même avant et après. Les mouvements plus récents
+    que `delai` secondes (STOCK_COMPACTAGE_DELAI) restent dans la queue : avec un
+    serveur de base de données, une transaction plus ancienne encore en cours ne
+    peut pas être sautée. Les mouvements ne sont jamais supprimés : ils restent
+    l'historique du stock. Retourne le nombre de mouvements intégrés.
+    """
+    delai = getattr(settings, "STOCK_COMPACTAGE_DELAI", 1.0) if delai is None else delai
+    limite = timezone.now() - timedelta(seconds=delai)
+
+    with transaction.atomic():
+        jusqua = MouvementStock.objects.filter(date_heure__lt=limite).aggregate(dernier=Max("id"))["dernier"]
+        if jusqua is None:
+            return 0
+        totaux = list(
+            MouvementStock.objects.filter(pk__lte=jusqua, pk__gt=F("produit__mouvements_jusqua"))
+            .values("produit")
+            .annotate(total=Sum("quantite"), nombre=Count("id"))
+        )
+        if not totaux:
+            return 0
+        Produit.objects.filter(pk__in=[ligne["produit"] for ligne in totaux]).update(
+            quantite_stock=F("quantite_stock") + Case(
+                *[When(pk=ligne["produit"], then=Value(ligne["total"])) for ligne in totaux],
+                output_field=IntegerField(),
+            ),
+            mouvements_jusqua=jusqua,
+        )
+    return sum(ligne["nombre"] for ligne in totaux)
@@ -0,0 +1,231 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .journal import Chrono, evenement
+from .metriques import registre
+
+logger = logging.getLogger(__name__)
+
+def _reglage(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+def nom_tache(fonction):
+    """ Chemin importable d'une fonction de module : une tâche durable est enregistrée par son nom """
+    return f"{fonction.__module__}.{fonction.__qualname__}"
+
+def en_lot(executer_lot):
+    """ 🔹 Déclare une tâche durable exécutable en lot
+
+    Les tâches dues de même nom sont passées ensemble à `executer_lot(liste des
+    arguments)`, dans une seule transaction, au lieu d'un appel chacune.
+    """
+    def decorer(fonction):
+        fonction.executer_lot = executer_lot
+        return fonction
+    return decorer
+
+def delai(tentative):
+    """ Attente avant la tentative suivante : TACHES_DELAI, puis 2×, 4×... """
+    return _reglage("TACHES_DELAI", 0.2) * 2 ** (tentative - 1)
+
+class Executeur:
+    """ Exécute des effets de bord (stock, diffusions) en arrière-plan, hors du thread de la requête
+
+    - `soumettre()` : tâche en mémoire, exécutée par l'un des TACHES_FILS fils ; les
+      tâches de même `cle` passent par le même fil, dans l'ordre de soumission ;
+    - `apres_commit()` : tâche soumise seulement si la transaction est validée. Avec
+      `durable=True` (et TACHES_DURABLES), c'est une ligne Tache écrite dans la même
+      transaction que la modification : elle survit à un redémarrage et peut être
+      exécutée par un autre processus (`python manage.py taches`).
+
+    Une tâche en échec est relancée jusqu'à TACHES_TENTATIVES fois (voir `delai()`).
+    Avec TACHES_SYNCHRONES = True (tests), les fonctions sont exécutées immédiatement.
+    """
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._files = []  # Une file par fil : l'ordre est garanti pour une même clé
+        self._fils = []
+        self._tour = itertools.count()
+        self._reveil = threading.Event()
+        self._scrutateur = None
+
+    def soumettre(self, fonction, *args, cle=None):
+        if _reglage("TACHES_SYNCHRONES", False):
+            fonction(*args)
+            return
+
+        files = self._demarrer()
+        index = hash(cle) % len(files) if cle is not None else next(self._tour) % len(files)
+        files[index].put((fonction, args))
+
+    def apres_commit(self, fonction, *args, durable=False, cle=None):
+        """ 🔹 Tâche lancée après le commit de la transaction courante (tout de suite hors transaction)
+
+        Une tâche durable est écrite avec la modification : si la transaction est
+        annulée, elle disparaît avec elle. Ses arguments doivent être sérialisables en JSON.
+        """
+        if durable and _reglage("TACHES_DURABLES", True) and not _reglage("TACHES_SYNCHRONES", False):
+            from .models import Tache  # Import local : models.py importe ce module
+
+            Tache.objects.create(nom=nom_tache(fonction), arguments=list(args))
+            transaction.on_commit(self.reveiller)
+            return
+        transaction.on_commit(lambda: self.soumettre(fonction, *args, cle=cle))
+
+    def attendre(self):
+        """ Bloque jusqu'à ce que les tâches soumises soient terminées (les tâches durables dues sont exécutées ici) """
+        if _reglage("TACHES_DURABLES", True):
+            while self.traiter_durables():
+                pass
+        for file in list(self._files):
+            file.join()
+
+    def _demarrer(self):
+        with self._verrou:
+            if not self._files:
+                self._files = [queue.Queue() for _ in range(max(1, _reglage("TACHES_FILS", 2)))]
+                self._fils = [None] * len(self._files)
+            for i, fil in enumerate(self._fils):
+                if fil is None or not fil.is_alive():
+                    self._fils[i] = threading.Thread(target=self._boucle, args=(self._files[i],), name=f"taches-{i}", daemon=True)
+                    self._fils[i].start()
+            return self._files
+
+    def _boucle(self, file):
+        while True:
+            fonction, args = file.get()
+            try:
+                self._executer(fonction, args)
+            finally:
+                close_old_connections()
+                file.task_done()
+
+    def _executer(self, fonction, args):
+        """ Exécution en mémoire avec nouvelles tentatives (le fil attend entre deux essais) """
+        nom = getattr(fonction, "__qualname__", repr(fonction))
+        tentatives = max(1, _reglage("TACHES_TENTATIVES", 3))
+        for tentative in range(1, tentatives + 1):
+            try:
+                with Chrono() as chrono:
+                    fonction(*args)
+            except Exception:
+                if tentative == tentatives:
+                    registre.incrementer("fablab_taches_total", tache=nom, resultat="echec")
+                    logger.exception("Échec de la tâche %s après %d tentative(s)", nom, tentative)
+                    return
+                registre.incrementer("fablab_taches_total", tache=nom, resultat="reessai")
+                close_old_connections()  # La connexion est peut-être la cause de l'échec
+                time.sleep(delai(tentative))
+            else:
+                registre.observer("fablab_tache_secondes", chrono.ms / 1000, tache=nom)
+                registre.incrementer("fablab_taches_total", tache=nom, resultat="ok")
+                return
+
+    def reveiller(self):
+        """ Signale des tâches durables au fil qui les exécute (sauf si un processus dédié s'en charge) """
+        if _reglage("TACHES_PROCESSUS_SEPARE", False) or _reglage("TACHES_SYNCHRONES", False):
+            return
+        with self._verrou:
+            if self._scrutateur is None or not self._scrutateur.is_alive():
+                self._scrutateur = threading.Thread(target=self._scruter, name="taches-durables", daemon=True)
+                self._scrutateur.start()
+        self._reveil.set()
+
+    def _scruter(self):
+        while True:
+            if self._reveil.wait(_reglage("TACHES_INTERVALLE", 1.0)):
+                time.sleep(_reglage("TACHES_FENETRE", 0.05))  # 🔹 Laisse arriver les tâches suivantes : un lot plutôt que N passages
+            self._reveil.clear()
+            try:
+                while self.traiter_durables():
+                    pass
+            except Exception:
+                logger.exception("Lecture des tâches durables impossible")
+            finally:
+                close_old_connections()
+
+    def traiter_durables(self, lot=20):
+        """ 🔹 Exécute les tâches durables dues et retourne leur nombre
+
+        Chaque tâche est réservée par un UPDATE conditionnel : plusieurs fils ou
+        processus peuvent appeler cette méthode en même temps sans double exécution.
+        Une réservation expire après TACHES_BAIL secondes (processus arrêté en cours
+        de tâche) et la tâche redevient disponible. Les tâches déclarées `en_lot`
+        sont exécutées ensemble ; si le lot échoue, elles sont reprises une à une.
+        """
+        from .models import Tache
+
+        maintenant = timezone.now()
+        dues = Tache.objects.filter(etat__in=("en attente", "en cours"), prochain_essai__lte=maintenant)
+        bail = maintenant + timedelta(seconds=_reglage("TACHES_BAIL", 60))
+        with transaction.atomic():  # Réservations écrites en une transaction
+            reservees = [
+                tache_id for tache_id in list(dues.order_by("id").values_list("id", flat=True)[:lot])
+                if dues.filter(pk=tache_id).update(etat="en cours", prochain_essai=bail)
+            ]
+        taches = list(Tache.objects.filter(pk__in=reservees).order_by("id"))
+
+        groupes = {}
+        for tache in taches:
+            groupes.setdefault(tache.nom, []).append(tache)
+        for nom, groupe in groupes.items():
+            try:
+                executer_lot = getattr(import_string(nom), "executer_lot", None)
+            except ImportError:
+                executer_lot = None  # L'échec est enregistré par _executer_durable
+            if executer_lot is not None and len(groupe) > 1 and self._executer_lot(executer_lot, groupe):
+                continue
+            for tache in groupe:
+                self._executer_durable(tache)
+        return len(taches)
+
+    def _executer_lot(self, executer_lot, taches):
+        """ Lot de tâches de même nom en une transaction ; False en cas d'échec (rien n'est validé) """
+        nom = taches[0].nom.rsplit(".", 1)[-1]
+        try:
+            with Chrono() as chrono:
+                with transaction.atomic():
+                    executer_lot([tache.arguments for tache in taches])
+                    type(taches[0]).objects.filter(pk__in=[tache.pk for tache in taches]).delete()
+        except Exception:
+            logger.warning("Lot de %d tâches %s en échec, reprise une à une", len(taches), taches[0].nom, exc_info=True)
+            return False
+        registre.observer("fablab_tache_secondes", chrono.ms / 1000, tache=nom)
+        registre.incrementer("fablab_taches_total", len(taches), tache=nom, resultat="ok")
+        evenement(logger, "tache.durable", logging.DEBUG, tache=taches[0].nom, lot=len(taches), duree_ms=chrono.ms)
+        return True
+
+    def _executer_durable(self, tache):
+        tache_id, nom = tache.pk, tache.nom.rsplit(".", 1)[-1]
+        try:
+            with Chrono() as chrono:
+                fonction = import_string(tache.nom)
+                with transaction.atomic():
+                    fonction(*tache.arguments)
+                    tache.delete()  # 🔹 Effets et fin de la tâche validés ensemble : pas de double exécution
+        except Exception as erreur:
+            tache.tentatives += 1
+            echec = tache.tentatives >= max(1, _reglage("TACHES_TENTATIVES", 3))
+            type(tache).objects.filter(pk=tache_id).update(
+                etat="échouée" if echec else "en attente",
+                tentatives=tache.tentatives,
+                prochain_essai=timezone.now() + timedelta(seconds=delai(tache.tentatives)),
+                erreur=f"{type(erreur).__name__}: {erreur}",
+            )
+            registre.incrementer("fablab_taches_total", tache=nom, resultat="echec" if echec else "reessai")
+            if echec:
+                logger.exception("Échec de la tâche durable %s (id %d)", tache.nom, tache_id)
+            return
+        registre.observer("fablab_tache_secondes", chrono.ms / 1000, tache=nom)
+        registre.incrementer("fablab_taches_total", tache=nom, resultat="ok")
+        evenement(logger, "tache.durable", logging.DEBUG, tache=tache.nom, duree_ms=chrono.ms)
+
+executeur = Executeur()
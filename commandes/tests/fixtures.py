@@ -0,0 +1,22 @@
+from contextlib import nullcontext
+from django.test import TestCase
+from commandes.models import Produit, Sandwich
+
+class BurgerMixin:
+    """ 🔹 Jeu d'essai commun : Pain (50 g), Steak (120 g) et Burger = Pain + Steak (170 g)
+
+    Les stocks se règlent par classe (`stock_pain`, `stock_steak`). La recette est
+    créée avec ses callbacks de commit exécutés (poids du sandwich, nomenclature,
+    index de disponibilité), comme par l'API ; une TransactionTestCase les exécute
+    d'elle-même.
+    """
+    stock_pain = 10
+    stock_steak = 10
+
+    def setUp(self):
+        super().setUp()
+        self.pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=self.stock_pain)
+        self.steak = Produit.objects.create(nom="Steak", taille="M", poids=120.0, quantite_stock=self.stock_steak)
+        with self.captureOnCommitCallbacks(execute=True) if isinstance(self, TestCase) else nullcontext():
+            self.burger = Sandwich.objects.create(nom="Burger", taille="M")
+            self.burger.produits.set([self.pain, self.steak])
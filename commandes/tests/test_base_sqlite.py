@@ -0,0 +1,47 @@
+import os
+import tempfile
+from django.conf import settings
+from django.test import SimpleTestCase
+from commandes.base_sqlite import base
+
+class ReserveConnexionsTestCase(SimpleTestCase):
+    """ Vérifie la réserve de connexions du profil sqlite-wal sur un fichier temporaire """
+
+    def setUp(self):
+        self.chemin = os.path.join(tempfile.mkdtemp(), "reserve.sqlite3")
+        self.reglages = {
+            **settings.DATABASES["default"],
+            "ENGINE": "commandes.base_sqlite",
+            "NAME": self.chemin,
+            "OPTIONS": {"init_command": settings.SQLITE_PRAGMAS, "transaction_mode": "IMMEDIATE", "reserve": 2},
+        }
+        self.addCleanup(base.vider)
+
+    def connexion(self):
+        return base.DatabaseWrapper(dict(self.reglages), alias="reserve")
+
+    def test_connexion_reutilisee_apres_fermeture(self):
+        premiere = self.connexion()
+        premiere.ensure_connection()
+        brute = premiere.connection
+        premiere.close()
+
+        seconde = self.connexion()
+        seconde.ensure_connection()
+        self.assertIs(seconde.connection, brute)
+        with seconde.cursor() as curseur:
+            curseur.execute("PRAGMA journal_mode")
+            self.assertEqual(curseur.fetchone()[0], "wal")
+        seconde.close()
+
+    def test_transaction_en_cours_non_reutilisee(self):
+        premiere = self.connexion()
+        premiere.ensure_connection()
+        brute = premiere.connection
+        brute.execute("BEGIN")
+        premiere.close()
+
+        seconde = self.connexion()
+        seconde.ensure_connection()
+        self.assertIsNot(seconde.connection, brute)
+        seconde.close()
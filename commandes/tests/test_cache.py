@@ -0,0 +1,54 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from commandes import cache
+from commandes.cache import LRUCache
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class CacheReponsesTestCase(BurgerMixin, TestCase):
+    """ Vérifie le cache des réponses rendues et son invalidation par les versions """
+
+    def setUp(self):
+        caches["reponses"].clear()
+        super().setUp()
+
+    def test_hit_sans_requete_sql(self):
+        for url in ("/api/stock/", "/api/sandwiches/"):
+            premiere = self.client.get(url)
+            with self.assertNumQueries(0):
+                seconde = self.client.get(url)
+            self.assertEqual(seconde.status_code, 200)
+            self.assertEqual(seconde.content, premiere.content)
+            self.assertEqual(seconde["Content-Type"], premiere["Content-Type"])
+
+    def test_changement_de_stock_invalide(self):
+        self.client.get("/api/sandwiches/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pain.quantite_stock = 3
+            self.pain.save()
+
+        reponse = self.client.get("/api/sandwiches/")
+        self.assertEqual(reponse.json()[0]["produits"][0]["quantite_stock"], 3)
+
+    def test_compteurs(self):
+        avant = cache.statistiques()
+        self.client.get("/api/stock/")
+        self.client.get("/api/stock/")
+        apres = self.client.get("/api/cache/").json()
+
+        self.assertEqual(apres["hits"] - avant["hits"], 1)
+        self.assertEqual(apres["misses"] - avant["misses"], 1)
+        self.assertIn("evictions", apres)
+
+class LRUCacheTestCase(SimpleTestCase):
+    def test_eviction_de_la_moins_recemment_lue(self):
+        lru = LRUCache("test-lru", {"OPTIONS": {"MAX_ENTRIES": 2}})
+        lru.clear()
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+        self.assertGreaterEqual(lru.compteurs["evictions"], 1)
@@ -0,0 +1,302 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from commandes import etats
+from commandes.consumers import (
+    CommandesConsumer, JournalStock, StockConsumer, TemperatureConsumer, fenetre_temperature, journal_stock,
+)
+from commandes.models import Commande, Sandwich, Temperature
+from commandes.taches import executeur
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class StockConsumerTestCase(BurgerMixin, TransactionTestCase):
+    """ Vérifie le protocole snapshot + deltas de ws/stock/ """
+
+    stock_steak = 8
+
+    async def connecter(self):
+        communicator = WebsocketCommunicator(StockConsumer.as_asgi(), "/ws/stock/")
+        connecte, _ = await communicator.connect()
+        self.assertTrue(connecte)
+        return communicator
+
+    def test_snapshot_puis_deltas(self):
+        async def scenario():
+            communicator = await self.connecter()
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot["type"], "snapshot")
+            self.assertEqual(snapshot["stock_total"], 18)
+            self.assertEqual(len(snapshot["produits"]), 2)
+
+            self.pain.quantite_stock = 4
+            await database_sync_to_async(self.pain.save)()
+            delta = await communicator.receive_json_from()
+            self.assertEqual(delta["type"], "delta")
+            self.assertGreater(delta["seq"], snapshot["seq"])
+            self.assertEqual(delta["stock_total"], 12)
+            self.assertEqual(delta["produits"], [{"id": self.pain.id, "nom": "Pain", "quantite": 4}])
+
+            # 🔹 Un client en retard rattrape les deltas manqués
+            await communicator.send_json_to({"action": "resync", "depuis": delta["seq"] - 1})
+            rattrapage = await communicator.receive_json_from()
+            self.assertEqual(rattrapage, delta)
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_resync_trop_ancien_renvoie_un_snapshot(self):
+        async def scenario():
+            communicator = await self.connecter()
+            await communicator.receive_json_from()
+
+            await communicator.send_json_to({"action": "resync", "depuis": journal_stock.seq + 10})
+            reponse = await communicator.receive_json_from()
+            self.assertEqual(reponse["type"], "snapshot")
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_message_invalide_renvoie_une_erreur(self):
+        async def scenario():
+            communicator = await self.connecter()
+            await communicator.receive_json_from()
+
+            for texte in ('{"action": "resync", "depuis": "x"}', '{"action": "resync"}', "pas du json", "[1]"):
+                await communicator.send_to(text_data=texte)
+                reponse = await communicator.receive_json_from()
+                self.assertEqual(reponse["type"], "erreur")
+
+            # 🔹 La connexion reste utilisable
+            await communicator.send_json_to({"action": "resync", "depuis": journal_stock.seq})
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class JournalStockTestCase(SimpleTestCase):
+    """ Deltas publiés par plusieurs processus : rangés par seq, jamais confondus """
+
+    def delta(self, seq, quantite):
+        return {"seq": seq, "stock_total": quantite, "produits": [{"id": 1, "nom": "Pain", "quantite": quantite}]}
+
+    def test_delta_en_retard_range_a_sa_place(self):
+        journal = JournalStock()
+        journal.enregistrer(self.delta(10, 5))
+        journal.enregistrer(self.delta(12, 3))  # Publié par un autre processus, arrivé avant le 11
+        texte = journal.enregistrer(self.delta(11, 4))
+
+        self.assertEqual(json.loads(texte)["stock_total"], 4)
+        self.assertEqual(journal.seq, 12)
+        self.assertEqual([json.loads(t)["seq"] for t in journal.depuis(10)], [11, 12])
+        self.assertEqual(journal.enregistrer(self.delta(11, 4)), texte)  # Même delta reçu par un autre consumer
+
+
+class StockConsumerReglagesParDefautTestCase(BurgerMixin, TransactionTestCase):
+    """ Diffusion du stock avec les réglages livrés (fenêtre de fusion, channel layer en mémoire) """
+
+    stock_steak = 8
+
+    def test_changements_fusionnes_dans_un_delta(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(StockConsumer.as_asgi(), "/ws/stock/")
+            connecte, _ = await communicator.connect()
+            self.assertTrue(connecte)
+            await communicator.receive_json_from()
+
+            # 🔹 Deux sauvegardes dans la fenêtre : un seul delta, publié depuis la boucle du serveur
+            self.pain.quantite_stock = 4
+            await database_sync_to_async(self.pain.save)()
+            self.steak.quantite_stock = 2
+            await database_sync_to_async(self.steak.save)()
+            delta = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(delta["type"], "delta")
+            self.assertEqual(delta["stock_total"], 6)
+            self.assertEqual(len(delta["produits"]), 2)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class TemperatureConsumerTestCase(TransactionTestCase):
+    """ Vérifie le flux ws/temperature/ et les abonnements calculés côté serveur """
+
+    def setUp(self):
+        fenetre_temperature.__init__()
+
+    def test_points_moyenne_et_alarme(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(TemperatureConsumer.as_asgi(), "/ws/temperature/")
+            connecte, _ = await communicator.connect()
+            self.assertTrue(connecte)
+            self.assertEqual((await communicator.receive_json_from())["type"], "historique")
+
+            await communicator.send_json_to({"action": "abonner", "mode": "moyenne", "fenetre": 300})
+            await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "abonner", "mode": "seuil", "max": 25})
+
+            for temperature in (20.0, 30.0):
+                await database_sync_to_async(Temperature.objects.create)(temperature=temperature, humidite=40.0)
+
+            messages = [await communicator.receive_json_from() for _ in range(6)]
+            self.assertEqual([m["type"] for m in messages], ["points", "moyenne", "alarme"] * 2)
+            self.assertEqual(messages[3]["points"][0]["temperature"], 30.0)
+            self.assertEqual(messages[4]["temperature"], 25.0)
+            self.assertEqual([messages[2]["active"], messages[5]["active"]], [False, True])
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_fenetre_rechargee_apres_une_periode_sans_client(self):
+        maintenant = timezone.now()
+        fenetre_temperature.recharger([((maintenant - timedelta(minutes=30)).timestamp(), 10.0, 40.0)])
+        # 🔹 Mesures enregistrées sans client connecté : la fenêtre ne les a pas reçues
+        Temperature.objects.bulk_create([
+            Temperature(date_heure=maintenant - timedelta(seconds=s), temperature=20.0, humidite=40.0) for s in (60, 0)
+        ])
+
+        async def scenario():
+            communicator = WebsocketCommunicator(TemperatureConsumer.as_asgi(), "/ws/temperature/")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "abonner", "mode": "moyenne", "fenetre": 300})
+            moyenne = await communicator.receive_json_from()
+            self.assertEqual((moyenne["nombre"], moyenne["temperature"]), (2, 20.0))
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_message_invalide_renvoie_une_erreur(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(TemperatureConsumer.as_asgi(), "/ws/temperature/")
+            await communicator.connect()
+            await communicator.receive_json_from()
+
+            for texte in ("[1]", '"abonner"', "pas du json", '{"action": "abonner", "mode": "moyenne", "fenetre": [1]}'):
+                await communicator.send_to(text_data=texte)
+                self.assertEqual((await communicator.receive_json_from())["type"], "erreur")
+
+            await communicator.send_json_to({"action": "abonner", "mode": "moyenne", "fenetre": 60})
+            self.assertEqual((await communicator.receive_json_from())["type"], "moyenne")
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class CommandesConsumerTestCase(BurgerMixin, TransactionTestCase):
+    """ Vérifie la file des commandes poussée sur ws/commandes/ """
+
+    stock_pain = stock_steak = 100
+
+    def setUp(self):
+        super().setUp()
+        self.commandes = [Commande.objects.create(sandwich=self.burger, quantite=1) for _ in range(3)]
+        etats.transition([self.commandes[0].pk], "terminée")
+
+    async def connecter(self, chemin="/ws/commandes/"):
+        communicator = WebsocketCommunicator(CommandesConsumer.as_asgi(), chemin)
+        connecte, _ = await communicator.connect()
+        self.assertTrue(connecte)
+        return communicator
+
+    def test_snapshot_puis_deltas(self):
+        async def scenario():
+            communicator = await self.connecter()
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot["type"], "snapshot")
+            self.assertEqual([c["status"] for c in snapshot["commandes"]], ["en attente", "en attente", "terminée"])
+            self.assertEqual(snapshot["commandes"][0]["sandwich"], "Burger")
+
+            ids = [c.pk for c in self.commandes[1:]]
+            await database_sync_to_async(etats.transition)(ids, "en cuisson")
+            delta = await communicator.receive_json_from()
+            self.assertEqual(delta["type"], "delta")
+            self.assertEqual(
+                sorted(delta["commandes"], key=lambda c: c["id"]),
+                [{"id": i, "status": "en cuisson", "sandwich": "Burger", "quantite": 1} for i in ids],
+            )
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_filtre_par_statut(self):
+        async def scenario():
+            communicator = await self.connecter("/ws/commandes/?statuts=en%20cuisson")
+            self.assertEqual((await communicator.receive_json_from())["commandes"], [])
+
+            commande = self.commandes[1]
+            await database_sync_to_async(etats.transition)([self.commandes[2].pk], "validée")  # Hors filtre
+            await database_sync_to_async(etats.transition)([commande.pk], "en cuisson")
+            entree = await communicator.receive_json_from()
+            self.assertEqual([c["id"] for c in entree["commandes"]], [commande.pk])
+
+            # 🔹 La commande quitte le filtre : envoyée une dernière fois pour être retirée de l'écran
+            await database_sync_to_async(etats.transition)([commande.pk], "terminée")
+            sortie = await communicator.receive_json_from()
+            self.assertEqual(sortie["commandes"][0]["status"], "terminée")
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_message_invalide_renvoie_une_erreur(self):
+        async def scenario():
+            communicator = await self.connecter()
+            await communicator.receive_json_from()
+
+            for texte in ("[1]", "pas du json", '{"action": "abonner", "statuts": [["validée"]]}',
+                          '{"action": "abonner", "statuts": [{}]}', '{"action": "abonner", "statuts": "validée"}'):
+                await communicator.send_to(text_data=texte)
+                reponse = await communicator.receive_json_from()
+                self.assertEqual(reponse["type"], "erreur")
+
+            # 🔹 La connexion reste utilisable
+            await communicator.send_json_to({"action": "abonner", "statuts": ["en attente"]})
+            self.assertEqual(len((await communicator.receive_json_from())["commandes"]), 2)
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class CommandesConsumerReglagesParDefautTestCase(TransactionTestCase):
+    """ Diffusion de la file des commandes avec les réglages livrés (tâches dans les fils de l'exécuteur) """
+
+    def setUp(self):
+        self.sandwich = Sandwich.objects.create(nom="Burger", taille="M")
+        self.commande = Commande.objects.create(sandwich=self.sandwich, quantite=1)
+        executeur.attendre()  # Diffusion de la création partie avant la connexion du client
+
+    def test_delta_envoye_depuis_un_fil_de_l_executeur(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(CommandesConsumer.as_asgi(), "/ws/commandes/")
+            connecte, _ = await communicator.connect()
+            self.assertTrue(connecte)
+            await communicator.receive_json_from()
+
+            # 🔹 Le group_send part d'un fil taches-N : il doit être exécuté dans la boucle du serveur
+            layer = get_channel_layer()
+            boucles = []
+            group_send = layer.group_send
+
+            async def noter(*args):
+                boucles.append(asyncio.get_running_loop())
+                await group_send(*args)
+
+            with mock.patch.object(layer, "group_send", noter):
+                await database_sync_to_async(etats.transition)([self.commande.pk], "en cuisson")
+                delta = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(delta["commandes"][0]["status"], "en cuisson")
+            self.assertEqual(boucles, [asyncio.get_running_loop()])
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
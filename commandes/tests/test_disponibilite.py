@@ -0,0 +1,88 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from commandes import stock
+from commandes.diffusion import diffuseur_stock
+from commandes.disponibilite import index_disponibilite
+from commandes.models import Produit, Sandwich, Commande
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class DisponibiliteTestCase(BurgerMixin, TestCase):
+    """ Vérifie l'index des portions réalisables et son usage par l'API """
+
+    stock_steak = 3
+
+    def setUp(self):
+        index_disponibilite.vider()
+        self.client = APIClient()
+        super().setUp()
+        self.salade = Produit.objects.create(nom="Salade", taille="M", poids=20.0, quantite_stock=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vege = Sandwich.objects.create(nom="Végé", taille="M")
+            self.vege.produits.set([self.pain, self.salade])
+
+    def test_endpoint_portions(self):
+        reponse = self.client.get("/api/sandwiches/disponibles/")
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            {s["nom"]: s["portions"] for s in reponse.json()},
+            {"Burger": 3, "Végé": 5},
+        )
+
+    def test_mise_a_jour_limitee_aux_sandwiches_du_produit(self):
+        index_disponibilite.tout()
+        with mock.patch.object(diffuseur_stock, "_envoyer") as envoyer:
+            with self.captureOnCommitCallbacks(execute=True):
+                stock.ajouter(self.steak.pk, 4)
+
+        self.assertEqual(envoyer.call_args.args[0]["sandwiches"], [{"id": self.burger.pk, "portions": 7}])
+        self.assertEqual(index_disponibilite.portions(self.vege.pk), 5)
+
+    def test_changement_de_recette(self):
+        index_disponibilite.tout()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.produits.remove(self.steak)
+
+        self.assertEqual(index_disponibilite.portions(self.burger.pk), 10)
+
+    def test_suppression_d_un_produit(self):
+        index_disponibilite.tout()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.steak.delete()
+
+        self.assertEqual(
+            {s["nom"]: s["portions"] for s in index_disponibilite.tout()},
+            {"Burger": 10, "Végé": 5},
+        )
+        self.assertEqual(index_disponibilite.pour_produits([self.pain.pk]), [
+            {"id": self.burger.pk, "portions": 10}, {"id": self.vege.pk, "portions": 5},
+        ])
+
+    def test_commande_en_rupture_refusee(self):
+        index_disponibilite.tout()  # Nomenclatures en cache
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.post("/api/commandes/", {"sandwich_id": self.burger.pk, "quantite": 4}, format="json")
+
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("quantite", reponse.json())
+        self.assertEqual(len(requetes), 2)  # Le sandwich_id, puis les soldes de la recette (nomenclature en cache)
+        self.assertFalse(Commande.objects.exists())
+
+        reponse = self.client.post("/api/commandes/", {"sandwich_id": self.burger.pk, "quantite": 3}, format="json")
+        self.assertEqual(reponse.status_code, 201)
+
+    def test_stock_change_par_un_autre_processus(self):
+        index_disponibilite.tout()
+        # Mouvement écrit par un autre processus : l'index de celui-ci n'est pas prévenu
+        with mock.patch.object(index_disponibilite, "produits_modifies"), self.captureOnCommitCallbacks(execute=True):
+            stock.ajouter(self.steak.pk, -2)
+        self.assertEqual(index_disponibilite.portions(self.burger.pk), 3)
+
+        reponse = self.client.post("/api/commandes/", {"sandwich_id": self.burger.pk, "quantite": 2}, format="json")
+
+        self.assertEqual(reponse.status_code, 400)
+        self.assertIn("1 portion(s)", reponse.json()["quantite"][0])
@@ -0,0 +1,79 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from commandes.models import Sandwich, Commande
+from commandes import etats
+from commandes.stock import solde
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class TransitionsTestCase(BurgerMixin, TestCase):
+    """ Vérifie la machine à états des commandes et les changements de statut par lot """
+
+    stock_pain = stock_steak = 100
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tartine = Sandwich.objects.create(nom="Tartine", taille="S")
+            self.tartine.produits.set([self.pain])
+        self.commandes = [Commande.objects.create(sandwich=self.burger, quantite=2) for _ in range(10)]
+        self.ids = [c.pk for c in self.commandes]
+
+    def statuts(self):
+        return set(Commande.objects.filter(pk__in=self.ids).values_list("status", flat=True))
+
+    def test_plateau_en_cuisson_en_une_requete(self):
+        with CaptureQueriesContext(connection) as contexte:
+            modifiees, refus = etats.transition(self.ids, "en cuisson")
+
+        self.assertEqual(sorted(modifiees), self.ids)
+        self.assertEqual(refus, [])
+        self.assertEqual(self.statuts(), {"en cuisson"})
+        self.assertEqual(len([q for q in contexte.captured_queries if "UPDATE" in q["sql"]]), 1)
+
+    def test_terminer_un_lot_decremente_le_stock_une_fois(self):
+        tartine = Commande.objects.create(sandwich=self.tartine, quantite=3)
+
+        with self.captureOnCommitCallbacks(execute=True):  # Consommation lancée après le commit
+            etats.transition(self.ids + [tartine.pk], "terminée")
+
+        self.assertEqual(solde(self.pain.pk), 100 - 20 - 3)
+        self.assertEqual(solde(self.steak.pk), 100 - 20)
+
+    def test_transition_interdite_et_verrou_optimiste(self):
+        etats.transition(self.ids[:2], "terminée")
+        etats.transition(self.ids[2:4], "en cuisson")
+
+        modifiees, refus = etats.transition(self.ids, "ticket imprimé", depuis="en attente")
+
+        self.assertEqual(sorted(modifiees), self.ids[4:])
+        self.assertEqual([r["id"] for r in refus], self.ids[:4])
+        self.assertEqual([r["status"] for r in refus], ["terminée"] * 2 + ["en cuisson"] * 2)
+
+    def test_terminee_est_definitif(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            etats.transition(self.ids[:1], "terminée")
+            modifiees, refus = etats.transition(self.ids[:1], "terminée")
+
+        self.assertEqual(modifiees, [])
+        self.assertEqual(solde(self.pain.pk), 98)
+
+    def test_endpoint_lot(self):
+        reponse = self.client.post(
+            "/api/commandes/statut/",
+            {"ids": self.ids + [999999], "statut": "ticket imprimé"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(sorted(reponse.json()["modifiees"]), self.ids)
+        self.assertEqual(reponse.json()["refus"][0]["erreur"], "Commande non trouvée")
+
+    def test_changer_statut_refuse_une_transition_interdite(self):
+        commande = self.commandes[0]
+        url = f"/api/commandes/{commande.pk}/changer_statut/"
+
+        self.assertEqual(self.client.post(url, {"statut": "terminée"}).status_code, 200)
+        self.assertEqual(self.client.post(url, {"statut": "en cuisson"}).status_code, 409)
+        self.assertEqual(self.client.post("/api/commandes/999999/changer_statut/", {"statut": "validée"}).status_code, 404)
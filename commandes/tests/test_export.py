@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import TestCase, override_settings
+from commandes import stock
+from commandes.models import Commande, MouvementStock, Temperature
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, EXPORT_PAQUET=2)
+class ExportTestCase(BurgerMixin, TestCase):
+    """ Vérifie les exports en flux CSV / NDJSON et leurs filtres de date """
+
+    def setUp(self):
+        super().setUp()
+        Commande.objects.bulk_create([Commande(sandwich=self.burger, quantite=i + 1) for i in range(5)])
+        stock.ajouter(self.pain.pk, 8)
+        self.debut = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        Temperature.objects.bulk_create([
+            Temperature(date_heure=self.debut + timedelta(hours=i), temperature=20.0 + i, humidite=40.0)
+            for i in range(6)
+        ])
+
+    def lire(self, url):
+        reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return reponse, b"".join(reponse.streaming_content).decode()
+
+    def test_commandes_csv(self):
+        reponse, texte = self.lire("/api/export/commandes/")
+
+        self.assertEqual(reponse["Content-Type"], "text/csv; charset=utf-8")
+        lignes = list(csv.DictReader(io.StringIO(texte)))
+        self.assertEqual([ligne["quantite"] for ligne in lignes], ["1", "2", "3", "4", "5"])
+        self.assertEqual(lignes[0]["sandwich"], "Burger")
+
+    def test_mouvements_ndjson(self):
+        _, texte = self.lire("/api/export/mouvements/?format=ndjson")
+
+        mouvements = [json.loads(ligne) for ligne in texte.splitlines()]
+        self.assertEqual(len(mouvements), MouvementStock.objects.count())
+        self.assertEqual(mouvements[-1]["motif"], "ajout")
+        self.assertEqual(mouvements[-1]["quantite"], 8)
+
+    def test_temperature_filtre_de_dates(self):
+        debut = (self.debut + timedelta(hours=2)).isoformat().replace("+00:00", "Z")
+        fin = (self.debut + timedelta(hours=5)).isoformat().replace("+00:00", "Z")
+        _, texte = self.lire(f"/api/export/temperature/?format=ndjson&from={debut}&to={fin}")
+
+        self.assertEqual([json.loads(ligne)["temperature"] for ligne in texte.splitlines()], [22.0, 23.0, 24.0])
+
+    def test_parametres_invalides(self):
+        self.assertEqual(self.client.get("/api/export/commandes/?format=xml").status_code, 400)
+        self.assertEqual(self.client.get("/api/export/commandes/?from=hier").status_code, 400)
+        self.assertEqual(self.client.get("/api/export/produits/").status_code, 404)
@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+import tempfile
+from django.test import SimpleTestCase
+from commandes.journal import JournalNonBloquant, evenement
+
+class JournalTestCase(SimpleTestCase):
+    """ Vérifie le handler non bloquant et les événements structurés """
+
+    def setUp(self):
+        self.fichier = os.path.join(tempfile.mkdtemp(), "test.log")
+        self.handler = JournalNonBloquant(fichier=self.fichier, console=False)
+        self.logger = logging.getLogger("commandes.tests.journal")
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def lignes(self):
+        self.handler.arreter()  # Attend que le thread d'écriture ait vidé la file
+        if not os.path.exists(self.fichier):
+            return []  # Fichier ouvert à la première écriture
+        with open(self.fichier, encoding="utf-8") as f:
+            return [json.loads(ligne) for ligne in f]
+
+    def test_evenement_ecrit_en_json(self):
+        evenement(self.logger, "commande.statut", id=3, vers="terminée")
+        try:
+            raise ValueError("boum")
+        except ValueError:
+            self.logger.exception("échec")
+
+        premiere, seconde = self.lignes()
+        self.assertEqual((premiere["message"], premiere["id"], premiere["vers"]), ("commande.statut", 3, "terminée"))
+        self.assertIn("ValueError: boum", seconde["exception"])
+
+    def test_niveau_filtre(self):
+        evenement(self.logger, "ws.connexion", logging.DEBUG, groupe="stock_updates")
+        self.assertEqual(self.lignes(), [])
+
+    def test_file_pleine_ne_bloque_pas(self):
+        self.handler.arreter()
+        petit = JournalNonBloquant(console=False, taille_file=1)
+        petit.arreter()
+        for _ in range(3):
+            petit.handle(logging.makeLogRecord({"msg": "x"}))
+        self.assertEqual(petit.perdus, 2)
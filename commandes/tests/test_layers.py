@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase
+from commandes.layers import Courtier, SocketChannelLayer
+
+class SocketChannelLayerTestCase(SimpleTestCase):
+    """ Vérifie le channel layer multi-processus sur le courtier local """
+
+    def setUp(self):
+        self.layers = []
+
+    def tearDown(self):
+        self.fermer_layers()
+
+    def fermer_layers(self):
+        """ Avant l'arrêt du courtier : pas de tentative de reconnexion en fin de test """
+        for layer in self.layers:
+            layer.fermer()
+        self.layers = []
+
+    def layer(self, chemin):
+        layer = SocketChannelLayer(chemin=chemin)
+        self.layers.append(layer)
+        return layer
+
+    async def lancer_courtier(self, chemin):
+        courtier = Courtier()
+        tache = asyncio.create_task(courtier.servir(chemin))
+        while not os.path.exists(chemin):
+            await asyncio.sleep(0.01)
+        return courtier, tache
+
+    def executer(self, scenario):
+        chemin = os.path.join(tempfile.mkdtemp(), "test.sock")
+
+        async def avec_courtier():
+            _, tache = await self.lancer_courtier(chemin)
+            try:
+                await asyncio.wait_for(scenario(chemin), timeout=5)
+            finally:
+                self.fermer_layers()
+                tache.cancel()
+
+        async_to_sync(avec_courtier)()
+
+    def test_group_send_atteint_tous_les_processus(self):
+        async def scenario(chemin):
+            # 🔹 Deux layers = deux processus Daphne distincts
+            premier, second = self.layer(chemin), self.layer(chemin)
+            canaux = [await premier.new_channel(), await premier.new_channel(), await second.new_channel()]
+            await premier.group_add("stock_updates", canaux[0])
+            await premier.group_add("stock_updates", canaux[1])
+            await second.group_add("stock_updates", canaux[2])
+
+            emetteur = self.layer(chemin)
+            await emetteur.group_send("stock_updates", {"type": "stock_update", "seq": 1})
+
+            self.assertEqual((await premier.receive(canaux[0]))["seq"], 1)
+            self.assertEqual((await premier.receive(canaux[1]))["seq"], 1)
+            self.assertEqual((await second.receive(canaux[2]))["seq"], 1)
+
+        self.executer(scenario)
+
+    def test_send_direct_et_group_discard(self):
+        async def scenario(chemin):
+            premier, second = self.layer(chemin), self.layer(chemin)
+            canal = await premier.new_channel()
+            autre = await second.new_channel()
+            await second.group_add("stock_updates", autre)
+            await second.group_discard("stock_updates", autre)
+
+            await second.send(canal, {"type": "test", "valeur": 42})
+            self.assertEqual(await premier.receive(canal), {"type": "test", "valeur": 42})
+            await premier.group_send("stock_updates", {"type": "stock_update"})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(second.receive(autre), timeout=0.2)
+
+        self.executer(scenario)
+
+    def test_message_de_plus_de_64_kio(self):
+        async def scenario(chemin):
+            recepteur, emetteur = self.layer(chemin), self.layer(chemin)
+            canal = await recepteur.new_channel()
+            await recepteur.group_add("temperature", canal)
+
+            points = [{"t": f"2025-03-01T00:{i // 60:02}:{i % 60:02}Z", "v": 20.0 + i / 100} for i in range(3000)]
+            await emetteur.group_send("temperature", {"type": "lot", "points": points})
+            self.assertEqual((await recepteur.receive(canal))["points"], points)
+
+            await emetteur.group_send("temperature", {"type": "suivant"})  # Connexions toujours utilisables
+            self.assertEqual((await recepteur.receive(canal))["type"], "suivant")
+
+        self.executer(scenario)
+
+    def test_reconnexion_apres_une_ligne_illisible(self):
+        chemin = os.path.join(tempfile.mkdtemp(), "test.sock")
+
+        async def avec_courtier():
+            courtier, tache = await self.lancer_courtier(chemin)
+            recepteur, emetteur = self.layer(chemin), self.layer(chemin)
+            canal = await recepteur.new_channel()
+            await recepteur.group_add("stock_updates", canal)
+            try:
+                with self.assertLogs("commandes.layers", "WARNING"):
+                    courtier.processus[recepteur.prefixe].write(b"pas du json\n")
+                    await asyncio.sleep(0.1)
+                for _ in range(50):  # 🔹 Le récepteur s'est reconnecté et a réenregistré son groupe
+                    await emetteur.group_send("stock_updates", {"type": "stock_update", "seq": 3})
+                    try:
+                        message = await asyncio.wait_for(recepteur.receive(canal), timeout=0.1)
+                        break
+                    except asyncio.TimeoutError:
+                        continue
+                else:
+                    self.fail("Aucun message reçu après la ligne illisible")
+                self.assertEqual(message["seq"], 3)
+            finally:
+                self.fermer_layers()
+                tache.cancel()
+
+        async_to_sync(avec_courtier)()
+
+    def test_une_connexion_par_processus(self):
+        chemin = os.path.join(tempfile.mkdtemp(), "test.sock")
+
+        async def avec_courtier():
+            courtier, tache = await self.lancer_courtier(chemin)
+            layer = self.layer(chemin)
+            await layer.new_channel()
+            # 🔹 async_to_sync depuis des threads : une boucle par appel, toujours la même connexion
+            for i in range(5):
+                await asyncio.to_thread(async_to_sync(layer.group_send), "stock_updates", {"type": "test", "i": i})
+            self.assertEqual(len(courtier.connexions), 1)
+            self.fermer_layers()
+            tache.cancel()
+
+        async_to_sync(avec_courtier)()
+
+    def test_reconnexion_apres_redemarrage_du_courtier(self):
+        chemin = os.path.join(tempfile.mkdtemp(), "test.sock")
+
+        async def avec_courtier():
+            _, tache = await self.lancer_courtier(chemin)
+            recepteur, emetteur = self.layer(chemin), self.layer(chemin)
+            canal = await recepteur.new_channel()
+            await recepteur.group_add("stock_updates", canal)
+
+            with self.assertLogs("commandes.layers", "WARNING"):
+                tache.cancel()  # Arrêt du courtier : les connexions sont fermées
+                await asyncio.sleep(0.1)
+            _, tache = await self.lancer_courtier(chemin)
+            try:
+                # Le groupe est réenregistré par le récepteur dès sa reconnexion
+                for _ in range(50):
+                    await emetteur.group_send("stock_updates", {"type": "stock_update", "seq": 2})
+                    try:
+                        message = await asyncio.wait_for(recepteur.receive(canal), timeout=0.1)
+                        break
+                    except asyncio.TimeoutError:
+                        continue
+                else:
+                    self.fail("Aucun message reçu après le redémarrage du courtier")
+                self.assertEqual(message["seq"], 2)
+            finally:
+                self.fermer_layers()
+                tache.cancel()
+
+        async_to_sync(avec_courtier)()
@@ -0,0 +1,56 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from commandes.models import Sandwich, Commande
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class CommandesParLotTestCase(BurgerMixin, TestCase):
+    """ Vérifie /api/commandes/batch/ : une requête HTTP et un INSERT pour tout un groupe """
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tartine = Sandwich.objects.create(nom="Tartine", taille="S")
+            self.tartine.produits.set([self.pain])
+
+    def envoyer(self, lignes):
+        return self.client.post("/api/commandes/batch/", lignes, content_type="application/json")
+
+    def test_lot_cree_toutes_les_commandes(self):
+        lignes = [{"sandwich_id": self.burger.pk, "quantite": 1}] * 20 + [{"sandwich_id": self.tartine.pk, "quantite": 3}] * 10
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reponse = self.envoyer(lignes)
+
+        self.assertEqual(reponse.status_code, 201)
+        ids = reponse.json()["ids"]
+        self.assertEqual(len(ids), 30)
+        poids = dict(Commande.objects.filter(pk__in=ids).values_list("id", "poids_total"))
+        self.assertEqual(poids[ids[0]], 170.0)
+        self.assertEqual(poids[ids[-1]], 150.0)
+
+    def test_nombre_requetes_independant_de_la_taille(self):
+        self.envoyer([{"sandwich_id": self.burger.pk}])  # Nomenclatures mises en cache
+
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.envoyer([{"sandwich_id": self.burger.pk, "quantite": 2}] * 30)
+
+        self.assertEqual(reponse.status_code, 201)
+        self.assertLessEqual(len(contexte.captured_queries), 3)  # SAVEPOINT, INSERT, RELEASE
+
+    def test_ligne_invalide_rejette_tout_le_lot(self):
+        reponse = self.envoyer([
+            {"sandwich_id": self.burger.pk, "quantite": 1},
+            {"sandwich_id": 999999, "quantite": 1},
+            {"sandwich_id": self.burger.pk, "quantite": 0},
+        ])
+
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([r["index"] for r in reponse.json()["rejets"]], [1, 2])
+        self.assertFalse(Commande.objects.exists())
+
+    @override_settings(COMMANDE_LOT_MAX=5)
+    def test_lot_trop_grand(self):
+        reponse = self.envoyer([{"sandwich_id": self.burger.pk}] * 6)
+        self.assertEqual(reponse.status_code, 413)
@@ -0,0 +1,36 @@
+from django.test import TestCase, override_settings
+from commandes.metriques import registre
+from commandes.models import Produit, Sandwich, Commande
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class MetriquesTestCase(TestCase):
+    """ Vérifie l'instrumentation et l'endpoint /api/metriques/ """
+
+    def setUp(self):
+        registre.vider()
+
+    def test_latence_et_sql_par_route(self):
+        self.client.get("/api/produits/")
+        self.client.get("/api/produits/")
+        texte = self.client.get("/api/metriques/").content.decode()
+
+        self.assertIn("# TYPE fablab_http_requete_secondes histogram", texte)
+        self.assertIn('fablab_http_requete_secondes_count{methode="GET",route="api/produits/$"} 2', texte)
+        self.assertIn('fablab_http_reponses_total{code="2xx",methode="GET",route="api/produits/$"} 2', texte)
+        self.assertIn('fablab_sql_requetes_bucket{route="api/produits/$",le="+Inf"} 2', texte)
+
+    def test_duree_des_signaux(self):
+        pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=10)
+        sandwich = Sandwich.objects.create(nom="Burger", taille="M")
+        sandwich.produits.set([pain])
+        Commande.objects.create(sandwich=sandwich)
+
+        texte = registre.texte()
+        for receveur in ("update_sandwich_poids", "update_commande_poids", "diffuser_commande"):
+            self.assertIn(f'fablab_signal_secondes_count{{receveur="{receveur}"}}', texte)
+
+    @override_settings(METRIQUES_ACTIVES=False)
+    def test_desactivees(self):
+        self.client.get("/api/produits/")
+        self.assertEqual(self.client.get("/api/metriques/").status_code, 404)
+        self.assertEqual(registre.texte(), "\n")
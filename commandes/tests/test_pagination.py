@@ -0,0 +1,61 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from commandes.models import Commande, Temperature
+from commandes.pagination import CurseurPagination
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class PaginationTestCase(BurgerMixin, TestCase):
+    """ Vérifie la pagination par curseur et le paramètre fields= """
+
+    def setUp(self):
+        super().setUp()
+        Commande.objects.bulk_create([Commande(sandwich=self.burger, quantite=1) for _ in range(25)])
+
+    def test_commandes_paginees_par_defaut(self):
+        with mock.patch.object(CurseurPagination, "page_size", 10):
+            page = self.client.get("/api/commandes/").json()
+
+        self.assertEqual(len(page["results"]), 10)
+        self.assertIsNotNone(page["next"])
+
+    def test_sans_parametre_les_petites_listes_restent_completes(self):
+        reponse = self.client.get("/api/sandwiches/")
+        self.assertIsInstance(reponse.json(), list)
+
+    def test_parcours_par_curseur(self):
+        ids, url = [], "/api/commandes/?page_size=10&fields=id"
+        while url:
+            page = self.client.get(url).json()
+            ids += [commande["id"] for commande in page["results"]]
+            url = page["next"]
+
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_fields_evite_les_jointures(self):
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.client.get("/api/commandes/?fields=id,status,poids_total&page_size=5")
+
+        self.assertEqual(set(reponse.json()["results"][0]), {"id", "status", "poids_total"})
+        self.assertEqual(len(contexte.captured_queries), 1)
+        self.assertNotIn("JOIN", contexte.captured_queries[0]["sql"])
+
+    def test_temperatures_par_date(self):
+        maintenant = timezone.now()
+        Temperature.objects.bulk_create([
+            Temperature(temperature=20.0 + i, humidite=40.0, date_heure=maintenant - timedelta(minutes=i))
+            for i in range(5)
+        ])
+
+        page = self.client.get("/api/temperature/?page_size=2").json()
+        self.assertEqual([p["temperature"] for p in page["results"]], [20.0, 21.0])
+        self.assertEqual(len(self.client.get(page["next"]).json()["results"]), 2)
+
+    def test_temperatures_paginees_par_defaut(self):
+        Temperature.objects.bulk_create([Temperature(temperature=20.0, humidite=40.0) for _ in range(3)])
+        self.assertEqual(len(self.client.get("/api/temperature/").json()["results"]), 3)
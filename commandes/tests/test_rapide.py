@@ -0,0 +1,64 @@
+import gzip
+import json
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from commandes.models import Produit, Sandwich, Commande
+from commandes.renderers import JSONRapideRenderer
+from commandes.serializers import ProduitSerializer, SandwichSerializer, CommandeSerializer
+from commandes.views import CommandeViewSet, ProduitViewSet, SandwichViewSet
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class LectureRapideTestCase(BurgerMixin, TestCase):
+    """ Vérifie que le chemin rapide renvoie exactement le JSON des serializers DRF """
+
+    def setUp(self):
+        caches["reponses"].clear()
+        super().setUp()
+        Produit.objects.filter(pk=self.steak.pk).update(taille="L", couleur="Rouge")  # Champs non par défaut dans le JSON
+        with self.captureOnCommitCallbacks(execute=True):
+            Sandwich.objects.create(nom="Vide", taille="S")
+        for quantite in (1, 2, 3):
+            Commande.objects.create(sandwich=self.burger, quantite=quantite)
+
+    def attendu(self, serializer_class, queryset, many=True):
+        return json.loads(JSONRenderer().render(serializer_class(queryset, many=many).data))
+
+    def test_listes_identiques_au_chemin_drf(self):
+        for url, serializer_class, vue in (
+            ("/api/produits/", ProduitSerializer, ProduitViewSet),
+            ("/api/sandwiches/", SandwichSerializer, SandwichViewSet),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).json(), self.attendu(serializer_class, vue.queryset))
+        self.assertEqual(  # Commandes toujours paginées
+            self.client.get("/api/commandes/").json()["results"],
+            self.attendu(CommandeSerializer, CommandeViewSet.queryset.order_by("-id")),
+        )
+
+    def test_detail_champs_et_curseur(self):
+        commande = Commande.objects.first()
+        self.assertEqual(
+            self.client.get(f"/api/commandes/{commande.pk}/").json(),
+            self.attendu(CommandeSerializer, CommandeViewSet.queryset.get(pk=commande.pk), many=False),
+        )
+        self.assertEqual(self.client.get("/api/commandes/999/").status_code, 404)
+        self.assertEqual(
+            self.client.get("/api/sandwiches/?fields=id,nom").json(),
+            [{"id": s.pk, "nom": s.nom} for s in Sandwich.objects.order_by("pk")],
+        )
+        page = self.client.get("/api/commandes/?page_size=2&fields=id,quantite").json()
+        self.assertEqual([c["quantite"] for c in page["results"]], [3, 2])
+        self.assertEqual([c["quantite"] for c in self.client.get(page["next"]).json()["results"]], [1])
+
+    def test_gzip_par_vue(self):
+        reponse = self.client.get("/api/commandes/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(reponse["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(reponse.content))["results"]), 3)
+
+        self.assertFalse(self.client.get("/api/produits/", HTTP_ACCEPT_ENCODING="gzip").has_header("Content-Encoding"))
+
+    def test_rendu_identique(self):
+        donnees = {"nom": "Végé\u2028", "poids": 12.5, "liste": [1, None, True]}
+        self.assertEqual(JSONRapideRenderer().render(donnees), JSONRenderer().render(donnees))
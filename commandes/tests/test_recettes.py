@@ -0,0 +1,59 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from commandes import recettes, versions
+from commandes.models import Sandwich, Commande
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)  # Pas de minuteur de diffusion pendant les tests
+class RecettesTestCase(BurgerMixin, TestCase):
+    """ Vérifie le poids des sandwiches et la nomenclature en cache """
+
+    def test_set_recalcule_le_poids_une_seule_fois(self):
+        with CaptureQueriesContext(connection) as contexte:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.burger.produits.set([self.pain, self.steak])
+                self.burger.produits.set([self.steak])
+
+        mises_a_jour = [q for q in contexte.captured_queries if q["sql"].startswith('UPDATE "commandes_sandwich"')]
+        self.assertEqual(len(mises_a_jour), 1)
+        self.burger.refresh_from_db()
+        self.assertEqual(self.burger.poids_total, 120.0)
+
+    def test_changement_de_poids_d_un_produit(self):
+        autre = Sandwich.objects.create(nom="Double", taille="L")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.produits.set([self.pain, self.steak])
+            autre.produits.set([self.steak])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.steak.poids = 150.0
+            self.steak.save()
+
+        self.assertEqual(
+            dict(Sandwich.objects.values_list("nom", "poids_total")),
+            {"Burger": 200.0, "Double": 150.0},
+        )
+
+    def test_nomenclature_en_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.produits.set([self.pain, self.steak])
+
+        recette = recettes.nomenclature(self.burger.pk)
+        self.assertEqual(recette["poids_total"], 170.0)
+        self.assertEqual(sorted(recette["produits"]), sorted([self.pain.pk, self.steak.pk]))
+
+        with self.assertNumQueries(1):  # Uniquement l'INSERT de la commande
+            commande = Commande.objects.create(sandwich_id=self.burger.pk, quantite=2)
+        self.assertEqual(commande.poids_total, 340.0)
+
+    def test_changement_dans_un_autre_processus(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.burger.produits.set([self.pain])
+        self.assertEqual(recettes.nomenclature(self.burger.pk)["produits"], [self.pain.pk])
+
+        # 🔹 Autre processus : la base et le compteur partagé changent, pas le cache local ni ses signaux
+        Sandwich.produits.through.objects.create(sandwich_id=self.burger.pk, produit_id=self.steak.pk)
+        versions._incrementer(["sandwiches"])
+
+        self.assertEqual(sorted(recettes.nomenclature(self.burger.pk)["produits"]), [self.pain.pk, self.steak.pk])
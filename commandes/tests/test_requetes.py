@@ -0,0 +1,56 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from commandes.models import Produit, Sandwich, Commande
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)  # Pas de minuteur de diffusion pendant les tests
+class NombreRequetesTestCase(TestCase):
+    """ Vérifie que les listes ne font pas une requête par ligne (N+1) """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.numero = 0
+
+    def creer_commandes(self, nombre):
+        """ Crée `nombre` commandes, chacune avec son propre sandwich de deux produits """
+        for _ in range(nombre):
+            self.numero += 1
+            pain = Produit.objects.create(nom=f"Pain {self.numero}", taille="M", poids=50.0, quantite_stock=10)
+            steak = Produit.objects.create(nom=f"Steak {self.numero}", taille="M", poids=120.0, quantite_stock=10)
+            with self.captureOnCommitCallbacks(execute=True):  # Recalcul du poids au commit
+                sandwich = Sandwich.objects.create(nom=f"Burger {self.numero}", taille="M")
+                sandwich.produits.set([pain, steak])
+            Commande.objects.create(sandwich=sandwich, quantite=2)
+
+    def compter_requetes(self, url):
+        with CaptureQueriesContext(connection) as contexte:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        return len(contexte.captured_queries)
+
+    def test_liste_commandes_nombre_requetes_constant(self):
+        self.creer_commandes(1)
+        requetes_une = self.compter_requetes("/api/commandes/")
+        self.creer_commandes(20)
+        requetes_vingt = self.compter_requetes("/api/commandes/")
+
+        self.assertEqual(requetes_une, requetes_vingt)
+        self.assertLessEqual(requetes_vingt, 2)
+
+    def test_liste_sandwiches_nombre_requetes_constant(self):
+        self.creer_commandes(1)
+        requetes_une = self.compter_requetes("/api/sandwiches/")
+        self.creer_commandes(20)
+        requetes_vingt = self.compter_requetes("/api/sandwiches/")
+
+        self.assertEqual(requetes_une, requetes_vingt)
+        self.assertLessEqual(requetes_vingt, 2)
+
+    def test_liste_commandes_contenu(self):
+        self.creer_commandes(3)
+        reponse = self.client.get("/api/commandes/")
+        self.assertEqual(len(reponse.json()["results"]), 3)
+        for commande in reponse.json()["results"]:
+            self.assertEqual(len(commande["sandwich"]["produits"]), 2)
+            self.assertEqual(commande["poids_total"], 340.0)
@@ -0,0 +1,175 @@
+from unittest import mock
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from commandes.diffusion import diffuseur_stock
+from commandes import stock
+from commandes.models import MouvementStock, Produit, Sandwich, Commande
+from commandes.serializers import SandwichSerializer
+from commandes.stock import solde
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(TACHES_SYNCHRONES=True)
+class ConsommationStockTestCase(BurgerMixin, TestCase):
+    """ Vérifie la décrémentation du stock quand une commande est terminée """
+
+    stock_steak = 8
+
+    def setUp(self):
+        super().setUp()
+        self.commande = Commande.objects.create(sandwich=self.burger, quantite=3)
+
+    def terminer(self, commande):
+        with self.captureOnCommitCallbacks(execute=True):  # Consommation lancée après le commit
+            commande.status = "terminée"
+            commande.save()
+
+    def test_terminer_decremente_tous_les_ingredients(self):
+        self.terminer(self.commande)
+
+        self.assertEqual(solde(self.pain.pk), 7)
+        self.assertEqual(solde(self.steak.pk), 5)
+
+    def test_terminer_deux_fois_ne_decremente_qu_une_fois(self):
+        self.terminer(self.commande)
+        self.terminer(self.commande)
+
+        self.assertEqual(solde(self.pain.pk), 7)
+
+    @override_settings(STOCK_DIFFUSION_FENETRE=0)
+    def test_une_seule_diffusion_par_commande(self):
+        with mock.patch.object(diffuseur_stock, "_envoyer") as envoyer:
+            self.terminer(self.commande)
+
+        envoyer.assert_called_once()
+        message = envoyer.call_args.args[0]
+        self.assertEqual(message["stock_total"], 12)
+        self.assertEqual({p["nom"]: p["quantite"] for p in message["produits"]}, {"Pain": 7, "Steak": 5})
+
+    def test_commandes_concurrentes_sans_perte(self):
+        """ Deux instances lues avant la décrémentation ne s'écrasent plus """
+        autre = Commande.objects.create(sandwich=self.burger, quantite=2)
+        premiere = Commande.objects.get(pk=self.commande.pk)
+        seconde = Commande.objects.get(pk=autre.pk)
+
+        self.terminer(premiere)
+        self.terminer(seconde)
+
+        self.assertEqual(solde(self.steak.pk), 3)
+
+    def test_consommation_plafonnee_au_solde(self):
+        grosse = Commande.objects.create(sandwich=self.burger, quantite=9)
+        with self.assertLogs("commandes.stock", "WARNING") as journal:
+            self.terminer(grosse)
+
+        self.assertEqual(solde(self.pain.pk), 1)
+        self.assertEqual(solde(self.steak.pk), 0)  # 🔹 Jamais négatif
+        self.assertIn("stock.rupture", journal.output[0])
+
+    def test_lot_plafonne_sans_verrou_sur_les_produits(self):
+        with self.assertLogs("commandes.stock", "WARNING"), self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(3) as requetes:  # SAVEPOINT, un INSERT ... SELECT pour tout le lot, RELEASE
+                stock.consommer_stocks([(self.burger.pk, 6, None), (self.burger.pk, 6, None)])
+
+        self.assertEqual(solde(self.pain.pk), 0)  # 🔹 6 + 4 : la seconde ligne voit la première
+        self.assertEqual(solde(self.steak.pk), 0)
+        self.assertEqual(
+            sorted(MouvementStock.objects.filter(produit=self.steak).values_list("quantite", flat=True)), [-6, -2]
+        )
+        self.assertFalse(any("FOR UPDATE" in requete["sql"] for requete in requetes.captured_queries))
+
+    def test_instantane_negatif_refuse(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Produit.objects.filter(pk=self.pain.pk).update(quantite_stock=-1)
+
+    def test_soldes_d_une_liste_en_une_requete(self):
+        produits = [Produit.objects.create(nom=f"Garniture {i}", taille="M", poids=10.0) for i in range(5)]
+        self.burger.produits.add(*produits)
+
+        sandwich = Sandwich.objects.get(pk=self.burger.pk)
+        with self.assertNumQueries(2):  # Produits du sandwich + soldes, quel que soit leur nombre
+            data = SandwichSerializer(sandwich).data
+        self.assertEqual(len(data["produits"]), 7)
+
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class DiffusionStockTestCase(TestCase):
+    """ Vérifie le regroupement des diffusions WebSocket du stock """
+
+    def test_reassort_groupe_une_seule_diffusion(self):
+        produits = [Produit(nom=f"Ingrédient {i}", taille="M", poids=10.0) for i in range(200)]
+        with mock.patch.object(diffuseur_stock, "_envoyer") as envoyer:
+            with diffuseur_stock.regrouper(), self.captureOnCommitCallbacks(execute=True):
+                for produit in produits:
+                    produit.quantite_stock = 5
+                    produit.save()
+                for produit in produits:
+                    produit.quantite_stock += 5
+                    produit.save()
+
+        envoyer.assert_called_once()
+        message = envoyer.call_args.args[0]
+        self.assertEqual(message["fusions"], 400)
+        self.assertEqual(len(message["produits"]), 200)
+        self.assertEqual(message["stock_total"], 2000)
+
+    def test_rien_n_est_publie_si_transaction_annulee(self):
+        with mock.patch.object(diffuseur_stock, "_envoyer") as envoyer:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        Produit.objects.create(nom="Annulé", taille="M", poids=10.0)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+
+        envoyer.assert_not_called()
+
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class JournalStockTestCase(TestCase):
+    """ Vérifie le journal des mouvements de stock et sa compaction """
+
+    def setUp(self):
+        self.pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=10)
+        self.sandwich = Sandwich.objects.create(nom="Tartine", taille="M")
+        self.sandwich.produits.set([self.pain])
+
+    def test_consommation_inseree_sans_modifier_le_produit(self):
+        commande = Commande.objects.create(sandwich=self.sandwich, quantite=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.status = "terminée"
+            commande.save()
+
+        self.pain.refresh_from_db()
+        self.assertEqual(self.pain.quantite_stock, 10)  # Instantané inchangé
+        self.assertEqual(solde(self.pain.pk), 8)
+        mouvement = MouvementStock.objects.get()
+        self.assertEqual((mouvement.quantite, mouvement.motif, mouvement.commande_id), (-2, "consommation", commande.pk))
+
+    def test_compaction_conserve_le_solde_et_l_historique(self):
+        stock.ajouter(self.pain.pk, 5)
+        stock.consommer_stock(self.sandwich.pk, 3)
+
+        self.assertEqual(stock.compacter(delai=-1), 2)
+        self.pain.refresh_from_db()
+        self.assertEqual(self.pain.quantite_stock, 12)
+        self.assertEqual(solde(self.pain.pk), 12)
+        self.assertEqual(MouvementStock.objects.count(), 2)
+
+        stock.ajouter(self.pain.pk, 1)  # Nouvelle queue après la compaction
+        self.assertEqual(solde(self.pain.pk), 13)
+        self.assertEqual(stock.compacter(delai=-1), 1)
+        self.assertEqual(stock.compacter(delai=-1), 0)
+
+    def test_api_ajout_et_correction(self):
+        reponse = self.client.post(
+            "/api/addstock/ajouter_stock/",
+            {"nom": "Pain", "taille": "M", "couleur": "Jaune", "quantite_stock": 4, "poids": 50.0},
+            content_type="application/json",
+        )
+        self.assertEqual(reponse.status_code, 200)
+        reponse = self.client.patch(f"/api/produits/{self.pain.pk}/", {"quantite_stock": 9}, content_type="application/json")
+        self.assertEqual(reponse.json()["quantite_stock"], 9)
+
+        self.assertEqual(self.client.get("/api/stock/").json()[0]["quantite_stock"], 9)
+        self.assertEqual(list(MouvementStock.objects.values_list("motif", "quantite")), [("ajout", 4), ("correction", -5)])
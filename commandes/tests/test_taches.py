@@ -0,0 +1,145 @@
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase, override_settings
+from commandes.models import Commande, Produit, Sandwich, Tache
+from commandes.stock import solde
+from commandes.taches import Executeur, en_lot, nom_tache
+from commandes.verification import verifier
+
+appels = []
+
+def noter(valeur):
+    appels.append(valeur)
+
+def echouer():
+    raise RuntimeError("balance injoignable")
+
+lots = []
+
+def noter_lot(arguments):
+    lots.append([valeur for valeur, in arguments])
+
+def lot_en_echec(arguments):
+    raise RuntimeError("lot refusé")
+
+@en_lot(noter_lot)
+def noter_par_lot(valeur):
+    appels.append(valeur)
+
+@en_lot(lot_en_echec)
+def noter_sans_lot(valeur):
+    appels.append(valeur)
+
+@override_settings(TACHES_SYNCHRONES=False, TACHES_DELAI=0, TACHES_TENTATIVES=3)
+class ExecuteurTestCase(TestCase):
+    """ Vérifie les tâches en mémoire : nouvelles tentatives et ordre par clé """
+
+    def setUp(self):
+        appels.clear()
+        self.executeur = Executeur()
+
+    def test_nouvelle_tentative_apres_echec(self):
+        essais = []
+
+        def instable():
+            essais.append(1)
+            if len(essais) < 3:
+                raise RuntimeError("connexion perdue")
+            noter("ok")
+
+        self.executeur.soumettre(instable)
+        self.executeur.attendre()
+
+        self.assertEqual(len(essais), 3)
+        self.assertEqual(appels, ["ok"])
+
+    def test_ordre_conserve_pour_une_meme_cle(self):
+        for i in range(50):
+            self.executeur.soumettre(noter, i, cle="stock")
+        self.executeur.attendre()
+
+        self.assertEqual(appels, list(range(50)))
+
+@override_settings(TACHES_SYNCHRONES=False, TACHES_PROCESSUS_SEPARE=True, TACHES_DELAI=0, TACHES_TENTATIVES=2)
+class TachesDurablesTestCase(TestCase):
+    """ Vérifie les tâches durables : écrites avec la transaction, exécutées une fois """
+
+    def setUp(self):
+        appels.clear()
+        lots.clear()
+        self.executeur = Executeur()
+        self.pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=10)
+        self.sandwich = Sandwich.objects.create(nom="Tartine", taille="M")
+        self.sandwich.produits.set([self.pain])
+
+    def test_commande_terminee_cree_une_tache(self):
+        commande = Commande.objects.create(sandwich=self.sandwich, quantite=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.status = "terminée"
+            commande.save()
+
+        self.assertEqual(Tache.objects.count(), 1)
+        self.assertEqual(solde(self.pain.pk), 10)  # Pas encore exécutée
+
+        self.assertEqual(self.executeur.traiter_durables(), 1)
+        self.assertEqual(solde(self.pain.pk), 8)
+        self.assertFalse(Tache.objects.exists())
+        self.assertEqual(self.executeur.traiter_durables(), 0)
+
+    def test_tache_annulee_avec_la_transaction(self):
+        try:
+            with transaction.atomic():
+                self.executeur.apres_commit(noter, 1, durable=True)
+                raise RuntimeError("annulation")
+        except RuntimeError:
+            pass
+
+        self.assertFalse(Tache.objects.exists())
+
+    def test_tache_en_echec_marquee_echouee(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.executeur.apres_commit(echouer, durable=True)
+
+        with self.assertLogs("commandes.taches", level="ERROR"):
+            self.executeur.traiter_durables()
+            self.executeur.traiter_durables()
+
+        tache = Tache.objects.get()
+        self.assertEqual(tache.nom, nom_tache(echouer))
+        self.assertEqual(tache.etat, "échouée")
+        self.assertEqual(tache.tentatives, 2)
+        self.assertIn("balance injoignable", tache.erreur)
+        self.assertEqual(self.executeur.traiter_durables(), 0)
+
+    def test_taches_de_meme_nom_executees_en_lot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for valeur in (1, 2, 3):
+                self.executeur.apres_commit(noter_par_lot, valeur, durable=True)
+            self.executeur.apres_commit(noter, 4, durable=True)
+
+        self.assertEqual(self.executeur.traiter_durables(), 4)
+        self.assertEqual(lots, [[1, 2, 3]])  # Un seul appel pour les trois
+        self.assertEqual(appels, [4])
+        self.assertFalse(Tache.objects.exists())
+
+    def test_lot_en_echec_repris_une_a_une(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for valeur in (1, 2):
+                self.executeur.apres_commit(noter_sans_lot, valeur, durable=True)
+
+        with self.assertLogs("commandes.taches", level="WARNING"):
+            self.assertEqual(self.executeur.traiter_durables(), 2)
+        self.assertEqual(appels, [1, 2])
+        self.assertFalse(Tache.objects.exists())
+
+    def test_pesees_validees_en_lot(self):
+        commandes = [Commande.objects.create(sandwich=self.sandwich, quantite=1, status="en cuisson") for _ in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for commande in commandes:
+                self.assertEqual(verifier(commande.pk, commande.poids_total)[1]["status"], "terminée")
+
+        with mock.patch("commandes.taches.Executeur._executer_durable") as une_a_une:
+            self.assertEqual(self.executeur.traiter_durables(), 3)
+        une_a_une.assert_not_called()
+        self.assertEqual(solde(self.pain.pk), 7)
+        self.assertFalse(Tache.objects.exists())
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from django.test import TestCase
+from rest_framework.test import APIClient
+from commandes import series
+from commandes.models import Temperature, TemperatureAgregat
+
+class SeriesTemperatureTestCase(TestCase):
+    """ Vérifie les agrégats de température et l'API par période """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.debut = datetime(2025, 3, 1, 10, 0, tzinfo=timezone.utc)
+
+    def test_agregats_incrementaux(self):
+        series.agreger([
+            (self.debut + timedelta(seconds=10), 20.0, 40.0),
+            (self.debut + timedelta(seconds=50), 22.0, 50.0),
+        ])
+        series.agreger([(self.debut + timedelta(minutes=1, seconds=5), 18.0, 45.0)])
+
+        minutes = TemperatureAgregat.objects.filter(resolution="1m").order_by("debut")
+        self.assertEqual([a.nombre for a in minutes], [2, 1])
+        self.assertEqual(minutes[0].temperature_moyenne, 21.0)
+        self.assertEqual(minutes[0].humidite_max, 50.0)
+
+        heure = TemperatureAgregat.objects.get(resolution="1h")
+        self.assertEqual(heure.nombre, 3)
+        self.assertEqual((heure.temperature_min, heure.temperature_max), (18.0, 22.0))
+        self.assertEqual(TemperatureAgregat.objects.get(resolution="1j").debut, self.debut.replace(hour=0))
+
+    def test_nouvelle_mesure_met_a_jour_les_agregats(self):
+        Temperature.objects.create(temperature=21.5, humidite=40.0)
+        self.assertEqual(TemperatureAgregat.objects.count(), 3)
+
+    def test_choix_de_la_resolution(self):
+        maintenant = self.debut + timedelta(days=1)
+        choisir = lambda duree: series.choisir_resolution(maintenant - duree, maintenant, maintenant)
+        self.assertEqual(choisir(timedelta(minutes=30)), "brut")
+        self.assertEqual(choisir(timedelta(hours=6)), "1m")
+        self.assertEqual(choisir(timedelta(days=7)), "1h")
+        self.assertEqual(choisir(timedelta(days=365)), "1j")
+
+    def test_api_range(self):
+        series.agreger([(self.debut + timedelta(minutes=m), 20.0 + m, 40.0) for m in range(5)])
+
+        reponse = self.client.get("/api/temperature/range/", {
+            "from": "2025-03-01T10:00:00Z", "to": "2025-03-01T10:03:00Z", "resolution": "1m",
+        })
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.json()["resolution"], "1m")
+        self.assertEqual([p["temperature"] for p in reponse.json()["points"]], [20.0, 21.0, 22.0])
+
+        reponse = self.client.get("/api/temperature/range/", {"from": "pas une date"})
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_purge_des_mesures_brutes(self):
+        ancienne = Temperature.objects.create(temperature=20.0, humidite=40.0)
+        Temperature.objects.filter(pk=ancienne.pk).update(date_heure=self.debut)
+        Temperature.objects.create(temperature=21.0, humidite=41.0)
+
+        supprimes = series.purger()
+        self.assertEqual(supprimes["brut"], 1)
+        self.assertEqual(Temperature.objects.count(), 1)
+
+    def test_modification_et_suppression_corrigent_les_agregats(self):
+        debut = series.tronquer(datetime.now(timezone.utc), "1h") - timedelta(hours=1)
+        mesures = [
+            Temperature.objects.create(date_heure=debut + timedelta(minutes=m), temperature=20.0 + m, humidite=40.0)
+            for m in range(3)
+        ]
+
+        reponse = self.client.patch(f"/api/temperature/{mesures[2].pk}/", {"temperature": 30.0}, format="json")
+        self.assertEqual(reponse.status_code, 200)
+        heure = TemperatureAgregat.objects.get(resolution="1h", debut=debut)
+        self.assertEqual((heure.nombre, heure.temperature_max, heure.temperature_somme), (3, 30.0, 71.0))
+
+        self.assertEqual(self.client.delete(f"/api/temperature/{mesures[2].pk}/").status_code, 204)
+        heure.refresh_from_db()
+        self.assertEqual((heure.nombre, heure.temperature_max), (2, 21.0))
+        self.assertFalse(TemperatureAgregat.objects.filter(resolution="1m", debut=debut + timedelta(minutes=2)).exists())
+
+    def test_suppression_hors_retention_corrige_nombre_et_sommes(self):
+        mesures = [
+            Temperature.objects.create(date_heure=self.debut + timedelta(seconds=s), temperature=t, humidite=40.0)
+            for s, t in ((10, 20.0), (20, 24.0))
+        ]
+        mesures[1].delete()
+
+        minute = TemperatureAgregat.objects.get(resolution="1m")
+        self.assertEqual((minute.nombre, minute.temperature_somme), (1, 20.0))
+
+    def test_purge_conserve_les_agregats(self):
+        Temperature.objects.create(date_heure=self.debut, temperature=20.0, humidite=40.0)
+        series.purger()
+        self.assertEqual(TemperatureAgregat.objects.get(resolution="1h").nombre, 1)
+
+    def test_mesures_brutes_limitees(self):
+        Temperature.objects.bulk_create([
+            Temperature(date_heure=self.debut + timedelta(seconds=s), temperature=20.0, humidite=40.0) for s in range(5)
+        ])
+        parametres = {"from": "2025-03-01T10:00:00Z", "to": "2025-03-01T10:01:00Z", "resolution": "brut"}
+        with mock.patch.object(series, "BRUT_MAX", 3):
+            premiere = self.client.get("/api/temperature/range/", parametres).json()
+            suite = self.client.get("/api/temperature/range/", {**parametres, "from": premiere["suivant"]}).json()
+
+        self.assertEqual(len(premiere["points"]), 3)
+        self.assertEqual(len(suite["points"]), 2)
+        self.assertNotIn("suivant", suite)
+
+    def test_ingestion_par_lot_json(self):
+        points = [
+            {"date_heure": "2025-03-01T10:00:10Z", "temperature": 20.0, "humidite": 40.0},
+            {"date_heure": "2025-03-01T10:00:40Z", "temperature": 22.0, "humidite": 42.0},
+            {"date_heure": "hier", "temperature": 20.0, "humidite": 40.0},
+            {"temperature": "chaud", "humidite": 140.0},
+        ]
+        reponse = self.client.post("/api/temperature/batch/", points, format="json")
+
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.json()["acceptes"], 2)
+        self.assertEqual([r["index"] for r in reponse.json()["rejets"]], [2, 3])
+        self.assertEqual(set(reponse.json()["rejets"][1]["erreurs"]), {"temperature", "humidite"})
+        self.assertEqual(Temperature.objects.filter(date_heure__lt=self.debut + timedelta(minutes=1)).count(), 2)
+        self.assertEqual(TemperatureAgregat.objects.get(resolution="1m").nombre, 2)
+
+    def test_ingestion_par_lot_ndjson(self):
+        corps = "\n".join([
+            '{"date_heure": "2025-03-01T10:00:10Z", "temperature": 20.0, "humidite": 40.0}',
+            "pas du json",
+            '{"temperature": 21.0, "humidite": 41.0}',
+        ])
+        reponse = self.client.post("/api/temperature/batch/", corps, content_type="application/x-ndjson")
+
+        self.assertEqual(reponse.status_code, 201)
+        self.assertEqual(reponse.json()["acceptes"], 2)
+        self.assertEqual(reponse.json()["rejets"], [{"index": 1, "erreurs": {"point": "Objet JSON attendu"}}])
@@ -0,0 +1,106 @@
+from unittest import mock
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from commandes import etats
+from commandes.models import Commande
+from commandes.verification import verifier
+from commandes.stock import solde
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(TACHES_SYNCHRONES=True, STOCK_DIFFUSION_FENETRE=0)
+class VerificationPoidsTestCase(BurgerMixin, TestCase):
+    """ Vérifie l'endpoint de la balance """
+
+    def setUp(self):
+        super().setUp()
+        self.commande = Commande.objects.create(sandwich=self.burger, quantite=2)
+
+    def peser(self, poids, commande=None):
+        with self.captureOnCommitCallbacks(execute=True):  # Effets de bord lancés après le commit
+            return self.client.post(
+                "/api/verification-poids/",
+                {"code_commande": (commande or self.commande).pk, "poids_mesure": poids},
+                content_type="application/json",
+            )
+
+    def test_poids_correct_termine_la_commande(self):
+        reponse = self.peser(342.0)
+
+        self.assertEqual(reponse.json()["status"], "terminée")
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.status, "terminée")
+        self.assertEqual(solde(self.pain.pk), 8)
+
+    def test_double_pesee_ne_decremente_qu_une_fois(self):
+        self.peser(340.0)
+        reponse = self.peser(340.0)
+
+        self.assertEqual(reponse.json()["status"], "terminée")
+        self.assertEqual(solde(self.steak.pk), 8)
+
+    def test_mauvais_poids_remet_en_attente(self):
+        Commande.objects.filter(pk=self.commande.pk).update(status="en cuisson")
+        reponse = self.peser(200.0)
+
+        self.assertEqual(reponse.json()["status"], "en attente")
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.status, "en attente")
+
+    def test_commande_inconnue(self):
+        reponse = self.client.post(
+            "/api/verification-poids/", {"code_commande": 9999, "poids_mesure": 10}, content_type="application/json"
+        )
+        self.assertEqual(reponse.status_code, 404)
+
+    def test_une_lecture_et_un_update(self):
+        with mock.patch("commandes.verification.executeur.apres_commit") as apres_commit:
+            with self.assertNumQueries(4):  # SELECT de la commande, UPDATE du statut dans sa transaction (SAVEPOINT / RELEASE)
+                reponse = self.peser(340.0)
+        self.assertEqual(reponse.json()["status"], "terminée")
+        apres_commit.assert_called_once()
+
+    def test_refus_d_une_commande_deja_en_attente_sans_ecriture(self):
+        with self.assertNumQueries(1):
+            reponse = self.peser(100.0)
+        self.assertEqual(reponse.json()["status"], "en attente")
+
+    def test_statut_change_pendant_la_pesee(self):
+        Commande.objects.filter(pk=self.commande.pk).update(status="validée")
+        first = QuerySet.first
+        lectures = iter([("en cuisson", 340.0, self.burger.pk, 2)])  # 🔹 Lue juste avant le changement de statut
+
+        with mock.patch.object(QuerySet, "first", lambda qs: next(lectures, None) or first(qs)):
+            reponse = self.peser(200.0)
+
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse.json()["status"], "validée")  # Statut réel, pas « en attente »
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.status, "validée")
+
+    def test_statut_annule_si_la_tache_durable_echoue(self):
+        with mock.patch("commandes.verification.executeur.apres_commit", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                verifier(self.commande.pk, 340.0)
+
+        self.commande.refresh_from_db()
+        self.assertEqual(self.commande.status, "en attente")  # 🔹 Ni statut ni tâche : la balance peut repeser
+
+    def test_transition_par_lot_vue_par_la_balance(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            etats.transition([self.commande.pk], "terminée")  # UPDATE en lot, sans signal
+
+        reponse = self.peser(342.0)
+
+        self.assertEqual(reponse.json()["message"], "✅ Commande déjà terminée.")
+        self.assertEqual(solde(self.pain.pk), 8)  # Consommé une seule fois
+
+    def test_commande_creee_sans_signal(self):
+        # 🔹 Écrite par bulk_create ou un autre processus : lue en base comme les autres
+        nouvelle, = Commande.objects.bulk_create([Commande(sandwich=self.burger, quantite=1, poids_total=170.0)])
+
+        reponse = self.peser(170.0, nouvelle)
+
+        self.assertEqual(reponse.json()["status"], "terminée")
+        nouvelle.refresh_from_db()
+        self.assertEqual(nouvelle.status, "terminée")
+        self.assertEqual(solde(self.pain.pk), 9)
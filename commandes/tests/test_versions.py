@@ -0,0 +1,109 @@
+from unittest import mock
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from commandes import versions
+from commandes.diffusion import DiffuseurStock
+from commandes.models import Produit, VersionRessource
+from commandes.tests.fixtures import BurgerMixin
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0)
+class GetConditionnelTestCase(BurgerMixin, TestCase):
+    """ Vérifie les ETag et les réponses 304 pilotés par les compteurs de version """
+
+    def revalider(self, url):
+        """ Premier GET, puis GET conditionnel avec l'ETag reçu """
+        premiere = self.client.get(url)
+        self.assertEqual(premiere.status_code, 200)
+        return premiere["ETag"], premiere
+
+    def test_304_sans_requete_sql(self):
+        for url in ("/api/produits/", "/api/stock/", "/api/sandwiches/"):
+            etag, _ = self.revalider(url)
+            with self.assertNumQueries(0):
+                reponse = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(reponse.status_code, 304)
+
+    def test_changement_de_stock_change_l_etag(self):
+        etag_produits, _ = self.revalider("/api/produits/")
+        etag_sandwiches, _ = self.revalider("/api/sandwiches/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pain.quantite_stock = 3
+            self.pain.save()
+
+        # 🔹 Le sandwich affiche le stock de ses produits : son ETag change aussi
+        self.assertEqual(self.client.get("/api/produits/", HTTP_IF_NONE_MATCH=etag_produits).status_code, 200)
+        self.assertEqual(self.client.get("/api/sandwiches/", HTTP_IF_NONE_MATCH=etag_sandwiches).status_code, 200)
+
+    def test_etag_depend_des_parametres(self):
+        etag, _ = self.revalider("/api/produits/")
+        reponse = self.client.get("/api/produits/?fields=id", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, VERSIONS_CACHE=None)
+class VersionsEnBaseTestCase(TestCase):
+    """ Compteurs en base (plusieurs processus sans Redis) : une requête par GET conditionnel """
+
+    def setUp(self):
+        self.pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=10)
+
+    def test_etag_et_304(self):
+        etag = self.client.get("/api/produits/")["ETag"]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/produits/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pain.quantite_stock = 3
+            self.pain.save()
+        self.assertEqual(self.client.get("/api/produits/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(VersionRessource.objects.filter(nom="produits").count(), 1)
+
+
+LAYER_PARTAGE = {"default": {"BACKEND": "commandes.layers.SocketChannelLayer", "CONFIG": {"chemin": "channels.sock"}}}
+
+class ConfigurationVersionsTestCase(SimpleTestCase):
+    """ Plusieurs processus : des compteurs propres à chaque processus sont refusés au démarrage """
+
+    @override_settings(PROCESSUS_MULTIPLES=True, VERSIONS_CACHE="default", CHANNEL_LAYERS=LAYER_PARTAGE)
+    def test_cache_local_refuse(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "VERSIONS_CACHE"):
+            versions.verifier_configuration()
+
+    @override_settings(PROCESSUS_MULTIPLES=True, VERSIONS_CACHE=None, CHANNEL_LAYERS=LAYER_PARTAGE)
+    def test_compteurs_en_base_acceptes(self):
+        versions.verifier_configuration()
+
+    @override_settings(PROCESSUS_MULTIPLES=True, VERSIONS_CACHE=None)
+    def test_layer_en_memoire_refuse(self):
+        # TACHES_PROCESSUS_SEPARE avec CHANNEL_LAYER=memory : les diffusions du processus de tâches seraient perdues
+        with self.assertRaisesMessage(ImproperlyConfigured, "Channel layer en mémoire"):
+            versions.verifier_configuration()
+
+
+@override_settings(STOCK_DIFFUSION_FENETRE=0, TACHES_SYNCHRONES=True)
+class SequenceStockTestCase(TestCase):
+    """ Les seq des diffs du stock viennent d'une séquence partagée par tous les processus """
+
+    def setUp(self):
+        self.pain = Produit.objects.create(nom="Pain", taille="M", poids=50.0, quantite_stock=10)
+
+    def publier_depuis_deux_processus(self):
+        seqs = []
+        for diffuseur in (DiffuseurStock(), DiffuseurStock()):  # 🔹 Un diffuseur par processus
+            with mock.patch.object(diffuseur, "_envoyer") as envoyer:
+                diffuseur._ajouter([self.pain.pk], 1)
+                diffuseur.publier()
+            seqs.append(envoyer.call_args.args[0]["seq"])
+        return seqs
+
+    def test_seq_distincts_et_croissants(self):
+        premier, second = self.publier_depuis_deux_processus()
+        self.assertGreater(second, premier)
+        self.assertEqual(versions.courant("stock"), second)
+
+    @override_settings(VERSIONS_CACHE=None)
+    def test_seq_en_base(self):
+        premier, second = self.publier_depuis_deux_processus()
+        self.assertEqual(second, premier + 1)
+        self.assertEqual(VersionRessource.objects.get(nom="sequence:stock").version, second)
@@ -0,0 +1,72 @@
+import logging
+from django.db import transaction
+from .diffusion import publier_commandes
+from .journal import evenement
+from .models import Commande
+from .stock import consommer_stock, consommer_stocks
+from .taches import en_lot, executeur
+
+logger = logging.getLogger(__name__)
+
+# Écart de poids accepté, en grammes
+TOLERANCE = 5
+
+def verifier(commande_id, poids_mesure):
+    """ 🔹 Compare le poids mesuré au poids attendu et met à jour le statut
+
+    Retourne (code HTTP, réponse). La commande est lue par sa clé primaire (l'état
+    de référence est la base, quel que soit le processus qui l'a modifiée), puis le
+    statut est changé par un seul UPDATE conditionnel sur l'état lu : si une autre
+    requête l'a changé entre-temps, le statut courant est renvoyé avec un 409.
+    Le passage à « terminée » est écrit dans la même transaction que la tâche
+    durable de décrémentation du stock ; celle-ci et les diffusions (stock, écrans
+    des commandes) partent en arrière-plan.
+    """
+    commandes = Commande.objects.filter(pk=commande_id)
+    ligne = commandes.values_list("status", "poids_total", "sandwich_id", "quantite").first()
+    if ligne is None:
+        return 404, {"error": "Commande non trouvée"}
+    statut, poids_total, sandwich_id, quantite = ligne
+    if statut == "terminée":
+        return 200, {"message": "✅ Commande déjà terminée.", "status": statut}
+    inchangee = commandes.filter(status=statut, poids_total=poids_total)
+
+    if abs(poids_total - poids_mesure) > TOLERANCE:
+        evenement(logger, "balance.refus", logging.DEBUG, commande=commande_id, attendu=poids_total, mesure=poids_mesure)
+        if statut != "en attente":
+            with transaction.atomic():  # Attente de l'écrivain sur le verrou du moteur, pas dans le busy handler de SQLite
+                remise = inchangee.update(status="en attente")
+            if not remise:
+                return _conflit(commandes)
+            publier_commandes([(commande_id, "en attente", sandwich_id, quantite)])  # Envoi en arrière-plan
+        return 200, {"message": "❌ Erreur de poids, la commande repasse en attente.", "status": "en attente"}
+
+    with transaction.atomic():  # 🔹 Statut et tâche durable écrits ensemble, ou pas du tout
+        transition = inchangee.update(status="terminée")
+        if transition:
+            # 🔹 Cette requête a fait la transition : elle seule déclenche les effets de bord
+            executeur.apres_commit(terminer, commande_id, sandwich_id, quantite, durable=True)
+    if not transition:
+        return _conflit(commandes)
+    evenement(logger, "balance.validation", logging.DEBUG, commande=commande_id, attendu=poids_total, mesure=poids_mesure)
+    return 200, {"message": "✅ Poids validé, commande terminée.", "status": "terminée"}
+
+def _conflit(commandes):
+    """ Commande modifiée par une autre requête entre la lecture et l'UPDATE : rien n'est écrit """
+    statut = commandes.values_list("status", flat=True).first()
+    if statut is None:
+        return 404, {"error": "Commande non trouvée"}
+    if statut == "terminée":
+        return 200, {"message": "✅ Commande déjà terminée.", "status": statut}
+    return 409, {"error": "Commande modifiée pendant la pesée, peser à nouveau.", "status": statut}
+
+def terminer_lot(arguments):
+    """ Effets de bord de plusieurs pesées validées : un INSERT de mouvements et une diffusion pour tout le lot """
+    consommer_stocks([(sandwich_id, quantite, commande_id) for commande_id, sandwich_id, quantite in arguments])
+    publier_commandes([(commande_id, "terminée", sandwich_id, quantite) for commande_id, sandwich_id, quantite in arguments])
+
+@en_lot(terminer_lot)
+def terminer(commande_id, sandwich_id, quantite):
+    """ Effets de bord d'une commande terminée à la balance (exécutés en arrière-plan) """
+    consommer_stock(sandwich_id, quantite, commande_id=commande_id)
+    publier_commandes([(commande_id, "terminée", sandwich_id, quantite)])
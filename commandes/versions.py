@@ -0,0 +1,214 @@
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+# Ressources versionnées. Une réponse dépend de toutes celles qu'elle contient
+# (un sandwich affiche le stock de ses produits, une commande son sandwich).
+DEPENDANCES = {
+    "produits": ("produits",),
+    "sandwiches": ("sandwiches", "produits"),
+    "commandes": ("commandes", "sandwiches", "produits"),
+}
+
+# Caches dont l'incrément est atomique entre processus : seuls acceptés pour les
+# compteurs quand plusieurs processus servent l'API (PROCESSUS_MULTIPLES)
+CACHES_PARTAGES = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+)
+
+def _alias():
+    """ Alias du cache des compteurs, ou None : compteurs en base (VersionRessource) """
+    return getattr(settings, "VERSIONS_CACHE", "default")
+
+def _cache():
+    return caches[_alias()]
+
+def verifier_configuration():
+    """ 🔹 Refuse au démarrage des compteurs propres à chaque processus quand il y en a plusieurs
+
+    Un worker incrémenterait son compteur pendant qu'un autre renverrait des 304 périmés.
+    Un channel layer en mémoire est refusé de même : les diffusions d'un processus
+    de tâches n'atteindraient pas les clients WebSocket des processus web.
+    """
+    if not getattr(settings, "PROCESSUS_MULTIPLES", False):
+        return
+    layer = getattr(settings, "CHANNEL_LAYERS", {}).get("default", {}).get("BACKEND", "")
+    if layer == "channels.layers.InMemoryChannelLayer":
+        raise ImproperlyConfigured(
+            "Channel layer en mémoire avec plusieurs processus (TACHES_PROCESSUS_SEPARE) : "
+            "utiliser CHANNEL_LAYER=redis ou CHANNEL_LAYER=socket"
+        )
+    alias = _alias()
+    if alias is None:
+        return
+    backend = settings.CACHES[alias]["BACKEND"]
+    if backend not in CACHES_PARTAGES:
+        raise ImproperlyConfigured(
+            f"VERSIONS_CACHE = {alias!r} ({backend}) n'est pas partagé avec un incrément atomique entre processus : "
+            "utiliser Redis / memcached, ou VERSIONS_CACHE = None (compteurs en base)"
+        )
+
+def _initiale():
+    # Compteur perdu (redémarrage, éviction) : repart d'une valeur jamais servie
+    return time.time_ns()
+
+def incrementer(*noms):
+    """ 🔹 Change la version des ressources, après le commit (les lecteurs voient déjà les nouvelles données) """
+    transaction.on_commit(lambda: _incrementer(noms))
+
+def _incrementer(noms):
+    if _alias() is None:
+        _incrementer_en_base(noms)
+        return
+    cache, maintenant = _cache(), time.time()
+    for nom in noms:
+        try:
+            cache.incr(f"version:{nom}")
+        except ValueError:
+            cache.set(f"version:{nom}", _initiale(), None)
+    cache.set_many({f"version:{nom}:date": maintenant for nom in noms}, None)
+
+def _incrementer_en_base(noms):
+    from .models import VersionRessource  # Import local : models.py importe ce module
+
+    maintenant = timezone.now()
+    compteurs = VersionRessource.objects.filter(nom__in=noms)
+    if compteurs.update(version=F("version") + 1, date=maintenant) < len(noms):
+        _creer_en_base(noms, maintenant)
+
+def _creer_en_base(noms, maintenant):
+    """ Compteurs absents créés à une valeur jamais servie (ceux qui existent déjà ne sont pas touchés) """
+    from .models import VersionRessource
+
+    VersionRessource.objects.bulk_create(
+        [VersionRessource(nom=nom, version=_initiale(), date=maintenant) for nom in noms], ignore_conflicts=True
+    )
+
+def _lire_en_base(noms):
+    from .models import VersionRessource
+
+    lignes = VersionRessource.objects.filter(nom__in=noms).values_list("nom", "version", "date")
+    valeurs = {nom: (version, date.timestamp()) for nom, version, date in lignes}
+    if len(valeurs) < len(noms):
+        _creer_en_base(noms, timezone.now())
+        valeurs = {nom: (version, date.timestamp()) for nom, version, date in lignes.all()}
+    return valeurs
+
+def lire(noms):
+    """ {nom: (version, date de modification)} en une lecture du cache (ou une requête en base) """
+    if _alias() is None:
+        return _lire_en_base(noms)
+    cache = _cache()
+    cles = [f"version:{nom}" for nom in noms] + [f"version:{nom}:date" for nom in noms]
+    valeurs = cache.get_many(cles)
+    manquantes = {}
+    for nom in noms:
+        if f"version:{nom}" not in valeurs:
+            manquantes[f"version:{nom}"] = _initiale()
+            manquantes[f"version:{nom}:date"] = time.time()
+    if manquantes:
+        for cle, valeur in manquantes.items():
+            cache.add(cle, valeur, None)
+        valeurs.update(cache.get_many(list(manquantes)))
+    return {nom: (valeurs[f"version:{nom}"], valeurs.get(f"version:{nom}:date", time.time())) for nom in noms}
+
+def _initiale_sequence():
+    # En millisecondes : au-dessus de toute valeur déjà servie, sous 2**53 (entier exact en JavaScript)
+    return time.time_ns() // 1_000_000
+
+def suivant(nom):
+    """ 🔹 Numéro suivant d'une séquence partagée entre processus (seq des diffs du stock), unique et croissant """
+    if _alias() is None:
+        return _suivant_en_base(nom)
+    cache, cle = _cache(), f"sequence:{nom}"
+    try:
+        return cache.incr(cle)
+    except ValueError:
+        cache.add(cle, _initiale_sequence(), None)
+        return cache.incr(cle)
+
+def courant(nom):
+    """ Dernier numéro attribué par `suivant` (snapshot des clients) """
+    if _alias() is None:
+        return _courant_en_base(nom)
+    cache, cle = _cache(), f"sequence:{nom}"
+    cache.add(cle, _initiale_sequence(), None)
+    return cache.get(cle)
+
+def _suivant_en_base(nom):
+    from .models import VersionRessource
+
+    compteur = VersionRessource.objects.filter(nom=f"sequence:{nom}")
+    with transaction.atomic():  # L'UPDATE verrouille la ligne jusqu'à la relecture
+        if not compteur.update(version=F("version") + 1, date=timezone.now()):
+            _courant_en_base(nom)
+            compteur.update(version=F("version") + 1, date=timezone.now())
+        return compteur.values_list("version", flat=True).get()
+
+def _courant_en_base(nom):
+    from .models import VersionRessource
+
+    compteur, _ = VersionRessource.objects.get_or_create(
+        nom=f"sequence:{nom}", defaults={"version": _initiale_sequence()}
+    )
+    return compteur.version
+
+def etag(request, ressource):
+    """ ETag d'une réponse : versions des ressources, chemin complet (fields=, cursor) et format demandé
+
+    Calculé une fois par requête (GET conditionnel et cache des réponses).
+    """
+    deja_calcules = request.__dict__.setdefault("_etags", {})
+    if ressource not in deja_calcules:
+        versions = _versions(request, ressource)
+        empreinte = ":".join(
+            [request.get_full_path(), request.headers.get("Accept", "")]
+            + [f"{nom}={version}" for nom, (version, _) in sorted(versions.items())]
+        )
+        deja_calcules[ressource] = hashlib.md5(empreinte.encode()).hexdigest()
+    return deja_calcules[ressource]
+
+def _versions(request, ressource):
+    """ Versions des dépendances de la ressource, lues une fois par requête (ETag et Last-Modified) """
+    lues = request.__dict__.setdefault("_versions", {})
+    if ressource not in lues:
+        lues[ressource] = lire(DEPENDANCES[ressource])
+    return lues[ressource]
+
+def derniere_modification(request, ressource):
+    return max(date for _, date in _versions(request, ressource).values())
+
+def conditionnel(ressource):
+    """ 🔹 GET conditionnel (ETag / Last-Modified) : 304 sans requête SQL ni sérialisation si rien n'a changé """
+    return condition(
+        etag_func=lambda request, *args, **kwargs: etag(request, ressource),
+        last_modified_func=lambda request, *args, **kwargs: datetime.fromtimestamp(
+            derniere_modification(request, ressource), tz=dt_timezone.utc
+        ),
+    )
+
+class ConditionnelMixin:
+    """ GET conditionnel pour un ViewSet : `ressource_versionnee` désigne la ressource dans DEPENDANCES
+
+    Avec `reponses_en_cache = True`, les réponses rendues sont aussi gardées dans le cache des réponses.
+    """
+    ressource_versionnee = None
+    reponses_en_cache = False
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ("GET", "HEAD") and self.ressource_versionnee:
+            vue = super().dispatch
+            if self.reponses_en_cache:
+                from .cache import cache_reponse  # Import local : cache.py importe ce module
+                vue = cache_reponse(self.ressource_versionnee)(vue)
+            return conditionnel(self.ressource_versionnee)(vue)(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
@@ -2,84 +2,162 @@ from rest_framework import viewsets
 from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework import status
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.db.models import Prefetch
 import json
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from .models import Produit, Sandwich, Commande, Temperature, Addstock
-from .serializers import ProduitSerializer, SandwichSerializer, CommandeSerializer, TemperatureSerializer, AddstockSerializer
-
-class ProduitViewSet(viewsets.ModelViewSet):
+from .serializers import ProduitSerializer, SandwichSerializer, CommandeSerializer, TemperatureSerializer, AddstockSerializer, champs_demandes
+from .pagination import CurseurPagination
+from .versions import ConditionnelMixin, conditionnel
+from .cache import cache_reponse
+from .disponibilite import index_disponibilite
+from .rapide import LECTURE_COMMANDES, LECTURE_PRODUITS, LECTURE_SANDWICHES, LectureRapideMixin
+from .renderers import JSONRapideRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
+
+# JSON par orjson (si installé) puis API navigable, comme les renderers DRF par défaut
+RENDUS_RAPIDES = [JSONRapideRenderer, BrowsableAPIRenderer]
+
+class ProduitViewSet(LectureRapideMixin, ConditionnelMixin, viewsets.ModelViewSet):
     """ API pour gérer les produits """
-    queryset = Produit.objects.all()
+    queryset = Produit.objects.avec_stock()  # 🔹 Solde courant : instantané + mouvements récents
     serializer_class = ProduitSerializer
+    lecture = LECTURE_PRODUITS  # 🔹 Lectures sans ModelSerializer (voir rapide.py)
+    renderer_classes = RENDUS_RAPIDES
+    pagination_class = CurseurPagination
+    ordre_curseur = "id"
+    ressource_versionnee = "produits"  # 🔹 304 tant que les produits n'ont pas changé
 
-class SandwichViewSet(viewsets.ModelViewSet):
+class SandwichViewSet(LectureRapideMixin, ConditionnelMixin, viewsets.ModelViewSet):
     """ API pour gérer les sandwiches """
-    queryset = Sandwich.objects.all()
+    # 🔹 Les produits sont chargés en une seule requête pour tous les sandwiches
+    queryset = Sandwich.objects.prefetch_related(Prefetch("produits", queryset=Produit.objects.avec_stock()))
     serializer_class = SandwichSerializer
+    lecture = LECTURE_SANDWICHES
+    renderer_classes = RENDUS_RAPIDES
+    pagination_class = CurseurPagination
+    ordre_curseur = "id"
+    ressource_versionnee = "sandwiches"
+    reponses_en_cache = True  # 🔹 JSON rendu gardé en cache jusqu'au prochain changement
+
+    def get_queryset(self):
+        champs = champs_demandes(self.request)
+        if champs is not None and "produits" not in champs:
+            return Sandwich.objects.all()  # 🔹 Produits non demandés : pas de prefetch
+        return super().get_queryset()
+
+    @action(detail=False, methods=['get'])
+    def disponibles(self, request):
+        """ 🔹 Portions réalisables de chaque sandwich avec le stock courant, servies depuis la mémoire """
+        return Response(index_disponibilite.tout())
 
-class CommandeViewSet(viewsets.ModelViewSet):
+class CommandeViewSet(LectureRapideMixin, ConditionnelMixin, viewsets.ModelViewSet):
     """ API pour gérer les commandes """
-    queryset = Commande.objects.all()
+    # 🔹 Commandes + sandwiches (JOIN) puis produits (1 requête) : nombre de requêtes fixe
+    queryset = Commande.objects.select_related("sandwich").prefetch_related(
+        Prefetch("sandwich__produits", queryset=Produit.objects.avec_stock())
+    )
     serializer_class = CommandeSerializer
+    lecture = LECTURE_COMMANDES
+    renderer_classes = RENDUS_RAPIDES
+    compression_gzip = True  # 🔹 La plus grosse liste : compressée si le client accepte gzip
+    pagination_class = CurseurPagination
+    pagination_toujours = True  # 🔹 Jamais toute la table : l'historique complet passe par /api/export/commandes/
+    ordre_curseur = "-id"  # Même ordre que date_commande, sur la clé primaire
+    ressource_versionnee = "commandes"
+
+    def get_queryset(self):
+        champs = champs_demandes(self.request)
+        if champs is not None and "sandwich" not in champs:
+            return Commande.objects.all()  # 🔹 Sandwich non demandé : ni JOIN ni prefetch
+        return super().get_queryset()
 
     @action(detail=True, methods=['post'])
     def changer_statut(self, request, pk=None):
         """ Permet de changer le statut d'une commande """
-        commande = self.get_object()
         nouveau_statut = request.data.get("statut")
 
+        if not str(pk).isdigit():
+            return Response({"error": "Commande non trouvée"}, status=status.HTTP_404_NOT_FOUND)
         if nouveau_statut not in dict(Commande.STATUS_CHOICES):
             return Response({"error": "Statut invalide"}, status=status.HTTP_400_BAD_REQUEST)
 
-        commande.status = nouveau_statut
-        commande.save()
+        # 🔹 Transition validée par un UPDATE conditionnel, stock décrémenté dans la même transaction
+        modifiees, refus = etats.transition([int(pk)], nouveau_statut)
+        if refus:
+            code = status.HTTP_404_NOT_FOUND if refus[0]["status"] is None else status.HTTP_409_CONFLICT
+            return Response({"error": refus[0]["erreur"]}, status=code)
+
+        return Response({"message": f"Statut changé en {nouveau_statut}"}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='statut')
+    def statut_lot(self, request):
+        """ Change le statut de plusieurs commandes : {"ids": [...], "statut": ..., "depuis": optionnel} """
+        ids, nouveau_statut, depuis = request.data.get("ids"), request.data.get("statut"), request.data.get("depuis")
 
-        print(f"🛠️ Statut de la commande {commande.id} changé en {commande.status}")
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return Response({"error": "Liste d'identifiants attendue"}, status=status.HTTP_400_BAD_REQUEST)
+        if nouveau_statut not in etats.TRANSITIONS or (depuis is not None and depuis not in etats.TRANSITIONS):
+            return Response({"error": "Statut invalide"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.COMMANDE_LOT_MAX:
+            return Response(
+                {"error": f"Au plus {settings.COMMANDE_LOT_MAX} commandes par requête"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        modifiees, refus = etats.transition(ids, nouveau_statut, depuis)
+        return Response({"modifiees": modifiees, "refus": refus}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """ Création d'un lot de commandes [{sandwich_id, quantite}, ...] : tout ou rien, en une transaction """
+        lignes = request.data
+        if not isinstance(lignes, list) or not lignes:
+            return Response({"error": "Tableau de commandes attendu"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(lignes) > settings.COMMANDE_LOT_MAX:
+            return Response(
+                {"error": f"Au plus {settings.COMMANDE_LOT_MAX} commandes par requête"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
 
-        # Envoyer une mise à jour WebSocket après le changement de statut
-        update_stock()
+        commandes, rejets = lots.valider_lignes(lignes)
+        if rejets:
+            return Response({"rejets": rejets}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"message": f"Statut changé en {commande.status}"}, status=status.HTTP_200_OK)
+        lots.creer_commandes(commandes)
+        return Response({"ids": [commande.pk for commande in commandes]}, status=status.HTTP_201_CREATED)
 
+@conditionnel("produits")
+@cache_reponse("produits")
 @api_view(['GET'])
 def stock_actuel(request):
     """ Endpoint pour récupérer le stock des ingrédients """
-    produits = Produit.objects.all()
+    produits = Produit.objects.avec_stock()
     serializer = ProduitSerializer(produits, many=True)
     return Response(serializer.data)
 
-def update_stock():
-    """ Envoie une mise à jour du stock via WebSockets """
-    channel_layer = get_channel_layer()
-    
-    if channel_layer is None:
-        print("❌ ERREUR : `get_channel_layer()` est None. Vérifie que Django Channels est bien configuré.")
-        return
-
-    print("✅ `get_channel_layer()` fonctionne bien ! Envoi de la mise à jour du stock...")
-
-    produits = Produit.objects.all()
-    stock_data = [{"nom": p.nom, "quantite": p.quantite_stock} for p in produits]
-
-    try:
-        async_to_sync(channel_layer.group_send)(
-            "stock_updates",
-            {"type": "send_stock_update", "data": stock_data}
-        )
-        print("📡 WebSocket : mise à jour envoyée avec succès !")
-    except Exception as e:
-        print(f"❌ ERREUR WebSocket : {e}")
-
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.conf import settings
 from rest_framework.decorators import api_view
+from rest_framework.parsers import JSONParser
 from .models import Temperature
+from .parsers import NDJSONParser
 from .serializers import TemperatureSerializer
+from django.views.decorators.http import require_GET
+from . import cache, etats, export, lots, series, stock, verification
+from .diffusion import diffuseur_stock
+from .metriques import actives as metriques_actives, registre as registre_metriques
 
 class TemperatureViewSet(viewsets.ModelViewSet):
     queryset = Temperature.objects.all()
     serializer_class = TemperatureSerializer
+    pagination_class = CurseurPagination
+    pagination_toujours = True  # Historique complet : /api/export/temperature/
+    ordre_curseur = "-date_heure"
 
     @action(detail=False, methods=['get'])
     def last_50(self, request):
@@ -88,6 +166,69 @@ class TemperatureViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(last_50_temperatures, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='batch', parser_classes=[JSONParser, NDJSONParser])
+    def batch(self, request):
+        """ Ingestion d'un lot de mesures (tableau JSON ou NDJSON de {date_heure, temperature, humidite}) """
+        points = request.data
+        if not isinstance(points, list):
+            return Response({"error": "Tableau de mesures attendu"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > settings.TEMPERATURE_LOT_MAX:
+            return Response(
+                {"error": f"Au plus {settings.TEMPERATURE_LOT_MAX} mesures par requête"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        mesures, rejets = series.valider_points(points)
+        series.enregistrer(mesures)
+
+        code = status.HTTP_201_CREATED if mesures or not points else status.HTTP_400_BAD_REQUEST
+        return Response({"acceptes": len(mesures), "rejets": rejets}, status=code)
+
+    @action(detail=False, methods=['get'], url_path='range')
+    def plage(self, request):
+        """ Mesures d'une période : /api/temperature/range/?from=&to=&resolution=auto|brut|1m|1h|1j """
+        fin, debut = lire_date(request.query_params.get("to")), lire_date(request.query_params.get("from"))
+        if debut is False or fin is False:
+            return Response({"error": "Date invalide (format ISO 8601 attendu)"}, status=status.HTTP_400_BAD_REQUEST)
+        fin = fin or timezone.now()
+        debut = debut or fin - timedelta(days=1)
+        if debut >= fin:
+            return Response({"error": "'from' doit précéder 'to'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        resolution = request.query_params.get("resolution", "auto")
+        if resolution == "auto":
+            resolution = series.choisir_resolution(debut, fin)
+        elif resolution != "brut" and resolution not in series.RESOLUTIONS:
+            return Response({"error": "Résolution invalide"}, status=status.HTTP_400_BAD_REQUEST)
+
+        points, suivant = series.lire(debut, fin, resolution)
+        reponse = {"resolution": resolution, "points": points}
+        if suivant is not None:
+            reponse["suivant"] = suivant  # 🔹 Mesures brutes tronquées : reprendre avec from=suivant
+        return Response(reponse)
+
+@require_GET
+def exporter(request, ressource):
+    """ Export en flux : /api/export/<commandes|mouvements|temperature>/?format=csv|ndjson&from=&to= """
+    if ressource not in export.EXPORTS:
+        raise Http404
+    format = request.GET.get("format", "csv")
+    if format not in export.FORMATS:
+        return JsonResponse({"error": f"Format invalide ({', '.join(export.FORMATS)})"}, status=400)
+    debut, fin = lire_date(request.GET.get("from")), lire_date(request.GET.get("to"))
+    if debut is False or fin is False:
+        return JsonResponse({"error": "Date invalide (format ISO 8601 attendu)"}, status=400)
+    return export.reponse(request, ressource, format, debut, fin)
+
+def lire_date(valeur):
+    """ Date ISO 8601 d'un paramètre de requête : None si absent, False si invalide """
+    if not valeur:
+        return None
+    date = parse_datetime(valeur)
+    if date is None:
+        return False
+    return timezone.make_aware(date) if timezone.is_naive(date) else date
+
 @csrf_exempt
 def verifier_poids_commande(request):
     """ Vérifie si le poids mesuré correspond à la commande et met à jour son statut """
@@ -101,42 +242,49 @@ def verifier_poids_commande(request):
             if not code_commande or poids_mesure is None:
                 return JsonResponse({"error": "Données manquantes"}, status=400)
 
-            # Recherche de la commande
-            commande = Commande.objects.filter(id=code_commande).first()
-
-            if not commande:
-                return JsonResponse({"error": "Commande non trouvée"}, status=404)
-
-            # Vérification du poids avec une tolérance de ±5g
-            tolerance = 5  
-            if abs(commande.poids_total - poids_mesure) <= tolerance:
-                commande.status = "terminée"
-                message = "✅ Poids validé, commande terminée."
-            else:
-                commande.status = "en attente"  
-                message = "❌ Erreur de poids, la commande repasse en attente."
-
-            commande.save()
-
-            return JsonResponse({"message": message, "status": commande.status})
+            # 🔹 Lecture de la commande et UPDATE conditionnel, stock et diffusions en arrière-plan
+            code, reponse = verification.verifier(int(code_commande), float(poids_mesure))
+            return JsonResponse(reponse, status=code)
 
         except json.JSONDecodeError:
             return JsonResponse({"error": "Format JSON invalide"}, status=400)
+        except (TypeError, ValueError):
+            return JsonResponse({"error": "Données invalides"}, status=400)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
     return JsonResponse({"error": "Méthode non autorisée"}, status=405)
 
+def metriques(request):
+    """ Métriques au format texte Prometheus (GET /api/metriques/), 404 si METRIQUES_ACTIVES = False """
+    if not metriques_actives():
+        raise Http404
+    statistiques = cache.statistiques()
+    supplementaires = [
+        ("fablab_stock_signalements_total", "counter", diffuseur_stock.compteurs["signalements"]),
+        ("fablab_stock_diffusions_total", "counter", diffuseur_stock.compteurs["diffusions"]),
+        ("fablab_stock_fusionnes_max", "gauge", diffuseur_stock.compteurs["fusionnes_max"]),
+        ("fablab_cache_reponses_hits_total", "counter", statistiques["hits"]),
+        ("fablab_cache_reponses_misses_total", "counter", statistiques["misses"]),
+    ]
+    return HttpResponse(registre_metriques.texte(supplementaires), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_view(['GET'])
+def statistiques_cache(request):
+    """ Compteurs du cache des réponses (hits, misses, évictions) pour le dimensionner """
+    return Response(cache.statistiques())
+
 from rest_framework import viewsets
 from .models import Addstock
 from .serializers import AddstockSerializer
 from rest_framework.decorators import action
-from channels.layers import get_channel_layer
 
 class AddstockViewSet(viewsets.ModelViewSet):
     """ API pour gérer l'ajout de stock """
     queryset = Addstock.objects.all()
     serializer_class = AddstockSerializer
+    pagination_class = CurseurPagination
+    ordre_curseur = "-id"
 
     @action(detail=False, methods=['post'])
     def ajouter_stock(self, request):
@@ -151,42 +299,18 @@ class AddstockViewSet(viewsets.ModelViewSet):
             return Response({"error": "Données manquantes"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            produit, created = Produit.objects.get_or_create(
-                nom=nom_produit,
-                taille=taille_produit,
-                couleur=couleur_produit,
-                defaults={"poids": poids_produit, "quantite_stock": quantite_a_ajouter}
-            )
-
-            if not created:
-                produit.quantite_stock += int(quantite_a_ajouter)
-                produit.save()
-
-            # Envoyer une mise à jour WebSocket
-            self.update_stock_via_websocket()
+            with transaction.atomic():
+                produit, created = Produit.objects.get_or_create(
+                    nom=nom_produit,
+                    taille=taille_produit,
+                    couleur=couleur_produit,
+                    defaults={"poids": poids_produit}
+                )
+                # 🔹 Mouvement inséré dans le journal : pas de lecture-modification-écriture du produit
+                stock.ajouter(produit.pk, int(quantite_a_ajouter))
 
             message = f"✅ {quantite_a_ajouter} unités de {nom_produit} ajoutées au stock."
             return Response({"message": message}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-    def update_stock_via_websocket(self):
-        """ Envoie une mise à jour du stock via WebSockets """
-        channel_layer = get_channel_layer()
-
-        if channel_layer is None:
-            print("❌ ERREUR : `get_channel_layer()` est None. Vérifie que Django Channels est bien configuré.")
-            return
-
-        produits = Produit.objects.all()
-        stock_data = [{"nom": p.nom, "quantite": p.quantite_stock} for p in produits]
-
-        try:
-            async_to_sync(channel_layer.group_send)(
-                "stock_updates",
-                {"type": "send_stock_update", "data": stock_data}
-            )
-            print("📡 WebSocket : mise à jour envoyée avec succès !")
-        except Exception as e:
-            print(f"❌ ERREUR WebSocket : {e}")
@@ -49,6 +49,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'commandes.metriques.MetriquesMiddleware',  # 🔹 Latence et requêtes SQL par route (METRIQUES_ACTIVES)
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # 🔹 Ajout de whitenoise ici
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
+    'commandes.middleware.RegroupementStockMiddleware',  # 🔹 Une seule diffusion du stock par requête
 ]
  # 🔹 Ajout de corsheaders ici
 CORS_ALLOWED_ORIGINS = [
@@ -94,12 +96,65 @@ ASGI_APPLICATION = 'fablab_api.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Profil choisi par la variable d'environnement BASE_DONNEES :
+# BASE_DONNEES=sqlite-wal : SQLite en WAL, pragmas réglés, connexions persistantes (Raspberry Pi, défaut)
+# BASE_DONNEES=sqlite     : SQLite par défaut de Django (journal rollback, une connexion par requête)
+# BASE_DONNEES=postgres   : serveur PostgreSQL pour les sites plus gros (pip install "psycopg[binary,pool]", POSTGRES_*)
+# Comparaison sous charge mixte : python manage.py bench_base
+BASE_DONNEES = os.environ.get("BASE_DONNEES", "sqlite-wal")
+SQLITE_CHEMIN = os.environ.get("SQLITE_CHEMIN", BASE_DIR / 'db.sqlite3')
+
+# Pragmas exécutés à chaque ouverture de connexion SQLite (profil sqlite-wal)
+# - WAL : lectures et écriture ne se bloquent plus mutuellement
+# - synchronous=NORMAL : fsync aux checkpoints seulement, plus à chaque commit (aucune corruption possible,
+#   seuls les derniers commits peuvent être perdus en cas de coupure de courant)
+# - cache de 16 Mo, tables temporaires en mémoire, 64 Mo de fichier projeté en mémoire
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA cache_size=-16000;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=67108864;"
+)
+
+if BASE_DONNEES == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("POSTGRES_DB", "fablab"),
+            'USER': os.environ.get("POSTGRES_USER", "fablab"),
+            'PASSWORD': os.environ.get("POSTGRES_PASSWORD", ""),
+            'HOST': os.environ.get("POSTGRES_HOST", "127.0.0.1"),
+            'PORT': os.environ.get("POSTGRES_PORT", "5432"),
+            # Sous ASGI, pool du pilote plutôt que CONN_MAX_AGE (une connexion par thread de requête)
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {"pool": os.environ.get("POSTGRES_POOL", "1") == "1"},
+        }
+    }
+elif BASE_DONNEES == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_CHEMIN,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            # Réserve de connexions : sous ASGI, CONN_MAX_AGE ne réutilise pas les connexions
+            'ENGINE': 'commandes.base_sqlite',
+            'NAME': SQLITE_CHEMIN,
+            'OPTIONS': {
+                "init_command": SQLITE_PRAGMAS,
+                # BEGIN IMMEDIATE : le verrou d'écriture est pris au début de la transaction,
+                # l'attente se fait sur le busy timeout au lieu d'échouer en « database is locked »
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+                "reserve": int(os.environ.get("SQLITE_RESERVE", "8")),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -148,44 +203,147 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Channels Configuration
-CHANNEL_LAYERS = {
+# CHANNEL_LAYER=memory : en mémoire, un seul processus (développement)
+# CHANNEL_LAYER=redis  : production multi-processus (pip install channels-redis, REDIS_URL)
+# CHANNEL_LAYER=socket : courtier local sur socket Unix (python manage.py courtier_channels)
+CHANNEL_LAYER = os.environ.get("CHANNEL_LAYER", "memory")
+CHANNEL_SOCKET = os.environ.get("CHANNEL_SOCKET", os.path.join(BASE_DIR, "channels.sock"))
+
+# Tâches durables confiées à des processus dédiés (python manage.py taches, voir plus bas)
+TACHES_PROCESSUS_SEPARE = os.environ.get("TACHES_PROCESSUS_SEPARE", "0") == "1"
+
+# Plusieurs processus servent l'API (channel layer partagé) ou exécutent ses tâches :
+# l'état gardé en cache doit l'être aussi (vérifié au démarrage, voir VERSIONS_CACHE)
+PROCESSUS_MULTIPLES = CHANNEL_LAYER != "memory" or TACHES_PROCESSUS_SEPARE
+
+if CHANNEL_LAYER == "redis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")]},
+        },
+    }
+elif CHANNEL_LAYER == "socket":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "commandes.layers.SocketChannelLayer",
+            "CONFIG": {"chemin": CHANNEL_SOCKET},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",  # Utilisation en mémoire pour le développement
+        },
+    }
+
+# Fenêtre (en secondes) pendant laquelle les changements de stock sont fusionnés
+# en une seule diffusion WebSocket (0 = diffusion immédiate)
+STOCK_DIFFUSION_FENETRE = float(os.environ.get("STOCK_DIFFUSION_FENETRE", "0.1"))
+
+# Journal du stock (MouvementStock) : compaction dans Produit.quantite_stock
+# en arrière-plan tous les STOCK_COMPACTAGE_SEUIL mouvements (0 = seulement via
+# python manage.py compacter_stock), sans toucher aux mouvements de moins de
+# STOCK_COMPACTAGE_DELAI secondes
+STOCK_COMPACTAGE_SEUIL = 1000
+STOCK_COMPACTAGE_DELAI = 1.0
+
+# Conservation des mesures de température (en jours, None = illimitée)
+# "brut" = mesures individuelles, puis agrégats par minute / heure / jour
+# Purge : python manage.py purger_temperatures (à lancer régulièrement, ex. cron)
+TEMPERATURE_RETENTION_JOURS = {
+    "brut": 30,
+    "1m": 90,
+    "1h": 730,
+    "1j": None,
+}
+
+# Ingestion par lot (/api/temperature/batch/) : taille maximale d'une requête
+# et nombre de mesures insérées par transaction
+TEMPERATURE_LOT_MAX = 10000
+TEMPERATURE_PAQUET = 500
+
+# Création de commandes par lot (/api/commandes/batch/) : taille maximale d'une requête
+COMMANDE_LOT_MAX = 500
+
+# Exports en flux (/api/export/<commandes|mouvements|temperature>/) : lignes lues
+# dans la base et envoyées au client par paquets de EXPORT_PAQUET
+EXPORT_PAQUET = 2000
+
+# POST /api/commandes/ refuse une commande si le sandwich n'a pas assez de portions
+# en stock (soldes de la recette relus en base, voir disponibilite.portions)
+COMMANDE_REFUS_RUPTURE = True
+
+# Caches : "default" (nomenclatures, compteurs de version) et "reponses" (JSON rendu
+# de /api/stock/ et /api/sandwiches/). REPONSES_CACHE_BACKEND=lru (défaut, en mémoire
+# du processus) ou fichier (partagé entre processus). Avec CHANNEL_LAYER=redis, "partage"
+# est un cache Redis commun à tous les processus.
+CACHES = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",  # Utilisation en mémoire pour le développement
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "reponses": {
+        "BACKEND": "commandes.cache.LRUCache",
+        "TIMEOUT": None,  # Clés versionnées : jamais périmées, seulement évincées
+        "OPTIONS": {"MAX_ENTRIES": 500},
+    } if os.environ.get("REPONSES_CACHE_BACKEND", "lru") == "lru" else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "reponses"),
+        "OPTIONS": {"MAX_ENTRIES": 2000},
     },
 }
+if CHANNEL_LAYER == "redis":
+    CACHES["partage"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0"),
+        "TIMEOUT": None,
+    }
+REPONSES_CACHE = "reponses"
+
+# Compteurs de version des ressources (ETag / Last-Modified) : alias de CACHES dont
+# l'incrément est atomique (locmem pour un seul processus, Redis / memcached pour
+# plusieurs), ou None pour les compter en base (table VersionRessource : une requête
+# par GET conditionnel, exact quel que soit le nombre de processus).
+VERSIONS_CACHE = "partage" if CHANNEL_LAYER == "redis" else None if PROCESSUS_MULTIPLES else "default"
+
+# Métriques (GET /api/metriques/) : METRIQUES=0 pour les couper entièrement
+METRIQUES_ACTIVES = os.environ.get("METRIQUES", "1") != "0"
+
+# Effets de bord différés (stock, diffusions) : True pour les exécuter dans la requête
+TACHES_SYNCHRONES = False
+# Exécuteur de tâches (commandes/taches.py) : fils en mémoire, tentatives avec attente
+# TACHES_DELAI secondes doublée à chaque échec. Les tâches durables (consommation du
+# stock) sont des lignes Tache écrites avec la modification ; TACHES_PROCESSUS_SEPARE
+# = True les laisse à des processus dédiés : python manage.py taches
+TACHES_FILS = int(os.environ.get("TACHES_FILS", "2"))
+TACHES_TENTATIVES = 3
+TACHES_DELAI = 0.2
+TACHES_DURABLES = True
+TACHES_INTERVALLE = 1.0  # Relecture des tâches durables dues (nouvelles tentatives)
+TACHES_BAIL = 60  # Réservation d'une tâche durable, en secondes
+TACHES_FENETRE = 0.05  # Attente après un réveil : les tâches arrivées entre-temps partent en un lot
 
 # Logging : Ajout des logs pour debug API
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "formatters": {
-        "verbose": {
-            "format": "{asctime} [{levelname}] {module}: {message}",
-            "style": "{",
-        },
-        "simple": {
-            "format": "[{levelname}] {message}",
-            "style": "{",
-        },
-    },
     "handlers": {
-        "file": {
-            "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "server.log"),  # Fichier de log
-            "formatter": "verbose",
-        },
-        "console": {
-            "level": "DEBUG",
-            "class": "logging.StreamHandler",
-            "formatter": "simple",
+        # 🔹 Non bloquant : les écritures (console, server.log en JSON) se font dans un thread dédié
+        "non_bloquant": {
+            "()": "commandes.journal.JournalNonBloquant",
+            "fichier": os.path.join(BASE_DIR, "server.log"),
+            "console": True,
         },
     },
+    "root": {
+        "handlers": ["non_bloquant"],
+        "level": "WARNING",
+    },
     "loggers": {
-        "django": {
-            "handlers": ["file", "console"],
-            "level": "DEBUG",
-            "propagate": True,
-        },
+        "django": {"level": "INFO"},
+        "django.request": {"level": "WARNING"},  # 4xx en WARNING, 5xx en ERROR
+        # Requêtes SQL (uniquement avec DEBUG = True) : LOG_SQL=1 pour les afficher
+        "django.db.backends": {"level": "DEBUG" if os.environ.get("LOG_SQL") else "WARNING"},
+        "commandes": {"level": os.environ.get("LOG_NIVEAU", "INFO")},
     },
 }
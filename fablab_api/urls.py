@@ -8,6 +8,9 @@ from commandes.views import (
     stock_actuel,
     TemperatureViewSet,
     verifier_poids_commande,
+    statistiques_cache,
+    metriques,
+    exporter,
     AddstockViewSet  
 )
 
@@ -28,6 +31,9 @@ urlpatterns = [
     path('api/stock/', stock_actuel, name='stock'),
     path('api/last_temps/', TemperatureViewSet.as_view({'get': 'last_50'}), name='last-temps'),
     path('api/verification-poids/', verifier_poids_commande, name="verification-poids"),
+    path('api/cache/', statistiques_cache, name='statistiques-cache'),
+    path('api/metriques/', metriques, name='metriques'),
+    path('api/export/<str:ressource>/', exporter, name='export'),
     path('api/addstock/ajouter/', AddstockViewSet.as_view({'post': 'ajouter_stock'}), name='ajouter-stock'),  # ✅ Route POST
 ]
 